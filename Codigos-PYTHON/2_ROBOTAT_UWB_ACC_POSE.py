@@ -9,12 +9,12 @@
 # 
 # -------------------------------------------------------------------------------------------------
 
-import numpy as np
 import pandas as pd
-from scipy.signal import butter, filtfilt
 import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 from mpl_toolkits.mplot3d import Axes3D
+from orientacion import calcular_orientacion
+from cuaterniones import eul2rot, rotz
+from animacion import AnimacionPose
 
 # Leer el archivo CSV
 try:
@@ -38,195 +38,20 @@ try:
 
     # Inicializar parámetros
     dt = 0.1  # Muestreo (100 ms)
-    Fs = 1 / dt  # Frecuencia de muestreo
-
-    # Diseñar los filtros Butterworth
-    fc = 0.1  # Frecuencia de corte (Hz)
-    b, a = butter(2, fc / (Fs / 2), 'low')  # Filtro pasa bajas
-    d, c = butter(2, fc / (Fs / 2), 'high')  # Filtro pasa altas
-
-    # Inicializar ángulos de giroscopio previos para integrar
-    int_gyr_ang_x = 0
-    int_gyr_ang_y = 0
-    int_gyr_ang_z = 0
-
-    # Guardar ángulos para visualizar luego
-    filt_ang = np.zeros((len(ax), 3))
-    accel_ang = np.zeros((len(ax), 3))
-    gyro_ang = np.zeros((len(ax), 3))
-    mag_ang = np.zeros((len(ax), 3))
-
-    # Inicializar listas para las líneas de seguimiento
-    x_trail = []
-    y_trail = []
-    xr_trail = []
-    yr_trail = []
-
-    # Flag para inicialización del yaw UWB
-    yaw_initialized = False
-
-    # Loop para aplicar filtro y transformar coordenadas UWB
-    for i in range(len(ax)):
-        # Tomar valores actuales acc, gyro y mag
-        accel_x = ax[i]
-        accel_y = ay[i]
-        accel_z = az[i]
-        
-        gyro_x = gx[i]
-        gyro_y = gy[i]
-        gyro_z = gz[i]
-        
-        mag_x = mx[i]
-        mag_y = my[i]
-        mag_z = mz[i]
-
-        # Transformar coordenadas UWB a Robotat
-        x[i] = -(x[i] / 1000 - 2.0)
-        y[i] = -(y[i] / 1000 - 2.5)
-        
-        # Calcular tilt del acelerómetro
-        accel_angle_x = np.rad2deg(np.arctan2(accel_y, np.sqrt(accel_x**2 + accel_z**2)))
-        accel_angle_y = np.rad2deg(np.arctan2(-accel_x, np.sqrt(accel_y**2 + accel_z**2)))
-        accel_angle_z = 0  # Ignorar z ya que queremos el tilt para correcciones
-        
-        # Guardar ángulos del acelerómetro
-        accel_ang[i, :] = [accel_angle_x, accel_angle_y, accel_angle_z]
-        
-        # Integración de giroscopio
-        int_gyr_ang_x += gyro_x * dt
-        int_gyr_ang_y += gyro_y * dt
-        int_gyr_ang_z += gyro_z * dt
-        
-        # Guardar ángulos del giroscopio
-        gyro_ang[i, :] = [int_gyr_ang_x, int_gyr_ang_y, int_gyr_ang_z]
-        
-        # Calcular ángulo de yaw del magnetómetro
-        mag_angle_z = np.rad2deg(np.arctan2(mag_y, mag_x))
-        
-        # Guardar ángulos del magnetómetro
-        mag_ang[i, :] = [0, 0, mag_angle_z]
-
-        # Inicializar yaw del UWB con el yaw del Robotat en la primera iteración
-        if not yaw_initialized:
-            int_gyr_ang_z = yr_robotat[i]  # Igualar el yaw del UWB al yaw del Robotat
-            yaw_initialized = True
-
-    # Aplicar el filtro pasa bajas a los ángulos del acelerómetro
-    accel_angle_x_lpf = filtfilt(b, a, accel_ang[:, 0])
-    accel_angle_y_lpf = filtfilt(b, a, accel_ang[:, 1])
-
-    # Aplicar el filtro pasa altas a los ángulos del giroscopio integrado
-    gyro_angle_x_hpf = filtfilt(d, c, gyro_ang[:, 0])
-    gyro_angle_y_hpf = filtfilt(d, c, gyro_ang[:, 1])
-
-    # Aplicar el filtro pasa bajas a los ángulos del magnetómetro
-    mag_angle_z_lpf = filtfilt(b, a, mag_ang[:, 2])
-
-    # Filtro complementario extendido
-    filt_ang_x = gyro_angle_x_hpf + accel_angle_x_lpf
-    filt_ang_y = gyro_angle_y_hpf + accel_angle_y_lpf
-    filt_ang_z = gyro_ang[:, 2] * 0.98 + mag_angle_z_lpf * 0.02  # Filtro complementario para yaw
-
-    # Guardar ángulos filtrados
-    filt_ang[:, 0] = filt_ang_x
-    filt_ang[:, 1] = filt_ang_y
-    filt_ang[:, 2] = filt_ang_z
-
-    # Variable de estado para animación
-    is_paused = False
-
-    # Función para actualizar la animación
-    def update(i):
-        if not is_paused:
-            # Limpiar los ejes
-            ax3d_UWB.cla()
-            ax3d_Robotat.cla()
-            ax_xy.cla()
-
-            # Configurar la vista
-            ax3d_UWB.view_init(elev=20., azim=30)
-            ax3d_UWB.set_xlim([-1, 1])
-            ax3d_UWB.set_ylim([-1, 1])
-            ax3d_UWB.set_zlim([-1, 1])
-
-            ax3d_Robotat.view_init(elev=20., azim=30)
-            ax3d_Robotat.set_xlim([-1, 1])
-            ax3d_Robotat.set_ylim([-1, 1])
-            ax3d_Robotat.set_zlim([-1, 1])
-
-            # Dibujar el marco de rotación UWB
-            ax3d_UWB.quiver(0, 0, 0, 1, 0, 0, color='r', label='X (UWB)')
-            ax3d_UWB.quiver(0, 0, 0, 0, 1, 0, color='g', label='Y (UWB)')
-            ax3d_UWB.quiver(0, 0, 0, 0, 0, 1, color='b', label='Z (UWB)')
-
-            # Dibujar el marco de rotación Robotat
-            ax3d_Robotat.quiver(0, 0, 0, 1, 0, 0, color='orange', label='Xr (Robotat)')
-            ax3d_Robotat.quiver(0, 0, 0, 0, 1, 0, color='purple', label='Yr (Robotat)')
-            ax3d_Robotat.quiver(0, 0, 0, 0, 0, 1, color='cyan', label='Zr (Robotat)')
-
-            # Obtener ángulos de rotación UWB
-            angle_x_UWB = np.deg2rad(filt_ang[i, 0])
-            angle_y_UWB = np.deg2rad(filt_ang[i, 1])
-            angle_z_UWB = np.deg2rad(filt_ang[i, 2])
-
-            # Matriz de rotación UWB
-            R_UWB = np.array([[np.cos(angle_y_UWB) * np.cos(angle_z_UWB), -np.cos(angle_y_UWB) * np.sin(angle_z_UWB), np.sin(angle_y_UWB)],
-                              [np.cos(angle_x_UWB) * np.sin(angle_z_UWB) + np.sin(angle_x_UWB) * np.sin(angle_y_UWB) * np.cos(angle_z_UWB),
-                               np.cos(angle_x_UWB) * np.cos(angle_z_UWB) - np.sin(angle_x_UWB) * np.sin(angle_y_UWB) * np.sin(angle_z_UWB),
-                               -np.sin(angle_x_UWB) * np.cos(angle_y_UWB)],
-                              [np.sin(angle_x_UWB) * np.sin(angle_z_UWB) - np.cos(angle_x_UWB) * np.sin(angle_y_UWB) * np.cos(angle_z_UWB),
-                               np.sin(angle_x_UWB) * np.cos(angle_z_UWB) + np.cos(angle_x_UWB) * np.sin(angle_y_UWB) * np.sin(angle_z_UWB),
-                               np.cos(angle_x_UWB) * np.cos(angle_y_UWB)]])
-
-            # Dibujar el marco de rotación transformado UWB
-            ax3d_UWB.quiver(0, 0, 0, R_UWB[0, 0], R_UWB[1, 0], R_UWB[2, 0], color='r', linestyle='--')  # Eje X rotado UWB
-            ax3d_UWB.quiver(0, 0, 0, R_UWB[0, 1], R_UWB[1, 1], R_UWB[2, 1], color='g', linestyle='--')  # Eje Y rotado UWB
-            ax3d_UWB.quiver(0, 0, 0, R_UWB[0, 2], R_UWB[1, 2], R_UWB[2, 2], color='b', linestyle='--')  # Eje Z rotado UWB
-
-            # Obtener el ángulo de yaw (yr) del Robotat
-            angle_z_Robotat = np.deg2rad(yr_robotat[i])
-
-            # Matriz de rotación Robotat (solo yaw)
-            R_Robotat = np.array([[np.cos(angle_z_Robotat), -np.sin(angle_z_Robotat), 0],
-                                  [np.sin(angle_z_Robotat),  np.cos(angle_z_Robotat), 0],
-                                  [0, 0, 1]])
-
-            # Dibujar el marco de rotación transformado Robotat
-            ax3d_Robotat.quiver(0, 0, 0, R_Robotat[0, 0], R_Robotat[1, 0], R_Robotat[2, 0], color='orange', linestyle='--')  # Eje X rotado Robotat
-            ax3d_Robotat.quiver(0, 0, 0, R_Robotat[0, 1], R_Robotat[1, 1], R_Robotat[2, 1], color='purple', linestyle='--')  # Eje Y rotado Robotat
-            ax3d_Robotat.quiver(0, 0, 0, R_Robotat[0, 2], R_Robotat[1, 2], R_Robotat[2, 2], color='cyan', linestyle='--')  # Eje Z rotado Robotat
-
-            ax3d_UWB.legend()
-            ax3d_Robotat.legend()
-
-            # Agregar el punto actual a la línea de seguimiento
-            x_trail.append(x[i])
-            y_trail.append(y[i])
-            xr_trail.append(xr[i])
-            yr_trail.append(yr[i])
-
-            # Dibujar x, y del UWB y Robotat superpuestos con líneas de seguimiento
-            ax_xy.plot(x_trail, y_trail, c='r', label='UWB', linestyle='-', marker='o')
-            ax_xy.plot(xr_trail, yr_trail, c='b', label='Robotat', linestyle='-', marker='x')
-
-            # Definir límites específicos para el plot `xy`
-            ax_xy.set_xlim([-2.0, 2.0])
-            ax_xy.set_ylim([-2.5, 2.5])
-
-            ax_xy.set_xlabel('x (metros)')
-            ax_xy.set_ylabel('y (metros)')
-            ax_xy.legend()
-
-            # Mostrar número de muestras y tiempo en segundos
-            time_elapsed = i * dt
-            ax3d_UWB.text2D(0.05, 0.95, f'Muestra: {i+1}, Tiempo: {time_elapsed:.2f} s', transform=ax3d_UWB.transAxes)
-            ax3d_Robotat.text2D(0.05, 0.95, f'Muestra: {i+1}, Tiempo: {time_elapsed:.2f} s', transform=ax3d_Robotat.transAxes)
-
-    # Función para pausar/continuar la animación
-    def on_key(event):
-        global is_paused
-        if event.key == ' ':
-            is_paused = not is_paused
+    fc = 0.1  # Frecuencia de corte (Hz) de los filtros Butterworth
+
+    # Transformar coordenadas UWB a Robotat
+    x = -(x / 1000 - 2.0)
+    y = -(y / 1000 - 2.5)
+
+    # Filtro complementario extendido, el yaw UWB se inicializa con el yaw del Robotat
+    filt_ang, accel_ang, gyro_ang, mag_ang = calcular_orientacion(ax, ay, az, gx, gy, gz, mx, my,
+                                                                  dt=dt, fc=fc, peso_yaw=0.98,
+                                                                  yaw_inicial=yr_robotat[0])
+
+    # Matrices de rotación de todas las muestras (UWB y yaw del Robotat) en una sola llamada
+    R_UWB_frames = eul2rot(filt_ang)
+    R_Robotat_frames = rotz(yr_robotat)
 
     # Crear la figura y los ejes 3D para UWB y Robotat
     fig = plt.figure()
@@ -234,11 +59,34 @@ try:
     ax3d_Robotat = fig.add_subplot(222, projection='3d')
     ax_xy = fig.add_subplot(212)
 
-    # Vincular la función de manejo de teclas
-    fig.canvas.mpl_connect('key_press_event', on_key)
+    # Los artistas se crean una sola vez y la animación solo actualiza sus datos (blit)
+    animacion = AnimacionPose(fig, dt=dt)
+
+    # Marcos de rotación UWB y Robotat (solo yaw), matrices precalculadas
+    animacion.configurar_3d(ax3d_UWB, limite=1)
+    animacion.agregar_marco(ax3d_UWB, R_UWB_frames, etiquetas=('X (UWB)', 'Y (UWB)', 'Z (UWB)'))
+    animacion.configurar_3d(ax3d_Robotat, limite=1)
+    animacion.agregar_marco(ax3d_Robotat, R_Robotat_frames, colores=('orange', 'purple', 'cyan'),
+                            etiquetas=('Xr (Robotat)', 'Yr (Robotat)', 'Zr (Robotat)'))
+
+    # Mostrar número de muestras y tiempo en segundos
+    animacion.agregar_texto(ax3d_UWB)
+    animacion.agregar_texto(ax3d_Robotat)
+
+    # x, y del UWB y Robotat superpuestos con líneas de seguimiento de largo fijo
+    animacion.agregar_trayectoria(ax_xy, x, y, color='r', etiqueta='UWB', marcador='o')
+    animacion.agregar_trayectoria(ax_xy, xr, yr, color='b', etiqueta='Robotat', marcador='x')
+
+    # Definir límites específicos para el plot `xy`
+    ax_xy.set_xlim([-2.0, 2.0])
+    ax_xy.set_ylim([-2.5, 2.5])
+
+    ax_xy.set_xlabel('x (metros)')
+    ax_xy.set_ylabel('y (metros)')
+    ax_xy.legend()
 
-    # Crear la animación
-    ani = FuncAnimation(fig, update, frames=len(ax), interval=dt * 1000)
+    # Crear la animación (espacio para pausar/continuar)
+    ani = animacion.animar(frames=len(ax))
 
     # Mostrar la animación
     plt.show()
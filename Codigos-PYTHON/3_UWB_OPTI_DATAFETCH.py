@@ -15,11 +15,25 @@
 
 import socket
 import time
-import csv
-import json
-import numpy as np
 import keyboard  # Necesario para detectar teclas (requiere instalar el módulo keyboard)
-import os  # Para manejar los directorios y rutas de archivos
+from flujo_esp32 import DecodificadorLineas
+from cliente_robotat import ClienteRobotat
+from adquisicion_async import capture_async, CABECERAS_ASYNC
+from latencia import crear_latencia
+from grabador import GrabadorDatos, ConsolaLimitada
+
+# Decodificador del flujo del ESP32 (conserva los bytes sobrantes entre recv)
+decodificador_esp32 = DecodificadorLineas(campos=12)
+
+# Latencia por etapa, solo se activa con la variable de entorno UWB_LATENCIA
+latencia = crear_latencia()
+
+# Escritura en segundo plano: rotación del archivo (MB, None para un solo archivo), copia binaria
+# junto al CSV y refrescos por segundo de la consola
+ROTACION_MB = None
+BINARIO = False
+REFRESCO_CONSOLA_HZ = 2
+consola = ConsolaLimitada(REFRESCO_CONSOLA_HZ)
 
 # Conexión y funciones de obtención de datos del ESP32
 def esp32_connect(ip, port):
@@ -32,116 +46,57 @@ def esp32_connect(ip, port):
         print(f'ERROR: No se pudo conectar al servidor ESP32-UWB: {e}')
         return None
 
-def esp32_get_pose(tcp_obj):
+def esp32_get_pose(tcp_obj, decodificador=None):
     if tcp_obj is None:
         raise ValueError('El objeto TCP está vacío. Conectarse al ESP32 primero.')
 
-    data_esp32 = []
-    data = tcp_obj.recv(1024)
-    if data:
-        data_str = data.decode('utf-8').strip()
-        lines = data_str.split('\n')
-        for line in lines:
-            try:
-                values = [float(val) for val in line.split(',')]
-                if len(values) == 12: #recibimos 12 valores, esto porque se agrego el factor de calidad de medicion del UWB
-                    data_esp32.append(values)
-                    break
-            except ValueError:
-                continue
-    return data_esp32
+    # El decodificador guarda las líneas partidas entre llamadas, recibimos 12 valores por
+    # muestra porque se agrego el factor de calidad de medicion del UWB
+    decodificador = decodificador or decodificador_esp32
+    return decodificador.leer(tcp_obj).tolist()
 
 def esp32_disconnect(tcp_obj):
     if tcp_obj is not None:
         tcp_obj.close()
         print('Desconectado del servidor ESP32-UWB.')
 
-# Conexión y funciones de obtención de datos del Robotat
+# Conexión y funciones de obtención de datos del Robotat (conexión persistente de ClienteRobotat)
 def robotat_connect(ip='192.168.50.200', port=1883):
     try:
-        tcp_obj = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        tcp_obj.connect((ip, port))
+        cliente = ClienteRobotat(ip, port)
         print('Conectado al servidor Robotat.')
-        return tcp_obj
+        return cliente
     except Exception as e:
         print(f'ERROR: No se pudo conectar al servidor Robotat: {e}')
         return None
 
-def robotat_disconnect(tcp_obj):
-    if tcp_obj is not None:
-        try:
-            tcp_obj.sendall(b'EXIT')
-            print('Desconectado del servidor Robotat.')
-        finally:
-            tcp_obj.close()
+def robotat_disconnect(cliente):
+    if cliente is not None:
+        cliente.cerrar()
+        print('Desconectado del servidor Robotat.')
     else:
         print('ERROR: No se pudo desconectar porque no hay conexión activa.')
 
-def q2eul(q, seq='xyz'):
-    """Convierte un cuaternión en ángulos de Euler según la secuencia proporcionada."""
-    q0, q1, q2, q3 = q
-    if seq == 'xyz':
-        sinr_cosp = 2 * (q0 * q1 + q2 * q3)
-        cosr_cosp = 1 - 2 * (q1 * q1 + q2 * q2)
-        roll = np.degrees(np.arctan2(sinr_cosp, cosr_cosp))
-
-        sinp = 2 * (q0 * q2 - q3 * q1)
-        if abs(sinp) >= 1:
-            pitch = np.degrees(np.sign(sinp) * np.pi / 2)  # Gimbal lock
-        else:
-            pitch = np.degrees(np.arcsin(sinp))
-
-        siny_cosp = 2 * (q0 * q3 + q1 * q2)
-        cosy_cosp = 1 - 2 * (q2 * q2 + q3 * q3)
-        yaw = np.degrees(np.arctan2(siny_cosp, cosy_cosp))
-
-        return roll, pitch, yaw
-    else:
-        raise ValueError('Invalid Euler angle sequence.')
-
-def robotat_get_pose(tcp_obj, agents_ids, rotrep='xyz'):
-    if tcp_obj is None:
-        raise ValueError('El objeto TCP está vacío. Conectarse al Robotat primero.')
-
-    s = {
-        "dst": 1,  # DST_ROBOTAT
-        "cmd": 1,  # CMD_GET_POSE
-        "pld": agents_ids
-    }
+def robotat_get_pose(cliente, agents_ids, rotrep='xyz'):
+    if cliente is None:
+        raise ValueError('El cliente está vacío. Conectarse al Robotat primero.')
 
     try:
-        tcp_obj.sendall(json.dumps(s).encode('utf-8'))
-        data = tcp_obj.recv(1024)
-        if not data:
-            print("ERROR: No se recibieron datos del servidor Robotat.")
-            return None
-
-        # Verificar si el mensaje es un JSON válido
-        try:
-            mocap_data = json.loads(data.decode('utf-8'))
-            if not mocap_data:
-                print("ERROR: Los datos del JSON están vacíos.")
-                return None
-
-            mocap_data = [mocap_data[i:i + 7] for i in range(0, len(mocap_data), 7)]
-
-            for pose in mocap_data:
-                position = pose[:3]
-                quaternion = pose[3:7]  # Capturar los 4 elementos del cuaternión
-                euler_angles = q2eul(quaternion, seq=rotrep)
-                position_mm = [p * 1000 for p in position]  # Convertir XYZ a mm
-                return list(position_mm) + list(euler_angles)
-
-        except json.JSONDecodeError:
-            # Si no es un JSON válido, solo lo ignoramos
-            print(f'Datos no válidos recibidos del servidor Robotat: {data.decode("utf-8")}')
-            return None
-
-    except socket.error as e:
+        # Las respuestas se juntan en el buffer del cliente hasta tener un JSON completo, una
+        # respuesta de varios marcadores puede llegar en varios recv
+        poses = cliente.get_pose_euler(agents_ids, rotrep)
+    except ValueError as e:
+        # Respuesta sin 7 valores por marcador, solo la ignoramos
+        print(f'Datos no válidos recibidos del servidor Robotat: {e}')
+        return None
+    except (socket.error, ConnectionError) as e:
         print(f'Error de socket: {e}')
         return None
 
-    return None
+    # Un solo agente devuelve una lista como antes, varios devuelven una lista por agente
+    if len(agents_ids) == 1:
+        return poses[0].tolist()
+    return poses.tolist()
 
 # Imprimir datos en tiempo real con formato fijo
 def print_formatted_data(sample_num, timestamp, esp32_data, robotat_data):
@@ -157,7 +112,7 @@ def print_formatted_data(sample_num, timestamp, esp32_data, robotat_data):
     print(robotat_format.format(*robotat_data))
     print("-" * 144)  # Línea separadora
 
-# Guardar datos en un archivo CSV
+# Guardar datos en un archivo CSV (el grabador solo encola la fila, el hilo escritor la guarda)
 def save_data_to_csv(csv_writer, sample_num, timestamp, esp32_data, robotat_data):
     # Combinar los datos del ESP32 y Robotat
     combined_data = [sample_num, timestamp] + esp32_data[0] + robotat_data
@@ -169,60 +124,71 @@ def capture_real_time(ESP32, Robotat, csv_writer):
     start_time = time.perf_counter()
 
     while not keyboard.is_pressed('q'):  # Presiona "q" para detener
-        sample_num += 1
         # Tiempo desde el inicio en milisegundos
         current_time = (time.perf_counter() - start_time) * 1000
 
-        # Obtener datos del ESP32
+        # Obtener datos del ESP32 (la latencia se mide desde la salida del recv)
         esp32_sample = esp32_get_pose(ESP32)
+        t_rx = decodificador_esp32.instante
+        latencia.recepcion(t_rx)
+        latencia.registrar('parseo', t_rx, len(esp32_sample))
         # Obtener datos del Robotat
         robotat_sample = robotat_get_pose(Robotat, [20], 'xyz')
+        latencia.registrar('robotat', t_rx, len(esp32_sample))
 
         if esp32_sample and robotat_sample:
-            print_formatted_data(sample_num, current_time, esp32_sample, robotat_sample)
-            save_data_to_csv(csv_writer, sample_num, current_time, esp32_sample, robotat_sample)
+            # Guardar todas las muestras del ESP32 que llegaron en este ciclo
+            for esp32_row in esp32_sample:
+                sample_num += 1
+                save_data_to_csv(csv_writer, sample_num, current_time, [esp32_row], robotat_sample)
+            latencia.registrar('escritura', t_rx, len(esp32_sample))
+            consola.mostrar(print_formatted_data, sample_num, current_time, esp32_sample[-1:], robotat_sample)
+            latencia.registrar('publicacion', t_rx, len(esp32_sample))
 
         time.sleep(0.1)  # Mantener frecuencia de 10 Hz
 
+    print(f"Muestras ESP32: {decodificador_esp32.resumen()}")
+
 # Función para capturar un número fijo de muestras
 def capture_fixed_samples(ESP32, Robotat, num_samples, csv_writer):
     start_time = time.perf_counter()
+    sample_num = 0
 
-    for sample_num in range(1, num_samples + 1):
+    while sample_num < num_samples:
         # Tiempo desde el inicio en milisegundos
         current_time = (time.perf_counter() - start_time) * 1000
 
-        # Obtener datos del ESP32
+        # Obtener datos del ESP32 (la latencia se mide desde la salida del recv)
         esp32_sample = esp32_get_pose(ESP32)
+        t_rx = decodificador_esp32.instante
+        latencia.recepcion(t_rx)
+        latencia.registrar('parseo', t_rx, len(esp32_sample))
         # Obtener datos del Robotat
         robotat_sample = robotat_get_pose(Robotat, [20], 'xyz')
+        latencia.registrar('robotat', t_rx, len(esp32_sample))
 
         if esp32_sample and robotat_sample:
-            print_formatted_data(sample_num, current_time, esp32_sample, robotat_sample)
-            save_data_to_csv(csv_writer, sample_num, current_time, esp32_sample, robotat_sample)
+            # Guardar todas las muestras del ESP32 que llegaron en este ciclo
+            guardadas = esp32_sample[:num_samples - sample_num]
+            for esp32_row in guardadas:
+                sample_num += 1
+                save_data_to_csv(csv_writer, sample_num, current_time, [esp32_row], robotat_sample)
+            latencia.registrar('escritura', t_rx, len(guardadas))
+            consola.mostrar(print_formatted_data, sample_num, current_time, esp32_sample[-1:], robotat_sample)
+            latencia.registrar('publicacion', t_rx, len(guardadas))
 
         time.sleep(0.1)  # Mantener frecuencia de 10 Hz
 
-# Función para crear y abrir el archivo CSV
-def create_csv_file(directory, filename):
-    # Crear el directorio si no existe
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-    
-    # Generar la ruta completa del archivo
-    file_path = os.path.join(directory, filename + '.csv')
-    
-    # Crear el archivo CSV
-    file = open(file_path, mode='w', newline='')
-    csv_writer = csv.writer(file)
-    
-    # Escribir las cabeceras
-    headers = ['Sample', 'Time (ms)', 'ESP32_X', 'ESP32_Y', 'UWB_QF','ESP32_Ax', 'ESP32_Ay', 'ESP32_Az',
+    print(f"Muestras ESP32: {decodificador_esp32.resumen()}")
+
+# Función para crear el grabador del archivo CSV (misma interfaz writerow que csv.writer)
+def create_csv_file(directory, filename, headers=None):
+    # Las cabeceras se escriben en cada archivo (también en los rotados)
+    headers = headers or ['Sample', 'Time (ms)', 'ESP32_X', 'ESP32_Y', 'UWB_QF','ESP32_Ax', 'ESP32_Ay', 'ESP32_Az',
                'ESP32_Gx', 'ESP32_Gy', 'ESP32_Gz', 'ESP32_Mx', 'ESP32_My', 'ESP32_Mz',
                'Robotat_X_mm', 'Robotat_Y_mm', 'Robotat_Z_mm', 'Robotat_Roll', 'Robotat_Pitch', 'Robotat_Yaw']
-    csv_writer.writerow(headers)
-    
-    return file, csv_writer
+    max_bytes = None if ROTACION_MB is None else int(ROTACION_MB * 1e6)
+    return GrabadorDatos(directory, filename, headers, binario=BINARIO, max_bytes=max_bytes)
 
 # Ejecución principal
 if __name__ == "__main__":
@@ -241,16 +207,17 @@ if __name__ == "__main__":
         directory = input("Ingrese el directorio donde se guardará el archivo CSV: ")
         filename = input("Ingrese el nombre del archivo (sin extensión): ")
 
-        # Crear el archivo CSV y el escritor
-        csv_file, csv_writer = create_csv_file(directory, filename)
+        # Mostrar menú
+        print("Opciones:")
+        print("1. Capturar datos en tiempo real (presione 'q' para salir)")
+        print("2. Capturar un número fijo de muestras")
+        print("3. Captura asíncrona a 10 Hz con tiempos de recepción (presione 'q' para salir)")
+        option = input("Seleccione una opción (1, 2 o 3): ")
 
-        try:
-            # Mostrar menú
-            print("Opciones:")
-            print("1. Capturar datos en tiempo real (presione 'q' para salir)")
-            print("2. Capturar un número fijo de muestras")
-            option = input("Seleccione una opción (1 o 2): ")
+        # Crear el grabador, la opción 3 agrega las columnas de tiempo de recepción de cada fuente
+        csv_writer = create_csv_file(directory, filename, CABECERAS_ASYNC if option == '3' else None)
 
+        try:
             if option == '1':
                 print("Captura de datos en tiempo real. Presione 'q' para detener.")
                 capture_real_time(ESP32, Robotat, csv_writer)
@@ -259,9 +226,22 @@ if __name__ == "__main__":
                 num_samples = int(input("Ingrese el número de muestras que desea capturar: "))
                 capture_fixed_samples(ESP32, Robotat, num_samples, csv_writer)
 
+            elif option == '3':
+                print("Captura asíncrona. Presione 'q' para detener.")
+                stats = capture_async(ESP32, Robotat.tcp_obj, csv_writer, detener=lambda: keyboard.is_pressed('q'),
+                                      latencia=latencia)
+                print(f"Captura terminada: {stats}")
+
         finally:
-            # Cerrar el archivo CSV al terminar
-            csv_file.close()
+            # Última muestra omitida por la consola, escribir lo pendiente y cerrar el archivo,
+            # volcar el último resumen de latencia
+            consola.vaciar()
+            try:
+                csv_writer.cerrar()
+                print(f"Archivo guardado: {csv_writer.resumen()}")
+            except (RuntimeError, TimeoutError) as e:
+                print(f"Error al guardar el archivo: {e} ({csv_writer.resumen()})")
+            latencia.cerrar()
 
     # Desconectar de ambos servidores
     esp32_disconnect(ESP32)
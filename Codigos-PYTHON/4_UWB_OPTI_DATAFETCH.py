@@ -19,21 +19,43 @@ import pygame
 from pygame.locals import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
-import numpy as np
+from flujo_esp32 import DecodificadorLineas
+from homografia import H_MATLAB, aplicar_homografia, cargar_homografia
+from escena_gl import EscenaGL, matriz_modelo
+from ingesta import HiloIngesta
+from latencia import crear_latencia
+from filtro_continuo import FiltroComplementarioContinuo
+from grabador import ConsolaLimitada
 
 # Variables para almacenar la posición y orientación
 pos_x, pos_y = 0.0, 0.0  # Posición en el plano XY
 angle_x, angle_y, angle_z = 0.0, 0.0, 0.0  # Orientación
-int_gyr_ang_x, int_gyr_ang_y, int_gyr_ang_z = 0.0, 0.0, 0.0  # Integración giroscopio
 alpha_pos = 0.9
 
-alpha = 0.96  # Constante del filtro complementario para acelerómetro y giroscopio
-alpha_yaw = 0.85  # Constante del filtro complementario para el yaw (giroscopio y magnetómetro)
+# Filtro complementario de orientación con estado, el mismo Butterworth (fc = 0.1 Hz) del
+# post-procesamiento de las V0.0 - V0.2 pero causal, se alimenta con cada bloque recibido
+filtro_orientacion = FiltroComplementarioContinuo(dt=0.1, fc=0.1, peso_yaw=0.98)
 
-# Matriz de homografía (como en la imagen de MATLAB)
-H = np.array([[0.9806, 0.0487, -2036.3],
-              [-0.0347, 1.0527, -2511.9],
-              [-1.8418e-06, 1.0074e-05, 1]])
+# Decodificador del flujo del ESP32 (conserva los bytes sobrantes entre recv)
+decodificador_esp32 = DecodificadorLineas(campos=12)
+
+# Latencia por etapa, solo se activa con la variable de entorno UWB_LATENCIA
+latencia = crear_latencia()
+
+# La muestra cruda se imprime a lo más 2 veces por segundo, imprimir cada muestra en el hilo de
+# ingesta agrega jitter y se suma a las latencias de filtro y publicación
+consola = ConsolaLimitada(2)
+
+# Matriz de homografía ajustada con los datos de calibración (queda en cache después de la
+# primera vez), si no están los datasets se usa la matriz de MATLAB
+try:
+    H = cargar_homografia()
+except (OSError, ValueError) as e:
+    print(f'No se pudo ajustar la homografía ({e}), se usa la matriz de MATLAB.')
+    H = H_MATLAB
+
+# Escena en modo retenido (grilla, ejes y estela en la GPU), se crea después de init_pygame
+escena = None
 
 # Variables para controlar la cámara (paneo y rotación)
 camera_x, camera_y = 0.0, 0.0  # Posición de la cámara (paneo)
@@ -44,21 +66,9 @@ is_rotating = False  # Estado de rotación con el mouse
 pan_speed = 0.005  # Velocidad del paneo con el mouse
 rotation_speed = 0.5  # Velocidad de la rotación de la cámara
 
-def apply_homography(x, y, H):
-    # Crear el vector homogéneo [x, y, 1]
-    point = np.array([x, y, 1])
-    
-    # Aplicar la transformación usando la matriz H
-    transformed_point = H @ point
-    
-    # Dividir por w' para obtener las coordenadas reales
-    x_final = transformed_point[0] / transformed_point[2]
-    y_final = transformed_point[1] / transformed_point[2]
-
-    x_final = x_final/1000 #Convertimos a metros
-    y_final = y_final/1000
-    
-    return x_final, y_final
+def apply_homography(puntos, H):
+    # Todas las posiciones (N, 2) en una sola llamada, convertidas a metros
+    return aplicar_homografia(puntos, H) / 1000
 
 # Conectar al ESP32
 def esp32_connect(ip, port):
@@ -69,164 +79,74 @@ def esp32_connect(ip, port):
 # Actualizar la posición y los ángulos usando los datos recibidos del ESP32
 
 def update_position_and_orientation(tcp_obj, dt):
-    global pos_x, pos_y, angle_x, angle_y, angle_z, int_gyr_ang_x, int_gyr_ang_y, int_gyr_ang_z
-
-    try:
-        # Intentar recibir datos del ESP32
-        data = tcp_obj.recv(1024)
-        if data:
-            data_str = data.decode('utf-8').strip()
-            lines = data_str.split('\n')  # Dividir en líneas, ya que puede haber más de un paquete
-            #print(lines)
-            for line in lines:
-                try:
-                    # Convertir los datos de la línea a flotantes
-                    values = [float(val) for val in line.split(',')]
-                    print(values)
-                    
-                    # Verificar que el paquete tenga el número correcto de valores (mínimo 11)
-                    if len(values) >= 10:
-                        
-                        # Actualizar posición (x, y)
-                        pos_x, pos_y = values[0], values[1]  # Primeros dos valores son x, y
-
-                        # Aplicar la homografía a las coordenadas
-                        pos_x, pos_y = apply_homography(pos_x, pos_y, H)
-
-                        # Acelerómetros y giroscopios
-                        ax, ay, az = values[3], values[4], values[5]
-                        gx, gy, gz = values[6], values[7], values[8]
-                        mx, my = values[9], values[10]
-
-                        # Cálculo de los ángulos a partir del acelerómetro (tilt)
-                        accel_angle_x = np.rad2deg(np.arctan2(ay, np.sqrt(ax**2 + az**2)))
-                        accel_angle_y = np.rad2deg(np.arctan2(-ax, np.sqrt(ay**2 + az**2)))
-
-                        # Integración de giroscopio para obtener los ángulos
-                        int_gyr_ang_x += gx * dt
-                        int_gyr_ang_y += gy * dt
-                        int_gyr_ang_z += gz * dt
-
-                        # Filtro complementario para combinar acelerómetro y giroscopio
-                        angle_x = alpha * (angle_x + gx * dt) + (1 - alpha) * accel_angle_x
-                        angle_y = alpha * (angle_y + gy * dt) + (1 - alpha) * accel_angle_y
-
-                        # Calcular yaw usando el magnetómetro
-                        mag_yaw = np.rad2deg(np.arctan2(my, mx))
-
-                        # Filtro complementario para el yaw (combinar giroscopio y magnetómetro)
-                        angle_z = alpha_yaw * (int_gyr_ang_z) + (1 - alpha_yaw) * mag_yaw
-
-                        # Filtro complementario para posicion
-
-                        # Para explicar las mediciones
-                        # -> pos_x se transforma a metros en la función de homografia.
-                        # -> ax es +/- 1g, se multiplica por 9.8 m/s^2
-                        pos_x = pos_x*alpha_pos + (1-alpha_pos)*ax*9.8
-                        pos_y = pos_y*alpha_pos + (1-alpha_pos)*ay*9.8
-
-                        #print(f"Posición -> X: {pos_x:.2f}, Y: {pos_y:.2f}")
-                        #print(f"acc -> X: {ax*(1-alpha_pos)*9.8:.4f}, Y: {ay*(1-alpha_pos)*9.8:.4f}")
-                        #print(f"Ángulos -> X: {angle_x:.2f}, Y: {angle_y:.2f}, Z (yaw): {angle_z:.2f}")
-                    else:
-                        # El paquete no tiene suficientes valores
-                        print("Paquete incompleto recibido, esperando el siguiente...")
-
-                except ValueError:
-                    # Si ocurre un error de conversión en los datos, lo ignoramos
-                    print("Error al convertir los valores, paquete inválido.")
-                    continue
-
-    except socket.error as e:
-        # En caso de un error de socket (como desconexión), manejamos el error
-        print(f"Error de socket: {e}")
-        time.sleep(1)  # Esperar un momento antes de intentar recibir de nuevo
-
-
-# Función para dibujar los ejes X, Y, Z en OpenGL
-def draw_axes():
-
-    glLineWidth(3)  # Establecer el grosor de las líneas
-
-    glBegin(GL_LINES)
-
-    # Eje X - Rojo (en el plano horizontal, hacia la derecha)
-    glColor3fv([1, 0, 0])
-    glVertex3fv([0, 0, 0])
-    glVertex3fv([0.5, 0, 0])
-
-    # Eje Y - Verde (en el plano horizontal, hacia arriba)
-    glColor3fv([0, 1, 0])
-    glVertex3fv([0, 0, 0])
-    glVertex3fv([0, 0.5, 0])
-
-    # Eje Z - Azul (en el plano vertical, hacia arriba o abajo)
-    glColor3fv([0, 0, 1])
-    glVertex3fv([0, 0, 0])
-    glVertex3fv([0, 0, 0.5])
-
-    glEnd()
-
-# Función para dibujar una grilla en el plano XY
-def draw_grid():
-    glColor3fv([0.75, 0.75, 0.75])  # Color gris claro para la grilla
-    glBegin(GL_LINES)
-
-    # Dibujar líneas paralelas al eje X (a lo largo de Y)
-    for y in np.arange(-2.5, 2.51, 0.5):
-        glVertex3fv([-2, y, 0])  # Desde X = -2 a X = 2 en el plano XY
-        glVertex3fv([2, y, 0])
-
-    # Dibujar líneas paralelas al eje Y (a lo largo de X)
-    for x in np.arange(-2, 2.01, 0.5):
-        glVertex3fv([x, -2.5, 0])  # Desde Y = -2.5 a Y = 2.5 en el plano XY
-        glVertex3fv([x, 2.5, 0])
+    global pos_x, pos_y, angle_x, angle_y, angle_z
 
-    glEnd()
+    # Recibir datos del ESP32 (corre en el hilo de ingesta), el decodificador junta las líneas
+    # partidas entre paquetes y devuelve todas las muestras completas
+    malformadas = decodificador_esp32.malformadas
+    samples = decodificador_esp32.leer(tcp_obj)
+    if decodificador_esp32.cerrado:
+        # recv devuelve vacío de inmediato con el socket cerrado, el hilo espera espera_error
+        raise ConnectionError("El ESP32 cerró la conexión")
+    t_rx = decodificador_esp32.instante
+    latencia.recepcion(t_rx)
+    latencia.registrar('parseo', t_rx, len(samples))
+    if decodificador_esp32.malformadas > malformadas:
+        print("Paquete inválido o incompleto recibido, esperando el siguiente...")
 
-# Inicializar Pygame y OpenGL
-def init_pygame():
-    pygame.init()
-    display = (800, 600)
-    pygame.display.set_mode(display, DOUBLEBUF | OPENGL)
-    gluPerspective(45, (display[0] / display[1]), 0.1, 50.0)
-    glTranslatef(0.0, 0.0, -10)  # Alejar la "cámara" un poco más para una mejor perspectiva
+    # Aplicar la homografía a las coordenadas (x, y) de todas las muestras a la vez
+    posiciones = apply_homography(samples[:, :2], H)
+    latencia.registrar('homografia', t_rx, len(samples))
 
-# Dibujar el objeto (ejes) con rotaciones y movimiento
-def draw_axes_with_movement_and_rotation():
-    global pos_x, pos_y
+    # Orientación de todas las muestras del bloque (tilt, giroscopio integrado y magnetómetro)
+    angulos = filtro_orientacion.actualizar(*samples[:, 3:11].T)
 
-    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    estela = []
 
-    # Aplicar las rotaciones de la cámara antes de mover la cámara o la escena
-    glPushMatrix()
+    for values, (pos_x, pos_y), (angle_x, angle_y, angle_z) in zip(samples, posiciones, angulos):
+        # Acelerómetros
+        ax, ay = values[3], values[4]
 
-    # Rotar la cámara si es necesario
-    glRotatef(camera_rotation_x, 1, 0, 0)  # Rotar en X
-    glRotatef(camera_rotation_y, 0, 1, 0)  # Rotar en Y
+        # Filtro complementario para posicion
 
-    # Aplicar el paneo (movimiento de la cámara)
-    glTranslatef(camera_x, camera_y, 0)
+        # Para explicar las mediciones
+        # -> pos_x se transforma a metros en la función de homografia.
+        # -> ax es +/- 1g, se multiplica por 9.8 m/s^2
+        pos_x = pos_x*alpha_pos + (1-alpha_pos)*ax*9.8
+        pos_y = pos_y*alpha_pos + (1-alpha_pos)*ay*9.8
+        estela.append((pos_x, pos_y))
 
-    # Dibujar la grilla en el plano XY
-    draw_grid()
+        #print(f"Posición -> X: {pos_x:.2f}, Y: {pos_y:.2f}")
+        #print(f"acc -> X: {ax*(1-alpha_pos)*9.8:.4f}, Y: {ay*(1-alpha_pos)*9.8:.4f}")
+        #print(f"Ángulos -> X: {angle_x:.2f}, Y: {angle_y:.2f}, Z (yaw): {angle_z:.2f}")
 
-    # Aplicar las rotaciones basadas en los ángulos calculados
-    glPushMatrix()
+    latencia.registrar('filtro', t_rx, len(samples))
+    if len(samples):
+        consola.mostrar(print, samples[-1])
 
-    # Mover el objeto en el plano XY según los valores recibidos
-    glTranslatef(pos_x, pos_y, 0)  # Mover en X e Y, el Z se mantiene en 0 (plano 2D)
+    # Pose para el snapshot (con el instante del recv al final) y posiciones nuevas para la estela
+    return (pos_x, pos_y, angle_x, angle_y, angle_z, t_rx), estela
 
-    # Aplicar las rotaciones (orientación) calculadas
-    glRotatef(angle_x, -1, 0, 0)  # Rotación en X
-    glRotatef(angle_y, 0, 1, 0)  # Rotación en Y
-    glRotatef(angle_z, 0, 0, -1)  # Rotación en Z (yaw)
 
-    # Dibujar los ejes
-    draw_axes()
+# Inicializar Pygame y OpenGL
+def init_pygame():
+    pygame.init()
+    display = (800, 600)
+    pygame.display.set_mode(display, DOUBLEBUF | OPENGL)
+    gluPerspective(45, (display[0] / display[1]), 0.1, 50.0)
+    glTranslatef(0.0, 0.0, -10)  # Alejar la "cámara" un poco más para una mejor perspectiva
+
+    # La grilla, los ejes y el buffer de la estela se suben una sola vez a la GPU
+    global escena
+    escena = EscenaGL()
 
-    glPopMatrix()
-    glPopMatrix()
+# Dibujar el objeto (ejes) con rotaciones y movimiento
+def draw_axes_with_movement_and_rotation(pose):
+    # La pose del tag (posición en el plano XY y orientación) es una sola matriz de modelo
+    poses = {'UWB': matriz_modelo(*pose)}
+
+    # Cámara (rotación y paneo), grilla, estela y ejes del tag
+    escena.dibujar(poses, (camera_rotation_x, camera_rotation_y, camera_x, camera_y))
 
     pygame.display.flip()
 
@@ -268,21 +188,47 @@ def handle_mouse_events():
 
 # Bucle principal
 def main_loop(tcp_obj):
+    # La recepción y el filtrado corren en un hilo aparte, el loop de dibujo solo lee el último
+    # snapshot y nunca espera a la red. El timeout deja que el hilo revise si debe detenerse.
+    tcp_obj.settimeout(0.5)
+    ingesta = HiloIngesta(lambda: update_position_and_orientation(tcp_obj, 0.1), campos=6,
+                          latencia=latencia if latencia.activa else None)
+    ingesta.start()
+
     clock = pygame.time.Clock()
+    ultimo_titulo = 0.0
+    ultima_version = 0
     while True:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                ingesta.parar()
+                latencia.cerrar()
                 pygame.quit()
                 quit()
 
         # Manejar los eventos del mouse para el paneo y la rotación
         handle_mouse_events()
 
-        # Actualizar posición y ángulos según los datos del ESP32
-        update_position_and_orientation(tcp_obj, 0.1)
+        # Última pose publicada y posiciones nuevas para la estela en la GPU
+        estado, version = ingesta.snapshot.leer()
+        nuevas = ingesta.posiciones_nuevas()
+        if nuevas:
+            escena.estela('UWB').agregar(nuevas)
 
         # Dibujar los ejes con movimiento, rotación y grilla
-        draw_axes_with_movement_and_rotation()
+        draw_axes_with_movement_and_rotation(estado[:5])
+
+        # La latencia de dibujo se cuenta una vez por pose, en el primer cuadro que la muestra
+        if version != ultima_version:
+            ultima_version = version
+            latencia.registrar('dibujo', estado[5])
+
+        # Tasa de ingesta y antigüedad de la pose en el título (4 veces por segundo)
+        ahora = time.perf_counter()
+        if ahora - ultimo_titulo > 0.25:
+            ultimo_titulo = ahora
+            pygame.display.set_caption(f'UWB - {ingesta.tasa:.1f} muestras/s, pose de hace '
+                                       f'{ingesta.retraso() * 1000:.0f} ms, {clock.get_fps():.0f} FPS')
 
         clock.tick(60)  # Limitar a 60 FPS
 
@@ -13,8 +13,9 @@ import time
 import imufusion
 import matplotlib.pyplot as plt
 import numpy as np
-from collections import deque
 import threading
+from buffer_circular import BufferCircular
+from latencia import crear_latencia
 
 # Configuración de la conexión TCP
 def esp32_connect(ip, port):
@@ -31,20 +32,28 @@ def esp32_connect(ip, port):
 sample_rate = 100  # 100 Hz
 ahrs = imufusion.Ahrs()
 
-# Buffers para almacenar los datos en tiempo real
-timestamp_buffer = deque(maxlen=500)
-gyroscope_buffer = deque(maxlen=500)
-accelerometer_buffer = deque(maxlen=500)
-euler_buffer = deque(maxlen=500)
+# Buffer circular preasignado con los datos en tiempo real, una fila por muestra:
+# [tiempo, gx, gy, gz, ax, ay, az, roll, pitch, yaw]
+window_size = 500  # Muestras en la ventana de la gráfica (funciona con 10k+)
+max_fps = 20  # Máximo de redibujos por segundo de la gráfica
+data_buffer = BufferCircular(window_size, 10)
+
+# Latencia por etapa, solo se activa con la variable de entorno UWB_LATENCIA. El hilo de datos
+# deja en ultima_recepcion el recv de la última muestra guardada para medir el dibujo.
+latencia = crear_latencia()
+ultima_recepcion = 0.0
 
 # Recibir y procesar datos del ESP32
 def update_data(tcp_obj):
+    global ultima_recepcion
     start_time = time.time()
     
     try:
         while True:
             # Recibir datos del ESP32
             data = tcp_obj.recv(1024)
+            t_rx = latencia.ahora()
+            latencia.recepcion(t_rx)
             if data:
                 data_str = data.decode('utf-8').strip()
                 lines = data_str.split('\n')
@@ -57,19 +66,22 @@ def update_data(tcp_obj):
                             # Extraer datos del giroscopio y acelerómetro
                             gx, gy, gz = values[0], values[1], values[2]
                             ax, ay, az = values[3], values[4], values[5]
+                            latencia.registrar('parseo', t_rx)
                             
-                            # Almacenar los datos en buffers
+                            # Tiempo de la muestra
                             current_time = time.time() - start_time
-                            timestamp_buffer.append(current_time)
-                            gyroscope_buffer.append([gx, gy, gz])
-                            accelerometer_buffer.append([ax, ay, az])
                             
                             # Actualizar AHRS y calcular los ángulos de Euler
                             gyroscope = np.array([gx, gy, gz], dtype=float)
                             accelerometer = np.array([ax, ay, az], dtype=float)
                             ahrs.update_no_magnetometer(gyroscope, accelerometer, 1 / sample_rate)
                             euler_angles = ahrs.quaternion.to_euler()
-                            euler_buffer.append(euler_angles)
+                            latencia.registrar('filtro', t_rx)
+                            
+                            # Almacenar la muestra completa en el buffer (una sola fila)
+                            data_buffer.agregar((current_time, gx, gy, gz, ax, ay, az, *euler_angles))
+                            ultima_recepcion = t_rx
+                            latencia.registrar('publicacion', t_rx)
                             
                             # Imprimir datos para verificar
                             print(f"{current_time:.2f} | Gyro: {gx}, {gy}, {gz} | Accel: {ax}, {ay}, {az} | Euler: {euler_angles}")
@@ -85,54 +97,59 @@ def plot_real_time():
     plt.ion()
     fig, axes = plt.subplots(nrows=3, sharex=True, figsize=(10, 8))
 
-    axes[0].set_title("Gyroscope")
-    axes[0].set_ylabel("Degrees/s")
-    axes[0].grid()
-    
-    axes[1].set_title("Accelerometer")
-    axes[1].set_ylabel("g")
-    axes[1].grid()
-    
-    axes[2].set_title("Euler angles")
+    # Las nueve líneas, títulos y leyendas se crean una sola vez, en cada redibujo solo se
+    # actualizan los datos de las líneas con vistas del buffer (sin copias)
+    graficas = [("Gyroscope", "Degrees/s", ("X", "Y", "Z")),
+                ("Accelerometer", "g", ("X", "Y", "Z")),
+                ("Euler angles", "Degrees", ("Roll", "Pitch", "Yaw"))]
+    lines = []
+    for axis, (title, ylabel, labels) in zip(axes, graficas):
+        for color, label in zip(("tab:red", "tab:green", "tab:blue"), labels):
+            line, = axis.plot([], [], color, label=label)
+            lines.append(line)
+        axis.set_title(title)
+        axis.set_ylabel(ylabel)
+        axis.legend(loc="upper left")
+        axis.grid()
     axes[2].set_xlabel("Seconds")
-    axes[2].set_ylabel("Degrees")
-    axes[2].grid()
-
-    while True:
-        if len(timestamp_buffer) > 1:
-            timestamps = np.array(timestamp_buffer)
-            gyroscope = np.array(gyroscope_buffer)
-            accelerometer = np.array(accelerometer_buffer)
-            euler = np.array(euler_buffer)
-
-            # Graficar giroscopio
-            axes[0].cla()
-            axes[0].plot(timestamps, gyroscope[:, 0], "tab:red", label="X")
-            axes[0].plot(timestamps, gyroscope[:, 1], "tab:green", label="Y")
-            axes[0].plot(timestamps, gyroscope[:, 2], "tab:blue", label="Z")
-            axes[0].legend()
-            axes[0].grid()
-            axes[0].set_title("Gyroscope")
-
-            # Graficar acelerómetro
-            axes[1].cla()
-            axes[1].plot(timestamps, accelerometer[:, 0], "tab:red", label="X")
-            axes[1].plot(timestamps, accelerometer[:, 1], "tab:green", label="Y")
-            axes[1].plot(timestamps, accelerometer[:, 2], "tab:blue", label="Z")
-            axes[1].legend()
-            axes[1].grid()
-            axes[1].set_title("Accelerometer")
-
-            # Graficar ángulos de Euler
-            axes[2].cla()
-            axes[2].plot(timestamps, euler[:, 0], "tab:red", label="Roll")
-            axes[2].plot(timestamps, euler[:, 1], "tab:green", label="Pitch")
-            axes[2].plot(timestamps, euler[:, 2], "tab:blue", label="Yaw")
-            axes[2].legend()
-            axes[2].grid()
-            axes[2].set_title("Euler angles")
-
-            plt.pause(0.01)
+
+    # El dibujo pedido con draw_idle ocurre dentro de start_event_loop, la latencia de dibujo se
+    # registra al terminar de dibujar (draw_event) y no al salir del loop, que incluye la espera
+    redibujo = None
+    def al_dibujar(evento):
+        nonlocal redibujo
+        if redibujo is not None:
+            latencia.registrar('dibujo', redibujo)
+            redibujo = None
+    fig.canvas.mpl_connect('draw_event', al_dibujar)
+    plt.show(block=False)
+
+    last_total = 0
+    interval = 1 / max_fps
+    while plt.fignum_exists(fig.number):
+        # Solo se redibuja si llegaron muestras nuevas, a lo más max_fps veces por segundo
+        if data_buffer.total != last_total and len(data_buffer) > 1:
+            last_total = data_buffer.total
+            redibujo = ultima_recepcion
+            window = data_buffer.vista()
+            timestamps = window[:, 0]
+
+            for k, line in enumerate(lines):
+                line.set_data(timestamps, window[:, k + 1])
+
+            axes[2].set_xlim(timestamps[0], timestamps[-1])
+            for k, axis in enumerate(axes):
+                values = window[:, 1 + 3 * k:4 + 3 * k]
+                low, high = np.nanmin(values), np.nanmax(values)
+                margin = 0.05 * (high - low) or 1.0
+                axis.set_ylim(low - margin, high + margin)
+
+            fig.canvas.draw_idle()
+
+        # Atender los eventos de la ventana sin redibujar si no hay cambios
+        fig.canvas.start_event_loop(interval)
+
+    latencia.cerrar()
 
 # Bucle principal
 if __name__ == "__main__":
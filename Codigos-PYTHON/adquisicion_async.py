@@ -0,0 +1,290 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: obtención de datos (asyncio)
+#
+# Descripcion: Modo de captura asíncrono para la V0.3 (3_UWB_OPTI_DATAFETCH.py). En la captura
+# original se consulta el ESP32, luego el Robotat y después se espera time.sleep(0.1), por lo que
+# el periodo real es 100 ms más los dos viajes de ida y vuelta (la columna Time (ms) se desplaza
+# a 103 - 105 ms por muestra). Aquí el ESP32 se lee de forma continua en su propia tarea, la
+# consulta al Robotat corre en paralelo y cada ciclo se programa contra un tiempo límite absoluto
+# (inicio + k * periodo) en lugar de un sleep fijo. Cada fila guarda el tiempo de recepción de
+# cada fuente.
+#
+# * Si se ejecuta este archivo directamente se levantan servidores TCP locales que simulan al
+#   ESP32 y al Robotat para probar el modo sin el laboratorio.
+# -------------------------------------------------------------------------------------------------
+
+import asyncio
+import json
+
+import numpy as np
+
+from flujo_esp32 import DecodificadorLineas
+from cliente_robotat import decodificar_poses, poses_a_euler
+from latencia import LatenciaNula
+
+# Cabeceras de la V0.3 más los tiempos de recepción de cada fuente
+CABECERAS_ASYNC = ['Sample', 'Time (ms)', 'ESP32_X', 'ESP32_Y', 'UWB_QF', 'ESP32_Ax', 'ESP32_Ay',
+                   'ESP32_Az', 'ESP32_Gx', 'ESP32_Gy', 'ESP32_Gz', 'ESP32_Mx', 'ESP32_My',
+                   'ESP32_Mz', 'Robotat_X_mm', 'Robotat_Y_mm', 'Robotat_Z_mm', 'Robotat_Roll',
+                   'Robotat_Pitch', 'Robotat_Yaw', 'ESP32_RX (ms)', 'Robotat_RX (ms)']
+
+async def leer_esp32(reader, cola, decodificador, reloj, latencia=LatenciaNula()):
+    """Lee el flujo del ESP32 sin parar y pone (t_rx, muestra, instante de recv) en la cola."""
+    while True:
+        data = await reader.read(4096)
+        instante = latencia.ahora()
+        if not data:
+            decodificador.cerrado = True
+            break
+        t_rx = reloj()
+        latencia.recepcion(instante)
+        muestras = decodificador.alimentar(data)
+        latencia.registrar('parseo', instante, len(muestras))
+        for muestra in muestras:
+            cola.put_nowait((t_rx, muestra.tolist(), instante))
+
+class RobotatAsync:
+    """Conexión asíncrona al Robotat con un buffer de texto que se conserva entre consultas.
+
+    Las respuestas se separan con raw_decode como en ClienteRobotat.recibir (pueden llegar partidas
+    o varias en un mismo read). Una solicitud que se pasa del tiempo límite queda pendiente y su
+    respuesta se descarta cuando llega, así la consulta siguiente no lee la pose del ciclo anterior.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.buffer = ''
+        self.decoder = json.JSONDecoder()
+        self.pendientes = 0  # Solicitudes enviadas cuya respuesta no se ha leído
+        self.sin_respuesta = 0  # Solicitudes que se pasaron del tiempo límite
+        self.descartadas = 0  # Respuestas tardías de esas solicitudes
+        self.invalidas = 0  # Respuestas que no son 7 valores por marcador
+
+    def _siguiente(self):
+        """(True, respuesta) si el buffer tiene un JSON completo, (False, None) si no."""
+        texto = self.buffer.lstrip()
+        try:
+            respuesta, fin = self.decoder.raw_decode(texto)
+        except json.JSONDecodeError:
+            self.buffer = texto
+            return False, None
+        self.buffer = texto[fin:]
+        return True, respuesta
+
+    async def consultar(self, agents_ids, timeout):
+        """Manda una solicitud de pose y devuelve su respuesta JSON, None si se pasa de timeout."""
+        s = {
+            "dst": 1,  # DST_ROBOTAT
+            "cmd": 1,  # CMD_GET_POSE
+            "pld": agents_ids
+        }
+        self.writer.write(json.dumps(s).encode('utf-8'))
+        await self.writer.drain()
+        self.pendientes += 1
+
+        loop = asyncio.get_running_loop()
+        limite = loop.time() + timeout
+        while True:
+            completa, respuesta = self._siguiente()
+            if completa:
+                self.pendientes -= 1
+                if self.pendientes == 0:
+                    return respuesta
+                # Respuesta de una solicitud anterior que ya se dio por perdida
+                self.descartadas += 1
+                continue
+            restante = limite - loop.time()
+            try:
+                if restante <= 0:
+                    raise asyncio.TimeoutError
+                data = await asyncio.wait_for(self.reader.read(4096), restante)
+            except asyncio.TimeoutError:
+                self.sin_respuesta += 1
+                return None
+            if not data:
+                raise ConnectionError('El Robotat cerró la conexión.')
+            self.buffer += data.decode('utf-8')
+
+    def resumen(self):
+        return {'sin_respuesta': self.sin_respuesta, 'descartadas': self.descartadas,
+                'invalidas': self.invalidas}
+
+async def robotat_get_pose_async(robotat, agents_ids, rotrep='xyz', timeout=0.08):
+    """Versión asíncrona de robotat_get_pose, devuelve [x, y, z (mm), roll, pitch, yaw] o None."""
+    mocap_data = await robotat.consultar(agents_ids, timeout)
+    if not mocap_data:
+        return None
+    try:
+        poses = decodificar_poses(mocap_data, len(agents_ids))
+    except (TypeError, ValueError):
+        # Respuesta con un número de valores que no corresponde, igual que en robotat_get_pose
+        robotat.invalidas += 1
+        return None
+    # Se guarda la pose del primer agente pedido (XYZ en mm y Euler en grados)
+    return poses_a_euler(poses, rotrep)[0].tolist()
+
+async def capturar_async(esp32_rw, robotat_rw, csv_writer, num_samples=None, periodo=0.1,
+                         detener=None, agente=20, mostrar=print, latencia=LatenciaNula()):
+    """Captura a periodo fijo con tiempos límite absolutos, devuelve estadísticas de la captura.
+
+    esp32_rw y robotat_rw son pares (reader, writer) de asyncio. Se detiene al llegar a
+    num_samples filas guardadas o cuando detener() devuelva True. latencia (latencia.py) recibe
+    las etapas parseo, robotat y escritura de cada muestra del ESP32. Las muestras del ESP32 de
+    un ciclo sin pose del Robotat no se guardan, se cuentan en sin_robotat.
+    """
+    loop = asyncio.get_running_loop()
+    inicio = loop.time()
+    reloj = lambda: (loop.time() - inicio) * 1000  # ms desde el inicio
+
+    decodificador = DecodificadorLineas(campos=12)
+    cola = asyncio.Queue()
+    tarea_esp32 = asyncio.create_task(leer_esp32(esp32_rw[0], cola, decodificador, reloj, latencia))
+    robotat = RobotatAsync(*robotat_rw)
+
+    sample_num = 0
+    ciclo = 0
+    ciclos_perdidos = 0
+    sin_robotat = 0
+    tiempos_ciclo = []
+    try:
+        while num_samples is None or sample_num < num_samples:
+            if detener is not None and detener():
+                break
+            if decodificador.cerrado and cola.empty():
+                mostrar('El ESP32 cerró la conexión.')
+                break
+
+            # Esperar hasta el tiempo límite del ciclo k (no se acumula el retardo)
+            ciclo += 1
+            limite = inicio + ciclo * periodo
+            espera = limite - loop.time()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            else:
+                # El ciclo anterior se pasó del límite, saltar a la siguiente ranura
+                perdidos = int(-espera // periodo)
+                ciclos_perdidos += perdidos
+                ciclo += perdidos
+            current_time = reloj()
+            tiempos_ciclo.append(current_time)
+
+            # Consultar el Robotat mientras la tarea del ESP32 sigue recibiendo
+            try:
+                robotat_sample = await robotat_get_pose_async(robotat, [agente], 'xyz',
+                                                              timeout=periodo * 0.8)
+            except ConnectionError as e:
+                mostrar(str(e))
+                break
+            t_rx_robotat = reloj()
+
+            esp32_samples = []
+            while not cola.empty():
+                esp32_samples.append(cola.get_nowait())
+
+            if esp32_samples and not robotat_sample:
+                sin_robotat += len(esp32_samples)
+            elif esp32_samples:
+                for t_rx_esp32, esp32_row, instante in esp32_samples:
+                    if num_samples is not None and sample_num >= num_samples:
+                        break
+                    latencia.registrar('robotat', instante)
+                    sample_num += 1
+                    csv_writer.writerow([sample_num, current_time] + esp32_row + robotat_sample
+                                        + [t_rx_esp32, t_rx_robotat])
+                    latencia.registrar('escritura', instante)
+    finally:
+        tarea_esp32.cancel()
+
+    periodos = np.diff(tiempos_ciclo)
+    return {
+        'muestras': sample_num,
+        'ciclos': len(tiempos_ciclo),
+        'ciclos_perdidos': ciclos_perdidos,
+        'periodo_medio_ms': float(periodos.mean()) if len(periodos) else float('nan'),
+        'periodo_max_ms': float(periodos.max()) if len(periodos) else float('nan'),
+        'sin_robotat': sin_robotat,
+        'esp32': decodificador.resumen(),
+        'robotat': robotat.resumen(),
+    }
+
+def capture_async(ESP32, Robotat, csv_writer, num_samples=None, detener=None, periodo=0.1,
+                  latencia=LatenciaNula()):
+    """Punto de entrada desde la V0.3 con los sockets ya conectados.
+
+    El loop de eventos trabaja con copias (socket.dup) y las cierra al terminar, así los sockets
+    siguen siendo del código que llama y se pueden seguir usando o cerrar (EXIT al Robotat).
+    """
+    async def principal():
+        esp32_rw = await asyncio.open_connection(sock=ESP32.dup())
+        robotat_rw = await asyncio.open_connection(sock=Robotat.dup())
+        try:
+            return await capturar_async(esp32_rw, robotat_rw, csv_writer, num_samples, periodo,
+                                        detener, latencia=latencia)
+        finally:
+            for _, writer in (esp32_rw, robotat_rw):
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+
+    try:
+        return asyncio.run(principal())
+    finally:
+        # La copia comparte el modo no bloqueante con el original, se restaura el timeout
+        for sock in (ESP32, Robotat):
+            sock.settimeout(sock.gettimeout())
+
+# Servidores locales de prueba --------------------------------------------------------------------
+
+async def _servidor_esp32(reader, writer, frecuencia=50):
+    k = 0
+    try:
+        while True:
+            k += 1
+            linea = f'{1000 + k},{2000 + k},90,0.01,-0.02,0.98,0.1,0.2,0.3,40.0,10.0,-30.0\r\n'
+            writer.write(linea.encode('utf-8'))
+            await writer.drain()
+            await asyncio.sleep(1 / frecuencia)
+    except (ConnectionError, asyncio.CancelledError):
+        writer.close()
+
+async def _servidor_robotat(reader, writer):
+    try:
+        while True:
+            data = await reader.read(1024)
+            if not data or data == b'EXIT':
+                break
+            await asyncio.sleep(0.01)  # Latencia simulada del Robotat
+            writer.write(json.dumps([0.5, -0.25, 0.1, 1.0, 0.0, 0.0, 0.0]).encode('utf-8'))
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    writer.close()
+
+async def _prueba_local(num_samples=50):
+    import csv
+    import io
+
+    srv_esp32 = await asyncio.start_server(_servidor_esp32, '127.0.0.1', 0)
+    srv_robotat = await asyncio.start_server(_servidor_robotat, '127.0.0.1', 0)
+    puerto_esp32 = srv_esp32.sockets[0].getsockname()[1]
+    puerto_robotat = srv_robotat.sockets[0].getsockname()[1]
+
+    esp32_rw = await asyncio.open_connection('127.0.0.1', puerto_esp32)
+    robotat_rw = await asyncio.open_connection('127.0.0.1', puerto_robotat)
+
+    salida = io.StringIO()
+    stats = await capturar_async(esp32_rw, robotat_rw, csv.writer(salida), num_samples)
+
+    for _, writer in (esp32_rw, robotat_rw):
+        writer.close()
+    srv_esp32.close()
+    srv_robotat.close()
+    return stats
+
+if __name__ == "__main__":
+    print(asyncio.run(_prueba_local()))
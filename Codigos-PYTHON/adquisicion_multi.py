@@ -0,0 +1,253 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: obtención de datos (asyncio, varios tags)
+#
+# Descripcion: Adquisición de varios nodos tag (DWM1001 + MPU9250, PCB1 - PCB24) en un solo
+# proceso. Los códigos 3 - 5 abren un socket con esp32_connect(ip, port) para una sola placa y las
+# filas no dicen de qué placa vienen. Aquí cada nodo tiene su propia tarea de asyncio en el mismo
+# loop de eventos, con su propio DecodificadorLineas (los flujos no se mezclan aunque lleguen
+# partidos o juntos) y reconexión automática si la placa se reinicia o sale de la red. Cada fila
+# lleva el número de placa (Tag), el número de muestra de esa placa y el tiempo de recepción en
+# la computadora. Las filas van a un solo archivo combinado o a un archivo por tag, en los dos
+# casos con GrabadorDatos (grabador.py), así el disco no bloquea al loop de eventos.
+#
+# * Un paquete de recv() se escribe con un solo writerows, a 24 tags x 100 Hz el costo por
+#   muestra es la conversión vectorizada del decodificador y poner la fila en la cola.
+# * El archivo combinado tiene la columna Tag además de las de la V0.3, cargador_datos la lee en
+#   la columna canónica tag y separar_por_tag lo divide por placa.
+# * Uso: python adquisicion_multi.py --nodo PCB1=192.168.50.225:80 --nodo PCB2=192.168.50.226:80
+#   o con --simular 24 --frecuencia 100 para levantar 24 nodos locales y medir la tasa.
+# -------------------------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+import re
+import time
+
+from flujo_esp32 import DecodificadorLineas
+from grabador import ConsolaLimitada, GrabadorDatos
+from latencia import LatenciaNula
+
+# Cabeceras del archivo combinado, los archivos por tag no llevan la columna Tag
+CABECERAS_MULTI = ['Tag', 'Sample', 'Time (ms)', 'ESP32_X', 'ESP32_Y', 'UWB_QF', 'ESP32_Ax',
+                   'ESP32_Ay', 'ESP32_Az', 'ESP32_Gx', 'ESP32_Gy', 'ESP32_Gz', 'ESP32_Mx',
+                   'ESP32_My', 'ESP32_Mz']
+
+class NodoTag:
+    """Una placa tag: dirección, decodificador del flujo y contadores."""
+
+    def __init__(self, tag, host, puerto=80):
+        self.tag = tag  # Número de placa (PCB<tag>)
+        self.host = host
+        self.puerto = puerto
+        self.decodificador = DecodificadorLineas()
+        self.muestras = 0
+        self.conexiones = 0
+        self.fallos_conexion = 0
+        self.caidas = 0  # Conexiones perdidas por error de red o por silencio
+        self.conectado = False
+
+    @property
+    def nombre(self):
+        return f'PCB{self.tag}'
+
+    def resumen(self, duracion=None):
+        resumen = {'muestras': self.muestras, 'conexiones': self.conexiones,
+                   'fallos_conexion': self.fallos_conexion, 'caidas': self.caidas,
+                   **self.decodificador.resumen()}
+        if duracion:
+            resumen['tasa_hz'] = round(self.muestras / duracion, 1)
+        return resumen
+
+def parsear_nodo(texto, puerto=80):
+    """'PCB3=192.168.50.225:80' (o '3=...') -> NodoTag(3, '192.168.50.225', 80)."""
+    nombre, _, direccion = texto.partition('=')
+    numero = re.sub(r'\D', '', nombre)
+    if not numero or not direccion:
+        raise ValueError(f"Nodo no válido: '{texto}', se espera PCB<n>=ip[:puerto]")
+    host, _, puerto_texto = direccion.partition(':')
+    return NodoTag(int(numero), host, int(puerto_texto) if puerto_texto else puerto)
+
+def cargar_nodos(ruta):
+    """Lee los nodos de un .json {"PCB1": "192.168.50.225:80", ...}."""
+    with open(ruta) as f:
+        return [parsear_nodo(f'{nombre}={direccion}') for nombre, direccion in json.load(f).items()]
+
+class SalidaMulti:
+    """Reparte las filas de todos los nodos a un archivo combinado o a un archivo por tag."""
+
+    def __init__(self, directorio, nombre, nodos, por_tag=False, **opciones):
+        self.por_tag = por_tag
+        if por_tag:
+            self.grabadores = {nodo.tag: GrabadorDatos(directorio, f'{nombre}_{nodo.nombre}',
+                                                       CABECERAS_MULTI[1:], **opciones)
+                               for nodo in nodos}
+        else:
+            self.grabadores = {None: GrabadorDatos(directorio, nombre, CABECERAS_MULTI, **opciones)}
+
+    def escribir(self, nodo, filas):
+        """filas: lista de [Tag, Sample, Time (ms), 12 valores del ESP32]."""
+        if self.por_tag:
+            self.grabadores[nodo.tag].writerows(fila[1:] for fila in filas)
+        else:
+            self.grabadores[None].writerows(filas)
+
+    def cerrar(self):
+        """Cierra todos los grabadores y lanza el primer error después de cerrarlos."""
+        errores = []
+        for grabador in self.grabadores.values():
+            try:
+                grabador.cerrar()
+            except (RuntimeError, TimeoutError) as e:
+                errores.append(e)
+        if errores:
+            raise errores[0]
+
+    def archivos(self):
+        return [ruta for grabador in self.grabadores.values() for ruta in grabador.resumen()['archivos']]
+
+async def leer_nodo(nodo, salida, reloj, reintento=1.0, timeout_conexion=2.0, timeout_lectura=1.0,
+                    latencia=LatenciaNula()):
+    """Conecta con el nodo y escribe sus muestras hasta que se cancele la tarea, reconecta si se cae.
+
+    Una placa que sale de la red sin cerrar la conexión no manda FIN ni RST, si no llega nada en
+    timeout_lectura (s) la conexión se da por perdida y se reconecta.
+    """
+    while True:
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(nodo.host, nodo.puerto),
+                                                    timeout_conexion)
+        except (OSError, asyncio.TimeoutError):
+            nodo.fallos_conexion += 1
+            await asyncio.sleep(reintento)
+            continue
+
+        nodo.conexiones += 1
+        nodo.conectado = True
+        # Lo que quedó de una línea de la conexión anterior no se completa en la nueva
+        nodo.decodificador.pendiente = b''
+        try:
+            while True:
+                data = await asyncio.wait_for(reader.read(4096), timeout_lectura)
+                instante = latencia.ahora()
+                if not data:
+                    break
+                t_rx = reloj()
+                muestras = nodo.decodificador.alimentar(data)
+                latencia.registrar('parseo', instante, len(muestras))
+                if not len(muestras):
+                    continue
+                inicio = nodo.muestras
+                nodo.muestras += len(muestras)
+                salida.escribir(nodo, [[nodo.tag, inicio + k + 1, t_rx] + fila
+                                       for k, fila in enumerate(muestras.tolist())])
+                latencia.registrar('escritura', instante, len(muestras))
+        except (OSError, asyncio.TimeoutError):
+            nodo.caidas += 1
+        finally:
+            nodo.conectado = False
+            writer.close()
+        await asyncio.sleep(reintento)
+
+async def capturar_multi(nodos, salida, duracion=None, detener=None, reintento=1.0, mostrar=print,
+                         refresco=1.0, latencia=LatenciaNula()):
+    """Captura todos los nodos en el loop actual hasta duracion (s) o hasta que detener() sea True.
+
+    Devuelve {nombre del nodo: resumen} con la tasa de cada placa.
+    """
+    loop = asyncio.get_running_loop()
+    inicio = loop.time()
+    reloj = lambda: (loop.time() - inicio) * 1000  # ms desde el inicio, común a todos los tags
+
+    tareas = [asyncio.create_task(leer_nodo(nodo, salida, reloj, reintento, latencia=latencia))
+              for nodo in nodos]
+    consola = ConsolaLimitada(1 / refresco)
+    try:
+        while duracion is None or loop.time() - inicio < duracion:
+            if detener is not None and detener():
+                break
+            await asyncio.sleep(0.05)
+            consola.mostrar(lambda: mostrar(
+                f'{reloj() / 1000:7.1f} s | {sum(n.conectado for n in nodos)}/{len(nodos)} tags conectados | '
+                f'{sum(n.muestras for n in nodos)} muestras'))
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        consola.vaciar()
+
+    transcurrido = loop.time() - inicio
+    return {nodo.nombre: nodo.resumen(transcurrido) for nodo in nodos}
+
+# Nodos locales de prueba -------------------------------------------------------------------------
+
+async def _servidor_tag(reader, writer, tag, frecuencia):
+    """Manda líneas del firmware a la frecuencia dada con tiempos límite absolutos."""
+    loop = asyncio.get_running_loop()
+    inicio = loop.time()
+    k = 0
+    try:
+        while True:
+            k += 1
+            linea = f'{100 * tag + k % 100},{2000 + k % 100},90,0.01,-0.02,0.98,0.1,0.2,0.3,40.0,10.0,-30.0\r\n'
+            writer.write(linea.encode('utf-8'))
+            await writer.drain()
+            await asyncio.sleep(max(inicio + k / frecuencia - loop.time(), 0))
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    writer.close()
+
+async def _simular_nodos(cantidad, frecuencia, host='127.0.0.1'):
+    """Levanta cantidad servidores locales, devuelve (nodos, servidores)."""
+    nodos, servidores = [], []
+    for tag in range(1, cantidad + 1):
+        servidor = await asyncio.start_server(
+            lambda r, w, tag=tag: _servidor_tag(r, w, tag, frecuencia), host, 0)
+        servidores.append(servidor)
+        nodos.append(NodoTag(tag, host, servidor.sockets[0].getsockname()[1]))
+    return nodos, servidores
+
+async def _main(args):
+    servidores = []
+    if args.simular:
+        nodos, servidores = await _simular_nodos(args.simular, args.frecuencia)
+    else:
+        nodos = [parsear_nodo(texto) for texto in args.nodo]
+        if args.nodos:
+            nodos += cargar_nodos(args.nodos)
+    if not nodos:
+        raise SystemExit('No hay nodos, use --nodo, --nodos o --simular.')
+
+    salida = SalidaMulti(args.directorio, args.nombre, nodos, args.por_tag, binario=args.binario)
+    try:
+        resumen = await capturar_multi(nodos, salida, args.duracion)
+    finally:
+        salida.cerrar()
+        for servidor in servidores:
+            servidor.close()
+
+    for nombre, datos in resumen.items():
+        print(f'{nombre}: {datos}')
+    total = sum(datos['muestras'] for datos in resumen.values())
+    print(f'{total} muestras de {len(nodos)} tags -> {", ".join(salida.archivos())}')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Adquisición de varios nodos tag en un solo proceso.')
+    parser.add_argument('--nodo', action='append', default=[], help='PCB<n>=ip[:puerto], se puede repetir')
+    parser.add_argument('--nodos', help='Archivo .json {"PCB1": "ip:puerto", ...}')
+    parser.add_argument('--directorio', default='Datos', help='Carpeta de salida')
+    parser.add_argument('--nombre', default=time.strftime('multi_%Y%m%d_%H%M%S'), help='Nombre del archivo')
+    parser.add_argument('--por-tag', action='store_true', help='Un archivo por tag en lugar del combinado')
+    parser.add_argument('--binario', action='store_true', help='Copia binaria junto a cada .csv')
+    parser.add_argument('--duracion', type=float, default=None, help='Segundos de captura (Ctrl+C para detener)')
+    parser.add_argument('--simular', type=int, default=0, help='Levantar N nodos locales de prueba')
+    parser.add_argument('--frecuencia', type=float, default=100.0, help='Hz de cada nodo simulado')
+    args = parser.parse_args()
+    if args.simular and args.duracion is None:
+        args.duracion = 10.0
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
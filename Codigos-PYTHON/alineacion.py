@@ -0,0 +1,247 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: pre-procesamiento (alineación temporal)
+#
+# Descripcion: Los filtros suponen dt = 0.1 s, pero la columna Time (ms) avanza a saltos
+# irregulares (103 - 105 ms en la captura síncrona, huecos de más de 1 s en algunas sesiones) y
+# varias muestras del ESP32 que llegaron en el mismo recv quedan con el mismo tiempo. Además el
+# ESP32 y el Robotat se leen en momentos distintos dentro de cada ciclo. Esta etapa:
+#   - estima el retardo entre UWB y Optitrack por correlación cruzada de las velocidades (de un
+#     spline cúbico de cada fuente),
+#   - remuestrea todas las columnas a un reloj uniforme común con interpolación lineal
+#     vectorizada (todas las columnas de una fuente con los mismos índices y pesos),
+#   - calcula el dt real de cada muestra para los integradores que trabajan sin remuestrear
+#     (angulos_giroscopio y kalman_posicion aceptan dt por muestra).
+#
+# * Los archivos largos se procesan por bloques: el retardo se estima por ventanas (mediana) y el
+#   remuestreo llena la salida por bloques de la malla, con las columnas del cache en memory-map.
+# * Si el archivo trae ESP32_RX (ms) y Robotat_RX (ms) (captura asíncrona) se usan como tiempo de
+#   cada fuente, si no las dos usan Time (ms).
+# -------------------------------------------------------------------------------------------------
+
+import numpy as np
+from scipy.interpolate import CubicSpline
+from scipy.signal import correlate
+
+from cargador_datos import DT_NOMINAL_MS
+
+COLUMNAS_ESP32 = ('uwb_x', 'uwb_y', 'uwb_qf', 'ax', 'ay', 'az', 'gx', 'gy', 'gz', 'mx', 'my', 'mz')
+COLUMNAS_ROBOTAT = ('robotat_x', 'robotat_y', 'robotat_z', 'robotat_roll', 'robotat_pitch',
+                    'robotat_yaw')
+ANGULOS_ROBOTAT = ('robotat_roll', 'robotat_pitch', 'robotat_yaw')
+BLOQUE = 200_000  # Puntos de la malla por bloque de remuestreo
+
+def tiempos_estrictos(t_ms, dt_nominal_ms=DT_NOMINAL_MS):
+    """Tiempos (ms) estrictamente crecientes.
+
+    Las muestras que comparten tiempo (llegaron en el mismo recv) se reparten de forma uniforme
+    entre el tiempo distinto anterior y el suyo, la última conserva el tiempo registrado. Un
+    tiempo que retrocede se lleva al máximo anterior.
+    """
+    t = np.maximum.accumulate(np.asarray(t_ms, dtype=float))
+    if len(t) < 2:
+        return t
+    nuevo = np.concatenate(([True], np.diff(t) > 0))
+    grupo = np.cumsum(nuevo) - 1
+    inicios = np.flatnonzero(nuevo)
+    cuenta = np.diff(np.append(inicios, len(t)))
+    t_grupo = t[inicios]
+    t_previo = np.concatenate(([t_grupo[0] - dt_nominal_ms], t_grupo[:-1]))
+    rango = np.arange(len(t)) - inicios[grupo]
+    return t_previo[grupo] + (t_grupo[grupo] - t_previo[grupo]) * (rango + 1) / cuenta[grupo]
+
+def dt_por_muestra(t_ms, dt_nominal_ms=DT_NOMINAL_MS):
+    """Periodo real (s) de cada muestra, la primera usa el periodo nominal."""
+    t = tiempos_estrictos(t_ms, dt_nominal_ms)
+    return np.concatenate(([dt_nominal_ms], np.diff(t))) / 1000
+
+def _indices_pesos(t_fuente, t_malla):
+    """Índice izquierdo y peso de la interpolación lineal de cada punto de la malla."""
+    k = np.clip(np.searchsorted(t_fuente, t_malla, side='right') - 1, 0, len(t_fuente) - 2)
+    t0, t1 = t_fuente[k], t_fuente[k + 1]
+    w = np.clip((t_malla - t0) / (t1 - t0), 0.0, 1.0)
+    return k, w
+
+def interpolar(t_fuente, valores, t_malla, max_hueco_ms=None):
+    """Interpolación lineal de un arreglo (N, k) en los tiempos t_malla (M,), devuelve (M, k).
+
+    Los índices y pesos se calculan una sola vez para todas las columnas. Fuera del rango de
+    t_fuente se repite el extremo. Con max_hueco_ms los puntos que caen en un hueco más largo
+    quedan en NaN en lugar de inventar una recta.
+    """
+    valores = np.asarray(valores, dtype=float)
+    if valores.ndim == 1:
+        return interpolar(t_fuente, valores[:, np.newaxis], t_malla, max_hueco_ms)[:, 0]
+    k, w = _indices_pesos(t_fuente, t_malla)
+    w = w[:, np.newaxis]
+    salida = valores[k] * (1 - w) + valores[k + 1] * w
+    if max_hueco_ms is not None:
+        salida[(t_fuente[k + 1] - t_fuente[k]) > max_hueco_ms] = np.nan
+    return salida
+
+def _spline_posicion(t, x):
+    """Spline cúbico (N, k) de las filas finitas, su derivada es la velocidad en cualquier malla."""
+    validos = np.isfinite(x).all(axis=1)
+    if validos.sum() < 2:
+        raise ValueError('No hay suficientes muestras válidas para estimar el retardo')
+    return CubicSpline(t[validos], x[validos], axis=0)
+
+def estimar_retardo(t_a, a, t_b, b, paso_ms=10.0, max_retardo_ms=1000.0, ventana_ms=None):
+    """Retardo (ms) de la señal b respecto de a por correlación cruzada, b(t) ~ a(t - retardo).
+
+    a y b son arreglos (N, k) de posición (por ejemplo UWB y Robotat en xy). De cada una se ajusta
+    un spline cúbico y su derivada se evalúa en una malla fina de paso_ms (la velocidad tiene un
+    pico de correlación más angosto que la posición), se normaliza por eje y se suman las
+    correlaciones de todos los ejes. El pico se refina con una parábola. Con ventana_ms el archivo
+    se parte en ventanas y se devuelve la mediana de los retardos de cada ventana (y la lista),
+    así un archivo largo no se correlaciona completo y una deriva lenta del reloj no ensancha el
+    pico.
+
+    Con interpolación lineal la velocidad es escalonada con los quiebres en las muestras, y si las
+    dos fuentes comparten los tiempos de muestreo la correlación se pega a los retardos múltiplos
+    del periodo (50 ms salían como 12 ms, 230 ms como 205 - 211 ms). La correlación se divide
+    entre el traslape de cada desplazamiento, sin eso la rampa de la correlación completa jalaba
+    el pico hacia 0 (en ventanas de 60 s, 50 ms salían como 24.5 ms). Con el spline cúbico y esa
+    normalización, a muestras de ~100 ms y sin ruido, el error que queda es de 0.2 - 3 ms según
+    la señal, con ventanas de 60 s o con el archivo completo. Con ruido la dispersión entre
+    ventanas domina, por eso conviene usar ventana_ms y la mediana.
+    """
+    t_a = tiempos_estrictos(t_a)
+    t_b = tiempos_estrictos(t_b)
+    a = np.asarray(a, dtype=float).reshape(len(t_a), -1)
+    b = np.asarray(b, dtype=float).reshape(len(t_b), -1)
+    inicio, fin = max(t_a[0], t_b[0]), min(t_a[-1], t_b[-1])
+    if fin - inicio < 2 * max_retardo_ms:
+        raise ValueError('El traslape entre las dos fuentes es muy corto para estimar el retardo')
+
+    spline_a, spline_b = _spline_posicion(t_a, a), _spline_posicion(t_b, b)
+    ventana_ms = ventana_ms or fin - inicio
+    bordes = np.arange(inicio, fin, ventana_ms)
+    retardos = []
+    for desde in bordes:
+        hasta = min(desde + ventana_ms, fin)
+        if hasta - desde < 2 * max_retardo_ms:
+            continue
+        malla = np.arange(desde, hasta, paso_ms)
+        seg_a = spline_a(malla, 1)
+        seg_b = spline_b(malla, 1)
+        retardo = _retardo_correlacion(seg_a, seg_b, int(max_retardo_ms // paso_ms))
+        if retardo is not None:
+            retardos.append(retardo * paso_ms)
+
+    if not retardos:
+        raise ValueError('No hay ventanas con movimiento suficiente para estimar el retardo')
+    return float(np.median(retardos)), retardos
+
+def _retardo_correlacion(a, b, max_pasos):
+    """Desplazamiento (en pasos, con parábola) que maximiza la correlación de b contra a."""
+    validos = np.isfinite(a).all(axis=1) & np.isfinite(b).all(axis=1)
+    a = np.where(validos[:, np.newaxis], a, 0.0)
+    b = np.where(validos[:, np.newaxis], b, 0.0)
+    a = a - a.mean(axis=0)
+    b = b - b.mean(axis=0)
+    escala = np.linalg.norm(a, axis=0) * np.linalg.norm(b, axis=0)
+    if not (escala > 0).any():
+        return None
+
+    n = len(a)
+    correlacion = np.zeros(2 * n - 1)
+    for k in np.flatnonzero(escala > 0):
+        correlacion += correlate(b[:, k], a[:, k], mode='full', method='fft') / escala[k]
+    desplazamientos = np.arange(-(n - 1), n)
+    rango = np.abs(desplazamientos) <= max_pasos
+    correlacion, desplazamientos = correlacion[rango], desplazamientos[rango]
+    # Estimador sin sesgo: cada desplazamiento se divide entre los puntos que se traslapan, si no
+    # la rampa triangular de 'full' jala el pico hacia 0
+    correlacion = correlacion / (n - np.abs(desplazamientos))
+
+    pico = int(np.argmax(correlacion))
+    if pico == 0 or pico == len(correlacion) - 1:
+        # El máximo en el borde del rango no es un pico, las señales no se parecen
+        return None
+    y0, y1, y2 = correlacion[pico - 1:pico + 2]
+    denominador = y0 - 2 * y1 + y2
+    ajuste = 0.5 * (y0 - y2) / denominador if denominador != 0 else 0.0
+    return desplazamientos[pico] + ajuste
+
+def remuestrear(t_fuente, columnas, t_malla, angulos=(), max_hueco_ms=None, bloque=BLOQUE,
+                salida=None):
+    """Remuestrea un diccionario de columnas de la misma fuente a los tiempos t_malla.
+
+    Las columnas en angulos (grados) se desenvuelven antes de interpolar y se vuelven a envolver a
+    [-180, 180). La malla se recorre por bloques y solo se lee el tramo de la fuente que cubre cada
+    bloque, salida permite pasar arreglos ya asignados (por ejemplo memory-maps).
+    """
+    nombres = list(columnas)
+    m = len(t_malla)
+    if salida is None:
+        salida = {nombre: np.empty(m) for nombre in nombres}
+
+    for desde in range(0, m, bloque):
+        hasta = min(desde + bloque, m)
+        malla = t_malla[desde:hasta]
+        # Tramo de la fuente que rodea al bloque (un punto extra a cada lado)
+        n = len(t_fuente)
+        i0 = min(max(np.searchsorted(t_fuente, malla[0], side='right') - 1, 0), n - 2)
+        i1 = min(max(np.searchsorted(t_fuente, malla[-1], side='left') + 1, i0 + 2), n)
+        valores = np.column_stack([np.asarray(columnas[n][i0:i1], dtype=float) for n in nombres])
+        for j, nombre in enumerate(nombres):
+            if nombre in angulos:
+                # Desenvolver sin propagar los NaN del Robotat
+                finitos = np.isfinite(valores[:, j])
+                valores[finitos, j] = np.rad2deg(np.unwrap(np.deg2rad(valores[finitos, j])))
+        interpolados = interpolar(t_fuente[i0:i1], valores, malla, max_hueco_ms)
+        for j, nombre in enumerate(nombres):
+            columna = interpolados[:, j]
+            if nombre in angulos:
+                columna = (columna + 180) % 360 - 180
+            salida[nombre][desde:hasta] = columna
+    return salida
+
+def alinear_dataset(data, dt=0.1, retardo='auto', max_hueco_ms=None, ventana_ms=60_000.0,
+                    bloque=BLOQUE):
+    """Lleva un dataset canónico (cargar_dataset) a un reloj uniforme de periodo dt (s).
+
+    retardo es el retardo del UWB respecto de Optitrack en ms: 'auto' lo estima por correlación
+    cruzada en xy (si no hay un pico claro no se corrige), un número lo aplica directo y None no
+    corrige. Las columnas del Robotat se desplazan por ese retardo antes de remuestrear.
+    Devuelve (datos, info) donde datos tiene las mismas columnas canónicas (tiempo_ms uniforme y
+    muestra consecutiva) e info el retardo aplicado, las estimaciones por ventana y la
+    estadística de los periodos originales.
+    """
+    dt_ms = dt * 1000
+    t_ref = np.asarray(data['tiempo_ms'], dtype=float)
+    t_esp32 = np.asarray(data['esp32_rx_ms'], dtype=float)
+    t_robotat = np.asarray(data['robotat_rx_ms'], dtype=float)
+    t_esp32 = tiempos_estrictos(t_ref if np.isnan(t_esp32).any() else t_esp32, dt_ms)
+    t_robotat = tiempos_estrictos(t_ref if np.isnan(t_robotat).any() else t_robotat, dt_ms)
+
+    robotat = not np.isnan(data['robotat_x']).all()
+    info = {'retardo_ms': 0.0, 'retardos_ventana_ms': [], 'dt_medio_ms': float(np.mean(np.diff(t_esp32))),
+            'dt_max_ms': float(np.max(np.diff(t_esp32)))}
+    if robotat and retardo == 'auto':
+        uwb = np.column_stack((data['uwb_x'], data['uwb_y']))
+        mocap = np.column_stack((data['robotat_x'], data['robotat_y']))
+        try:
+            info['retardo_ms'], info['retardos_ventana_ms'] = estimar_retardo(
+                t_robotat, mocap, t_esp32, uwb, ventana_ms=ventana_ms)
+        except ValueError as e:
+            print(f'No se corrige el retardo: {e}')
+    elif robotat and retardo is not None:
+        info['retardo_ms'] = float(retardo)
+
+    # Reloj común desde el inicio del ESP32, la pose del Optitrack se adelanta por el retardo
+    t_malla = np.arange(t_esp32[0], t_esp32[-1] + dt_ms / 2, dt_ms)
+    m = len(t_malla)
+    datos = {'muestra': np.arange(1, m + 1, dtype=np.float64), 'tiempo_ms': t_malla,
+             'esp32_rx_ms': t_malla.copy(), 'robotat_rx_ms': np.full(m, np.nan)}
+    datos.update(remuestrear(t_esp32, {c: data[c] for c in COLUMNAS_ESP32}, t_malla,
+                             max_hueco_ms=max_hueco_ms, bloque=bloque))
+    if robotat:
+        datos.update(remuestrear(t_robotat + info['retardo_ms'], {c: data[c] for c in COLUMNAS_ROBOTAT},
+                                 t_malla, ANGULOS_ROBOTAT, max_hueco_ms, bloque))
+    else:
+        datos.update({c: np.full(m, np.nan) for c in COLUMNAS_ROBOTAT})
+    datos['uwb_qf'] = datos['uwb_qf'].astype(np.float32)
+    return datos, info
@@ -0,0 +1,134 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de visualización
+#
+# Descripcion: Animación con blitting para los códigos de post-procesamiento (V0.0 - V0.2). Antes
+# cada cuadro limpiaba los ejes con cla(), volvía a crear todos los quiver, límites y leyendas y
+# redibujaba toda la trayectoria, así que cada cuadro costaba O(i) y toda la animación O(n^2).
+# Aquí los artistas se crean una sola vez y en cada cuadro solo se actualizan sus datos, con
+# blit=True matplotlib solo vuelve a pintar lo que cambia encima de un fondo guardado.
+#
+# * Las matrices de rotación de todas las muestras se pasan precalculadas (eul2rot / rotz).
+# * La trayectoria completa se dibuja una vez en el fondo (tenue) y encima se anima una cola de
+#   las últimas muestras de largo fijo, así el costo por cuadro no depende de i.
+# * Los ejes 3D tienen la vista fija como antes (view_init en cada cuadro), por eso se desactiva
+#   la rotación con el mouse, que invalidaría el fondo guardado.
+# * La tecla espacio pausa / continúa la animación.
+# -------------------------------------------------------------------------------------------------
+
+import numpy as np
+from matplotlib.animation import FuncAnimation
+
+class AnimacionPose:
+    """Artistas de una animación de pose que se actualizan en su lugar cuadro a cuadro."""
+
+    def __init__(self, fig, dt=0.1, cola=200):
+        self.fig = fig
+        self.dt = dt
+        self.cola = cola
+        self.actualizadores = []
+        self.artistas = []
+        self.num_frames = None
+        self.ani = None
+        self.pausado = False
+
+    def _registrar(self, num_muestras, actualizador, artistas):
+        self.num_frames = num_muestras if self.num_frames is None else min(self.num_frames, num_muestras)
+        self.actualizadores.append(actualizador)
+        for artista in artistas:
+            artista.set_animated(True)
+            self.artistas.append(artista)
+
+    def configurar_3d(self, ax3d, limite=1.0, elev=20., azim=30, titulo=None):
+        """Límites y vista fijos de un eje 3D (se configuran una sola vez)."""
+        ax3d.view_init(elev=elev, azim=azim)
+        ax3d.set_xlim([-limite, limite])
+        ax3d.set_ylim([-limite, limite])
+        ax3d.set_zlim([-limite, limite])
+        ax3d.set_xlabel('X')
+        ax3d.set_ylabel('Y')
+        ax3d.set_zlabel('Z')
+        if titulo:
+            ax3d.set_title(titulo)
+        ax3d.disable_mouse_rotation()
+
+    def agregar_marco(self, ax3d, R_frames, colores=('r', 'g', 'b'), etiquetas=None, longitud=1.0,
+                      estilo_ref='-', estilo='--'):
+        """Marco de referencia fijo y marco rotado animado a partir de R_frames (N, 3, 3).
+
+        Las columnas de cada matriz son los ejes X, Y, Z rotados.
+        """
+        R_frames = np.asarray(R_frames) * longitud
+        etiquetas = etiquetas or (None, None, None)
+        lineas = []
+        for k, (color, etiqueta) in enumerate(zip(colores, etiquetas)):
+            # Eje de referencia, forma parte del fondo
+            ref = np.zeros(3)
+            ref[k] = longitud
+            ax3d.plot([0, ref[0]], [0, ref[1]], [0, ref[2]], color=color, linestyle=estilo_ref, label=etiqueta)
+            # Eje rotado, se actualiza en cada cuadro
+            linea, = ax3d.plot([0, 0], [0, 0], [0, 0], color=color, linestyle=estilo)
+            lineas.append(linea)
+        if any(etiquetas):
+            ax3d.legend()
+
+        def actualizar(i):
+            for k, linea in enumerate(lineas):
+                linea.set_data_3d([0, R_frames[i, 0, k]], [0, R_frames[i, 1, k]], [0, R_frames[i, 2, k]])
+
+        self._registrar(len(R_frames), actualizar, lineas)
+
+    def agregar_trayectoria(self, ax, x, y, color='r', etiqueta=None, marcador='o', cola=None,
+                            completa=True):
+        """Trayectoria (x, y) con la posición actual y una cola de las últimas muestras."""
+        x = np.asarray(x)
+        y = np.asarray(y)
+        cola = self.cola if cola is None else cola
+        if completa:
+            ax.plot(x, y, color=color, alpha=0.15, linewidth=1)
+        estela, = ax.plot([], [], color=color, linestyle='-', marker=marcador, markersize=3, label=etiqueta)
+        actual, = ax.plot([], [], color=color, marker=marcador, markersize=8, linestyle='none')
+
+        def actualizar(i):
+            inicio = max(0, i + 1 - cola)
+            estela.set_data(x[inicio:i + 1], y[inicio:i + 1])
+            actual.set_data(x[i:i + 1], y[i:i + 1])
+
+        self._registrar(len(x), actualizar, (estela, actual))
+
+    def agregar_texto(self, ax, posicion=(0.05, 0.95)):
+        """Texto con el número de muestra y el tiempo transcurrido."""
+        if hasattr(ax, 'text2D'):
+            texto = ax.text2D(*posicion, '', transform=ax.transAxes)
+        else:
+            texto = ax.text(*posicion, '', transform=ax.transAxes)
+
+        def actualizar(i):
+            texto.set_text(f'Muestra: {i+1}, Tiempo: {i * self.dt:.2f} s')
+
+        self.actualizadores.append(actualizar)
+        texto.set_animated(True)
+        self.artistas.append(texto)
+
+    def update(self, i):
+        """Actualiza los datos de todos los artistas para el cuadro i y los devuelve para blit."""
+        for actualizar in self.actualizadores:
+            actualizar(i)
+        return self.artistas
+
+    def _on_key(self, event):
+        if event.key == ' ' and self.ani is not None:
+            self.pausado = not self.pausado
+            if self.pausado:
+                self.ani.pause()
+            else:
+                self.ani.resume()
+
+    def animar(self, frames=None, interval=None):
+        """Crea la FuncAnimation con blit, intervalo de dt para reproducir en tiempo real."""
+        self.fig.canvas.mpl_connect('key_press_event', self._on_key)
+        self.ani = FuncAnimation(self.fig, self.update, frames=frames or self.num_frames,
+                                 init_func=lambda: self.artistas,
+                                 interval=interval or self.dt * 1000, blit=True)
+        return self.ani
@@ -0,0 +1,293 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: ajuste de parámetros (barrido)
+#
+# Descripcion: Barrido de las constantes de los filtros complementarios contra el Robotat. Las
+# constantes estaban fijas en los códigos (fc = 0.1 Hz y la mezcla de yaw 0.98 / 0.02 de los
+# códigos 0 y 2, alpha_pos = 0.9 del código 4, tau = 1 s de DYNAMIC_Plotting_CompFilt_POS.m) y
+# para probar otras había que editar y volver a correr a mano. Por cada dataset las partes que no
+# dependen de los parámetros (tilt del acelerómetro, giroscopio integrado, yaw del magnetómetro,
+# UWB y aceleración en mm/s²) se calculan una sola vez y después:
+#   - fc: cada valor necesita su propio Butterworth, se filtran todas las columnas de una vez,
+#   - peso_yaw: la mezcla es lineal, todos los pesos de un fc se evalúan con broadcasting en un
+#     arreglo (N, pesos) y el error envuelto se reduce por columna. Como el marco del
+#     magnetómetro no coincide con el de Optitrack, además del RMSE del yaw se reporta
+#     yaw_rmse_centrado (sin el desfase medio circular del error). Con peso_yaw = 1 el yaw no
+#     depende de fc, por eso la clasificación por defecto es angulos_rmse (RMS de roll, pitch y
+#     yaw centrado), tilt_rmse junta solo roll y pitch,
+#   - alpha de posición, se barren los dos filtros de posición que existen:
+#       compfilt_pos: la recursión de DYNAMIC_Plotting_CompFilt_POS.m (alpha = tau / (tau + dt)),
+#         cada valor es un par de lfilter de primer orden sobre los dos ejes,
+#       codigo4: la mezcla de 4_UWB_OPTI_DATAFETCH.py, pos = alpha_pos * UWB con homografía +
+#         (1 - alpha_pos) * a * 9.8 (en metros), sin estado, todos los alpha con broadcasting.
+#     El alpha ganador de cada filtro solo sirve para ese filtro.
+# Los archivos se reparten en un pool de procesos. La orientación y la posición no comparten
+# parámetros, así que se barren por separado (no se evalúa el producto de las dos mallas).
+#
+# * alpha y alpha_yaw del código 4 ya no existen, el código 4 usa FiltroComplementarioContinuo
+#   con fc y peso_yaw, con --causal se barre esa versión (sosfilt) en lugar de filtfilt.
+# * Salidas: barrido_orientacion.csv y barrido_posicion.csv (una fila por archivo y combinación)
+#   y la clasificación por mediana entre archivos.
+# * La posición se compara en el marco de Optitrack con la homografía de calibración
+#   (cargar_homografia). Con --sin-homografia el UWB queda en su propio marco, la tabla se guarda
+#   pero la posición no se clasifica.
+# * Uso: python barrido.py --fc 0.02 0.05 0.1 0.2 --peso-yaw 0.8 0.9 0.95 0.98 0.99
+# -------------------------------------------------------------------------------------------------
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy.signal import filtfilt
+
+from alineacion import alinear_dataset
+from cargador_datos import cargar_dataset
+from evaluacion import _orden_natural, envolver_angulo, r2_plano, recursion_complementaria
+from homografia import aplicar_homografia
+from orientacion import (angulos_acelerometro, angulos_giroscopio, angulos_magnetometro,
+                         disenar_filtros, disenar_filtros_sos, filtrar_causal)
+from procesamiento_lote import RAIZ_DATASETS, buscar_datasets
+
+# Mallas por defecto, incluyen los valores fijos de los códigos 0 - 4
+FC = (0.02, 0.05, 0.1, 0.2, 0.5)
+PESOS_YAW = (0.5, 0.8, 0.9, 0.95, 0.98, 0.99, 1.0)
+ALPHAS = (0.5, 0.7, 0.8, 0.9, 0.95, 0.98, 0.99)
+FILTROS_POSICION = ('compfilt_pos', 'codigo4')
+
+PARAMETROS = {'orientacion': ['fc', 'peso_yaw'], 'posicion': ['filtro', 'alpha']}
+
+def precalcular(data, dt=0.1):
+    """Partes del filtro que no dependen de los parámetros, una vez por dataset."""
+    yaw_inicial = None if np.isnan(data['robotat_yaw'][0]) else data['robotat_yaw'][0]
+    acc = np.column_stack((data['ax'], data['ay'])).astype(float)
+    return {
+        'accel_ang': angulos_acelerometro(data['ax'], data['ay'], data['az'])[:, :2],
+        'gyro_ang': angulos_giroscopio(data['gx'], data['gy'], data['gz'], dt, yaw_inicial),
+        'mag_yaw': angulos_magnetometro(data['mx'], data['my'])[:, 2],
+        'ref_ang': np.column_stack((data['robotat_roll'], data['robotat_pitch'],
+                                    data['robotat_yaw'])).astype(float),
+        'uwb': np.column_stack((data['uwb_x'], data['uwb_y'])).astype(float),
+        # Aceleración de g a mm/s² sin el sesgo estático (igual que complementario_posicion)
+        'acc': (acc - acc.mean(axis=0)) * 9800,
+        # Término del código 4 (a * 9.8 sumado a la posición en metros) llevado a mm
+        'acc_codigo4': acc * 9.8 * 1000,
+        'ref_pos': np.column_stack((data['robotat_x'], data['robotat_y'])).astype(float),
+    }
+
+def _rmse_columnas(error):
+    """RMSE y MAE de cada columna ignorando NaN."""
+    with np.errstate(invalid='ignore'):
+        return np.sqrt(np.nanmean(error**2, axis=0)), np.nanmean(np.abs(error), axis=0)
+
+def _centrar_angulo(error):
+    """Error angular (N, k) sin su media circular por columna (desfase constante entre marcos)."""
+    fasor = np.exp(1j * np.deg2rad(error))
+    with np.errstate(invalid='ignore'):
+        desfase = np.rad2deg(np.angle(np.nanmean(fasor, axis=0)))
+    return envolver_angulo(error - desfase), desfase
+
+def barrer_orientacion(partes, fcs=FC, pesos_yaw=PESOS_YAW, dt=0.1, causal=False):
+    """Una fila por (fc, peso_yaw) con el error de roll, pitch y yaw contra el Robotat (grados)."""
+    pesos = np.asarray(pesos_yaw, dtype=float)
+    ref = partes['ref_ang']
+    gyro_z = partes['gyro_ang'][:, 2]
+    # Pasa bajas: tilt x, y y yaw del magnetómetro, pasa altas: giroscopio x, y
+    bajas_entrada = np.column_stack((partes['accel_ang'], partes['mag_yaw']))
+    altas_entrada = partes['gyro_ang'][:, :2]
+
+    filas = []
+    for fc in fcs:
+        if causal:
+            sos_lp, sos_hp = disenar_filtros_sos(dt, fc)
+            bajas = filtrar_causal(sos_lp, bajas_entrada)
+            altas = filtrar_causal(sos_hp, altas_entrada)
+        else:
+            b, a, d, c = disenar_filtros(dt, fc)
+            bajas = filtfilt(b, a, bajas_entrada, axis=0)
+            altas = filtfilt(d, c, altas_entrada, axis=0)
+
+        # Roll y pitch no dependen del peso del yaw
+        rmse_tilt, mae_tilt = _rmse_columnas(envolver_angulo(altas + bajas[:, :2] - ref[:, :2]))
+        # Yaw de todos los pesos a la vez: (N, pesos)
+        yaw = gyro_z[:, np.newaxis] * pesos + bajas[:, 2:3] * (1 - pesos)
+        error_yaw = envolver_angulo(yaw - ref[:, 2:3])
+        rmse_yaw, mae_yaw = _rmse_columnas(error_yaw)
+        centrado, desfase = _centrar_angulo(error_yaw)
+        rmse_centrado, _ = _rmse_columnas(centrado)
+
+        tilt_cuadrado = rmse_tilt[0]**2 + rmse_tilt[1]**2
+        angulos_rmse = np.sqrt((tilt_cuadrado + rmse_centrado**2) / 3)
+
+        for k, peso in enumerate(pesos):
+            filas.append({'fc': fc, 'peso_yaw': peso, 'angulos_rmse': angulos_rmse[k],
+                          'tilt_rmse': np.sqrt(tilt_cuadrado / 2), 'yaw_rmse_centrado': rmse_centrado[k],
+                          'yaw_desfase': desfase[k], 'yaw_rmse': rmse_yaw[k], 'yaw_mae': mae_yaw[k],
+                          'roll_rmse': rmse_tilt[0], 'pitch_rmse': rmse_tilt[1],
+                          'roll_mae': mae_tilt[0], 'pitch_mae': mae_tilt[1]})
+    return filas
+
+def _fila_posicion(filtro, alpha, estimado, ref):
+    rmse, mae = _rmse_columnas(estimado - ref)
+    return {'filtro': filtro, 'alpha': alpha, 'rmse_x': rmse[0], 'rmse_y': rmse[1], 'mae_x': mae[0],
+            'mae_y': mae[1], 'rmse_xy': float(np.sqrt(np.mean(rmse**2))), 'r2_xy': r2_plano(estimado, ref)}
+
+def barrer_posicion(partes, alphas=ALPHAS, dt=0.1, H=None, filtros=FILTROS_POSICION):
+    """Una fila por (filtro, alpha) con el error de posición contra el Robotat (mm)."""
+    ref = partes['ref_pos']
+    filas = []
+    if 'compfilt_pos' in filtros:
+        for alpha in alphas:
+            estimado = recursion_complementaria(partes['uwb'], partes['acc'], alpha, dt)
+            if H is not None:
+                estimado = aplicar_homografia(estimado, H)
+            filas.append(_fila_posicion('compfilt_pos', alpha, estimado, ref))
+    if 'codigo4' in filtros:
+        # En el código 4 la homografía se aplica antes de mezclar, todos los alpha a la vez: (alphas, N, 2)
+        uwb = aplicar_homografia(partes['uwb'], H) if H is not None else partes['uwb']
+        pesos = np.asarray(alphas, dtype=float)[:, np.newaxis, np.newaxis]
+        estimados = pesos * uwb + (1 - pesos) * partes['acc_codigo4']
+        for alpha, estimado in zip(alphas, estimados):
+            filas.append(_fila_posicion('codigo4', alpha, estimado, ref))
+    return filas
+
+def barrer_archivo(ruta, fcs=FC, pesos_yaw=PESOS_YAW, alphas=ALPHAS, dt=0.1, causal=False, H=None,
+                   raiz=RAIZ_DATASETS, usar_cache=True, alinear=False, filtros=FILTROS_POSICION):
+    """Barrido completo de un dataset, devuelve (filas de orientación, filas de posición, error)."""
+    archivo = os.path.relpath(ruta, raiz)
+    try:
+        data = cargar_dataset(ruta, usar_cache=usar_cache)
+        if alinear:
+            data, _ = alinear_dataset(data, dt)
+        n = len(data['uwb_x'])
+        if n < 10:
+            raise ValueError(f'Muy pocas muestras ({n}) para filtfilt')
+        if np.isnan(data['robotat_yaw']).all():
+            raise ValueError('El dataset no tiene columnas de Optitrack (Robotat)')
+        partes = precalcular(data, dt)
+        orientacion = barrer_orientacion(partes, fcs, pesos_yaw, dt, causal)
+        posicion = barrer_posicion(partes, alphas, dt, H, filtros)
+    except Exception as e:
+        # Aislar el error del archivo para que el resto del lote continúe
+        return [], [], f'{archivo}: {type(e).__name__}: {e}'
+
+    for fila in orientacion + posicion:
+        fila['archivo'] = archivo
+        fila['muestras'] = n
+    return orientacion, posicion, ''
+
+def barrer_lote(archivos, fcs=FC, pesos_yaw=PESOS_YAW, alphas=ALPHAS, workers=None, dt=0.1,
+                causal=False, H=None, raiz=RAIZ_DATASETS, usar_cache=True, alinear=False,
+                filtros=FILTROS_POSICION):
+    """Barre los archivos en un pool de procesos.
+
+    Devuelve ({'orientacion': DataFrame, 'posicion': DataFrame}, errores), las tablas tienen una
+    fila por archivo y combinación de parámetros.
+    """
+    workers = workers or min(4, os.cpu_count() or 1)
+    total = len(archivos)
+    orientacion, posicion, errores = [], [], []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = {pool.submit(barrer_archivo, ruta, fcs, pesos_yaw, alphas, dt, causal, H, raiz,
+                               usar_cache, alinear, filtros): ruta for ruta in archivos}
+        for k, futuro in enumerate(as_completed(futuros), start=1):
+            ruta = futuros[futuro]
+            try:
+                filas_orientacion, filas_posicion, error = futuro.result()
+            except Exception as e:
+                # Falla del proceso trabajador (por ejemplo, memoria), no del archivo
+                filas_orientacion, filas_posicion = [], []
+                error = f'{os.path.relpath(ruta, raiz)}: {type(e).__name__}: {e}'
+            orientacion += filas_orientacion
+            posicion += filas_posicion
+            if error:
+                errores.append(error)
+            print(f"[{k}/{total}] {os.path.relpath(ruta, raiz)} -> {'error' if error else 'ok'}")
+
+    tablas = {}
+    for familia, filas in (('orientacion', orientacion), ('posicion', posicion)):
+        parametros = PARAMETROS[familia]
+        tabla = pd.DataFrame(filas)
+        if len(tabla):
+            columnas = ['archivo'] + parametros + [c for c in tabla.columns if c not in ['archivo'] + parametros]
+            orden = tabla['archivo'].map(_orden_natural)
+            indices = sorted(range(len(tabla)), key=lambda i: (orden[i], *tabla.loc[i, parametros]))
+            tabla = tabla.iloc[indices][columnas].reset_index(drop=True)
+        tablas[familia] = tabla
+    return tablas, errores
+
+def clasificar(tabla, parametros, metrica, mayor_es_mejor=False):
+    """Mediana y media de la métrica entre archivos por combinación, ordenadas de mejor a peor."""
+    grupos = tabla.groupby(parametros)[metrica]
+    ranking = grupos.agg(['median', 'mean', 'count'])
+    ranking.columns = [f'{metrica}_mediana', f'{metrica}_media', 'archivos']
+    ranking = ranking.sort_values(f'{metrica}_mediana', ascending=not mayor_es_mejor)
+    ranking.insert(0, 'puesto', np.arange(1, len(ranking) + 1))
+    return ranking.reset_index()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Barrido de las constantes de los filtros complementarios.')
+    parser.add_argument('--raiz', default=RAIZ_DATASETS, help='Carpeta Datasets')
+    parser.add_argument('--carpetas', nargs='+', default=['Dinamico'], help='Subcarpetas de Datasets')
+    parser.add_argument('--fc', nargs='+', type=float, default=list(FC), help='Frecuencias de corte (Hz)')
+    parser.add_argument('--peso-yaw', nargs='+', type=float, default=list(PESOS_YAW),
+                        help='Pesos del giroscopio en el yaw')
+    parser.add_argument('--alpha', nargs='+', type=float, default=list(ALPHAS),
+                        help='alpha de los filtros de posición')
+    parser.add_argument('--filtros-posicion', nargs='+', default=list(FILTROS_POSICION),
+                        choices=FILTROS_POSICION,
+                        help='compfilt_pos (CompFilt_POS.m) y / o codigo4 (alpha_pos del código 4)')
+    parser.add_argument('--causal', action='store_true', help='Barrer la versión causal (en vivo)')
+    parser.add_argument('--sin-homografia', action='store_true',
+                        help='No pasar el UWB por la homografía (la posición no se clasifica)')
+    parser.add_argument('--alinear', action='store_true',
+                        help='Remuestrear a dt uniforme y corregir el retardo UWB - Optitrack')
+    parser.add_argument('--workers', type=int, default=None, help='Número de procesos (máximo)')
+    parser.add_argument('--dt', type=float, default=0.1, help='Periodo de muestreo (s)')
+    parser.add_argument('--metrica-orientacion', default='angulos_rmse',
+                        choices=['angulos_rmse', 'tilt_rmse', 'roll_rmse', 'pitch_rmse',
+                                 'yaw_rmse_centrado', 'yaw_rmse', 'yaw_mae'],
+                        help='Métrica para clasificar la orientación')
+    parser.add_argument('--mejores', type=int, default=10, help='Combinaciones a mostrar')
+    parser.add_argument('--salida', default='barrido', help='Carpeta de las tablas')
+    parser.add_argument('--sin-cache', action='store_true', help='No usar el cache binario')
+    args = parser.parse_args()
+
+    H = None
+    if not args.sin_homografia:
+        from homografia import cargar_homografia
+        H = cargar_homografia()
+
+    archivos = buscar_datasets(args.raiz, args.carpetas)
+    combinaciones = len(args.fc) * len(args.peso_yaw) + len(args.alpha) * len(args.filtros_posicion)
+    print(f'Se encontraron {len(archivos)} archivos .csv, {combinaciones} combinaciones por archivo')
+
+    inicio = time.perf_counter()
+    tablas, errores = barrer_lote(archivos, args.fc, args.peso_yaw, args.alpha, args.workers,
+                                  args.dt, args.causal, H, args.raiz, not args.sin_cache, args.alinear,
+                                  args.filtros_posicion)
+
+    os.makedirs(args.salida, exist_ok=True)
+    rankings = {'orientacion': (args.metrica_orientacion, False), 'posicion': ('rmse_xy', False)}
+    for familia, tabla in tablas.items():
+        tabla.to_csv(os.path.join(args.salida, f'barrido_{familia}.csv'), index=False)
+        if not len(tabla):
+            continue
+        if familia == 'posicion' and H is None:
+            # UWB y Optitrack en marcos distintos, el error es el desfase entre marcos y no del filtro
+            print('\nposicion: sin homografía no se clasifica (UWB y Optitrack en marcos distintos)')
+            continue
+        metrica, mayor_es_mejor = rankings[familia]
+        ranking = clasificar(tabla, PARAMETROS[familia], metrica, mayor_es_mejor)
+        ranking.to_csv(os.path.join(args.salida, f'ranking_{familia}.csv'), index=False)
+        print(f'\n{familia} (por {metrica}):')
+        print(ranking.head(args.mejores).to_string(index=False, float_format=lambda v: f'{v:.3f}'))
+
+    for error in errores:
+        print(f'ERROR {error}')
+    print(f'\n{len(archivos) - len(errores)} archivos barridos, {len(errores)} con error, '
+          f'{time.perf_counter() - inicio:.1f} s. Tablas en {args.salida}')
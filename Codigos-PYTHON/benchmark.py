@@ -0,0 +1,243 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: benchmark
+#
+# Descripcion: Mide cómo escalan las rutas de procesamiento con grabaciones sintéticas de UWB +
+# IMU de 9 DOF + Optitrack de 10^3 a 10^7 muestras. Para cada ruta se mide el tiempo (mejor de
+# varias repeticiones) y el pico de memoria con tracemalloc (en una corrida aparte para que no
+# afecte el tiempo), y se calcula cuántas veces más rápido que el tiempo real corre: duración de
+# la grabación a 10 Hz entre tiempo de procesamiento. Con x_tiempo_real < 1 la ruta ya no alcanza
+# a procesar los datos al ritmo en que llegan.
+#
+# * Rutas: filtro complementario (V0.0 / V0.2), filtro de Kalman (V0.1), homografía (V0.4),
+#   decodificador del flujo del ESP32 (V0.3 - V0.5) y escritura del CSV (V0.3).
+# * Los resultados se agregan a un .csv con la versión (git describe) para comparar versiones.
+# * Uso: python benchmark.py --max 1e6
+#        python benchmark.py --max 1e7 --rutas complementario kalman homografia
+#        python benchmark.py --comparar
+# -------------------------------------------------------------------------------------------------
+
+import argparse
+import csv
+import datetime
+import gc
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from filtro_kalman import kalman_posicion
+from flujo_esp32 import DecodificadorLineas
+from homografia import H_MATLAB, aplicar_homografia
+from orientacion import calcular_orientacion
+
+DT = 0.1
+BLOQUE = 100_000  # Muestras por bloque en las rutas que trabajan por flujo (parser y CSV)
+ARCHIVO_RESULTADOS = 'resultados_benchmark.csv'
+
+def generar_sesion(n, dt=DT, semilla=0):
+    """Grabación sintética con las columnas canónicas de cargar_dataset.
+
+    El tag recorre una trayectoria suave dentro de la arena, el UWB la mide en mm con ruido y la
+    homografía inversa de calibración, la IMU tiene gravedad, ruido y deriva, y el Optitrack
+    tiene la posición y el yaw verdaderos.
+    """
+    rng = np.random.default_rng(semilla)
+    t = np.arange(n) * dt
+    # Trayectoria tipo Lissajous (m) y yaw siguiendo la dirección de avance
+    x = 1.5 * np.sin(2 * np.pi * t / 60)
+    y = 2.0 * np.sin(2 * np.pi * t / 45 + 0.5)
+    yaw = np.degrees(np.arctan2(np.gradient(y), np.gradient(x)))
+
+    # Lo que mide el UWB antes de la homografía (mm)
+    medido = aplicar_homografia(np.column_stack((x, y)) * 1000, np.linalg.inv(H_MATLAB))
+    medido += rng.normal(0, 50, (n, 2))
+
+    ruido = lambda sigma: rng.normal(0, sigma, n)
+    yaw_rad = np.radians(yaw)
+    return {
+        'muestra': np.arange(1, n + 1, dtype=float),
+        'tiempo_ms': t * 1000,
+        'uwb_x': medido[:, 0], 'uwb_y': medido[:, 1],
+        'uwb_qf': rng.integers(60, 100, n).astype(np.float32),
+        'ax': ruido(0.02), 'ay': ruido(0.02), 'az': 1 + ruido(0.02),
+        'gx': ruido(0.5), 'gy': ruido(0.5), 'gz': np.gradient(yaw) / dt + ruido(0.5) + 0.1,
+        'mx': 30 * np.cos(yaw_rad) + ruido(1), 'my': 30 * np.sin(yaw_rad) + ruido(1), 'mz': -40 + ruido(1),
+        'robotat_x': x * 1000, 'robotat_y': y * 1000, 'robotat_z': np.full(n, 100.0),
+        'robotat_roll': ruido(0.2), 'robotat_pitch': ruido(0.2), 'robotat_yaw': yaw,
+    }
+
+def lineas_esp32(sesion, inicio, fin):
+    """Bytes de las muestras [inicio, fin) con el formato de líneas del firmware."""
+    columnas = ('uwb_x', 'uwb_y', 'uwb_qf', 'ax', 'ay', 'az', 'gx', 'gy', 'gz', 'mx', 'my', 'mz')
+    bloque = np.column_stack([sesion[c][inicio:fin] for c in columnas])
+    texto = '\r\n'.join(','.join(f'{v:.6g}' for v in fila) for fila in bloque)
+    return texto.encode('utf-8') + b'\r\n'
+
+# Cada ruta recibe la sesión y devuelve el tiempo medido (s), lo que no es parte de la ruta
+# (por ejemplo generar los bytes del flujo) queda fuera de la medición. Si además la ruta genera
+# datos de prueba grandes por bloques devuelve (tiempo, pico en bytes) con el pico medido solo en
+# sus propias secciones, así esos datos tampoco cuentan en el pico de memoria.
+
+def ruta_complementario(sesion):
+    inicio = time.perf_counter()
+    calcular_orientacion(sesion['ax'], sesion['ay'], sesion['az'], sesion['gx'], sesion['gy'],
+                         sesion['gz'], sesion['mx'], sesion['my'], dt=DT, fc=0.1,
+                         yaw_inicial=sesion['robotat_yaw'][0])
+    return time.perf_counter() - inicio
+
+def ruta_kalman(sesion, estacionario=False):
+    inicio = time.perf_counter()
+    kalman_posicion(sesion['uwb_x'], sesion['uwb_y'], sesion['ax'] * 9.81, sesion['ay'] * 9.81,
+                    dt=DT, estacionario=estacionario)
+    return time.perf_counter() - inicio
+
+def ruta_kalman_estacionario(sesion):
+    return ruta_kalman(sesion, estacionario=True)
+
+def ruta_homografia(sesion):
+    puntos = np.column_stack((sesion['uwb_x'], sesion['uwb_y']))
+    inicio = time.perf_counter()
+    aplicar_homografia(puntos, H_MATLAB)
+    return time.perf_counter() - inicio
+
+def ruta_parser(sesion, tam_recv=4096):
+    """Decodificador del flujo alimentado en pedazos del tamaño de un recv.
+
+    El pico de memoria es el de lo que asigna el decodificador sobre lo que ya estaba asignado,
+    sin el bloque de bytes que genera el benchmark.
+    """
+    decodificador = DecodificadorLineas(campos=12)
+    n = len(sesion['uwb_x'])
+    total = 0.0
+    pico = 0
+    for inicio in range(0, n, BLOQUE):
+        flujo = lineas_esp32(sesion, inicio, min(inicio + BLOQUE, n))
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        t = time.perf_counter()
+        for k in range(0, len(flujo), tam_recv):
+            decodificador.alimentar(flujo[k:k + tam_recv])
+        total += time.perf_counter() - t
+        pico = max(pico, tracemalloc.get_traced_memory()[1] - base)
+        del flujo
+    if decodificador.validas != n:
+        raise RuntimeError(f'El decodificador entregó {decodificador.validas} de {n} muestras')
+    return total, pico
+
+def ruta_csv(sesion):
+    """Escritura fila por fila con csv.writer como en la V0.3 (20 columnas por fila).
+
+    El pico de memoria incluye el bloque de filas como listas de Python que se le pasa al escritor.
+    """
+    columnas = ('muestra', 'tiempo_ms', 'uwb_x', 'uwb_y', 'uwb_qf', 'ax', 'ay', 'az', 'gx', 'gy',
+                'gz', 'mx', 'my', 'mz', 'robotat_x', 'robotat_y', 'robotat_z', 'robotat_roll',
+                'robotat_pitch', 'robotat_yaw')
+    n = len(sesion['uwb_x'])
+    total = 0.0
+    with tempfile.TemporaryDirectory() as directorio:
+        with open(os.path.join(directorio, 'benchmark.csv'), 'w', newline='') as archivo:
+            escritor = csv.writer(archivo)
+            for inicio in range(0, n, BLOQUE):
+                filas = np.column_stack([sesion[c][inicio:inicio + BLOQUE] for c in columnas]).tolist()
+                t = time.perf_counter()
+                for fila in filas:
+                    escritor.writerow(fila)
+                total += time.perf_counter() - t
+    return total
+
+RUTAS = {
+    'complementario': ruta_complementario,
+    'kalman': ruta_kalman,
+    'kalman_estacionario': ruta_kalman_estacionario,
+    'homografia': ruta_homografia,
+    'parser': ruta_parser,
+    'csv': ruta_csv,
+}
+
+def _tiempo(resultado):
+    return resultado[0] if isinstance(resultado, tuple) else resultado
+
+def medir(ruta, sesion, repeticiones=3):
+    """(mejor tiempo en s, pico de memoria en MB) de una ruta."""
+    funcion = RUTAS[ruta]
+    gc.collect()
+    tiempo = min(_tiempo(funcion(sesion)) for _ in range(repeticiones))
+
+    # Memoria en una corrida aparte, tracemalloc hace más lenta la ejecución
+    gc.collect()
+    tracemalloc.start()
+    try:
+        resultado = funcion(sesion)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if isinstance(resultado, tuple):
+        # La ruta midió el pico solo de su propio trabajo
+        pico = resultado[1]
+    return tiempo, pico / 2**20
+
+def version_codigo():
+    """git describe del repositorio, o 'sin-git' si no se puede obtener."""
+    try:
+        salida = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        return salida.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'sin-git'
+
+def correr(tamanos, rutas=tuple(RUTAS), repeticiones=3, dt=DT):
+    """Corre todas las rutas para todos los tamaños y devuelve la tabla de resultados."""
+    version = version_codigo()
+    fecha = datetime.datetime.now().isoformat(timespec='seconds')
+    filas = []
+    for n in tamanos:
+        sesion = generar_sesion(n, dt)
+        for ruta in rutas:
+            # Con muchas muestras una sola repetición basta
+            tiempo, pico = medir(ruta, sesion, repeticiones if n <= 10**5 else 1)
+            fila = {
+                'version': version, 'fecha': fecha, 'python': platform.python_version(),
+                'numpy': np.__version__, 'ruta': ruta, 'muestras': n, 'tiempo_s': tiempo,
+                'pico_mb': pico, 'us_por_muestra': tiempo / n * 1e6,
+                'x_tiempo_real': n * dt / tiempo if tiempo > 0 else float('inf'),
+            }
+            filas.append(fila)
+            print(f"{ruta:>20} | {n:>9} muestras | {tiempo:9.4f} s | {pico:9.1f} MB | "
+                  f"{fila['us_por_muestra']:8.2f} us/muestra | {fila['x_tiempo_real']:10.0f}x tiempo real")
+        del sesion
+    return pd.DataFrame(filas)
+
+def guardar(resultados, archivo=ARCHIVO_RESULTADOS):
+    """Agrega los resultados al .csv acumulado."""
+    resultados.to_csv(archivo, mode='a', header=not os.path.exists(archivo), index=False)
+
+def comparar(archivo=ARCHIVO_RESULTADOS, metrica='us_por_muestra'):
+    """Tabla ruta x muestras con la métrica de cada versión (última medición de cada una)."""
+    resultados = pd.read_csv(archivo)
+    ultimas = resultados.sort_values('fecha').groupby(['version', 'ruta', 'muestras']).last()
+    return ultimas[metrica].unstack('version')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark de las rutas de procesamiento.')
+    parser.add_argument('--min', type=float, default=1e3, help='Menor número de muestras')
+    parser.add_argument('--max', type=float, default=1e6, help='Mayor número de muestras (hasta 1e7)')
+    parser.add_argument('--rutas', nargs='+', choices=list(RUTAS), default=list(RUTAS))
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--salida', default=ARCHIVO_RESULTADOS, help='CSV acumulado de resultados')
+    parser.add_argument('--comparar', action='store_true', help='Solo comparar versiones guardadas')
+    args = parser.parse_args()
+
+    if args.comparar:
+        print(comparar(args.salida).to_string(float_format='%.3f'))
+    else:
+        exponentes = range(int(round(np.log10(args.min))), int(round(np.log10(args.max))) + 1)
+        resultados = correr([10**e for e in exponentes], args.rutas, args.repeticiones)
+        guardar(resultados, args.salida)
+        print(f'Resultados agregados a {args.salida}')
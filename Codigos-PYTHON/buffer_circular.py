@@ -0,0 +1,61 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de adquisición (buffer circular)
+#
+# Descripcion: Buffer circular de capacidad fija sobre un arreglo de NumPy preasignado, para las
+# gráficas en tiempo real. Reemplaza las deque(maxlen=...) de listas de Python que había que
+# convertir a arreglos completos en cada cuadro. Cada fila se escribe dos veces (en k y en
+# k + capacidad), así las últimas n filas siempre están contiguas y vista() devuelve una vista
+# sin copias en orden cronológico.
+#
+# * Pensado para un solo hilo escritor y un lector: el contador total se actualiza después de
+#   escribir la fila, el lector nunca ve filas a medio escribir al final de la ventana.
+# -------------------------------------------------------------------------------------------------
+
+import numpy as np
+
+class BufferCircular:
+    """Últimas `capacidad` filas de `columnas` valores."""
+
+    def __init__(self, capacidad, columnas, dtype=np.float64):
+        self.capacidad = capacidad
+        self.columnas = columnas
+        self.datos = np.full((2 * capacidad, columnas), np.nan, dtype=dtype)
+        self.total = 0  # Filas escritas desde el inicio (también sirve para saber si hay datos nuevos)
+
+    def __len__(self):
+        return min(self.total, self.capacidad)
+
+    def agregar(self, fila):
+        """Agrega una fila."""
+        k = self.total % self.capacidad
+        self.datos[k] = fila
+        self.datos[k + self.capacidad] = fila
+        self.total += 1
+
+    def extender(self, filas):
+        """Agrega varias filas (k, columnas) con a lo más cuatro copias de bloque."""
+        filas = np.asarray(filas, dtype=self.datos.dtype).reshape(-1, self.columnas)
+        # De un bloque más grande que el buffer solo quedan las últimas filas
+        saltadas = max(0, len(filas) - self.capacidad)
+        filas = filas[saltadas:]
+        n = len(filas)
+        if n == 0:
+            return
+        k = (self.total + saltadas) % self.capacidad
+        primero = min(n, self.capacidad - k)
+        for inicio, tramo in ((k, filas[:primero]), (0, filas[primero:])):
+            self.datos[inicio:inicio + len(tramo)] = tramo
+            self.datos[inicio + self.capacidad:inicio + self.capacidad + len(tramo)] = tramo
+        self.total += saltadas + n
+
+    def vista(self):
+        """Vista (n, columnas) de las últimas filas en orden cronológico, sin copiar."""
+        total = self.total
+        n = min(total, self.capacidad)
+        inicio = (total - n) % self.capacidad
+        return self.datos[inicio:inicio + n]
+
+    def limpiar(self):
+        self.total = 0
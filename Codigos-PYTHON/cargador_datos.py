@@ -0,0 +1,196 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de lectura de datasets
+#
+# Descripcion: Cargador único para los tres formatos de .csv que hay en Datasets:
+#   - 'corto': x,y,ax..mz (V0.0 - V0.2), opcionalmente xr,yr,zr,rr,rp,ry del Robotat en metros
+#   - 'combined_data': cabeceras ESP32_* / Robotat_*_mm de la V0.3 sin UWB_QF
+#   - 'R2': igual que combined_data pero con el factor de calidad UWB_QF
+# Cualquiera de los tres (separado por ',' o ';') se lleva al mismo conjunto de columnas
+# canónicas. En la primera lectura se guarda un cache binario por columnas (.npy) que se abre con
+# memory-map, la llave del cache es la ruta, el tamaño y la fecha de modificación del archivo.
+#
+# * Unidades canónicas: UWB y Robotat en mm, acelerómetro en g, giroscopio en grados/s, ángulos
+#   del Robotat en grados.
+# * Si el archivo no trae Sample / Time (ms) se generan con el periodo nominal de 100 ms. Las
+#   columnas que el esquema no tiene quedan en NaN.
+# * Las capturas asíncronas (CABECERAS_ASYNC) traen además el tiempo de recepción de cada fuente
+#   en esp32_rx_ms y robotat_rx_ms.
+# * El archivo combinado de adquisicion_multi.py trae el número de placa en tag (NaN en los
+#   archivos de una sola placa), separar_por_tag lo divide en un diccionario por placa.
+# -------------------------------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Columnas canónicas y su tipo de dato
+COLUMNAS_CANONICAS = {
+    'muestra': np.float64, 'tiempo_ms': np.float64,
+    'uwb_x': np.float64, 'uwb_y': np.float64, 'uwb_qf': np.float32,
+    'ax': np.float64, 'ay': np.float64, 'az': np.float64,
+    'gx': np.float64, 'gy': np.float64, 'gz': np.float64,
+    'mx': np.float64, 'my': np.float64, 'mz': np.float64,
+    'robotat_x': np.float64, 'robotat_y': np.float64, 'robotat_z': np.float64,
+    'robotat_roll': np.float64, 'robotat_pitch': np.float64, 'robotat_yaw': np.float64,
+    'esp32_rx_ms': np.float64, 'robotat_rx_ms': np.float64,
+    'tag': np.float64,
+}
+
+# Cabeceras de la V0.3 (3_UWB_OPTI_DATAFETCH.py)
+COLUMNAS_V03 = {
+    'Sample': 'muestra', 'Time (ms)': 'tiempo_ms',
+    'ESP32_X': 'uwb_x', 'ESP32_Y': 'uwb_y', 'UWB_QF': 'uwb_qf',
+    'ESP32_Ax': 'ax', 'ESP32_Ay': 'ay', 'ESP32_Az': 'az',
+    'ESP32_Gx': 'gx', 'ESP32_Gy': 'gy', 'ESP32_Gz': 'gz',
+    'ESP32_Mx': 'mx', 'ESP32_My': 'my', 'ESP32_Mz': 'mz',
+    'Robotat_X_mm': 'robotat_x', 'Robotat_Y_mm': 'robotat_y', 'Robotat_Z_mm': 'robotat_z',
+    'Robotat_Roll': 'robotat_roll', 'Robotat_Pitch': 'robotat_pitch', 'Robotat_Yaw': 'robotat_yaw',
+    'ESP32_RX (ms)': 'esp32_rx_ms', 'Robotat_RX (ms)': 'robotat_rx_ms',
+    'Tag': 'tag',
+}
+
+# Cabeceras cortas de las versiones 0.0 - 0.2
+COLUMNAS_CORTAS = {
+    'x': 'uwb_x', 'y': 'uwb_y',
+    'ax': 'ax', 'ay': 'ay', 'az': 'az',
+    'gx': 'gx', 'gy': 'gy', 'gz': 'gz',
+    'mx': 'mx', 'my': 'my', 'mz': 'mz',
+    'xr': 'robotat_x', 'yr': 'robotat_y', 'zr': 'robotat_z',
+    'rr': 'robotat_roll', 'rp': 'robotat_pitch', 'ry': 'robotat_yaw',
+}
+
+DT_NOMINAL_MS = 100.0
+DIR_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache_datasets')
+VERSION_CACHE = 3
+
+def leer_cabecera(ruta):
+    """Devuelve (columnas, separador) leyendo solo la primera línea del archivo."""
+    with open(ruta, 'r', encoding='utf-8-sig') as f:
+        cabecera = f.readline().strip()
+    separador = ';' if ';' in cabecera else ','
+    return [c.strip() for c in cabecera.split(separador)], separador
+
+def detectar_esquema(columnas):
+    """Identifica el esquema ('corto', 'combined_data' o 'R2') a partir de las cabeceras."""
+    columnas = set(columnas)
+    if {'Sample', 'Time (ms)', 'ESP32_X', 'ESP32_Y'} <= columnas:
+        return 'R2' if 'UWB_QF' in columnas else 'combined_data'
+    if {'x', 'y', 'ax', 'ay', 'az', 'gx', 'gy', 'gz', 'mx', 'my', 'mz'} <= columnas:
+        return 'corto'
+    raise ValueError(f"Esquema no reconocido, cabeceras: {', '.join(sorted(columnas))}")
+
+def normalizar(data, esquema, inicio=0):
+    """Lleva un DataFrame de cualquier esquema al diccionario de columnas canónicas.
+
+    inicio es el índice de la primera fila cuando data es un bloque de un archivo más grande
+    (para generar muestra y tiempo_ms continuos en el esquema corto).
+    """
+    renombres = COLUMNAS_CORTAS if esquema == 'corto' else COLUMNAS_V03
+    data = data.rename(columns=renombres)
+    n = len(data)
+
+    datos = {}
+    for nombre, tipo in COLUMNAS_CANONICAS.items():
+        if nombre in data:
+            datos[nombre] = data[nombre].to_numpy(dtype=tipo)
+        else:
+            datos[nombre] = np.full(n, np.nan, dtype=tipo)
+
+    if esquema == 'corto':
+        # Sin columnas de muestra y tiempo, se usa el periodo nominal
+        datos['muestra'] = np.arange(inicio + 1, inicio + n + 1, dtype=np.float64)
+        datos['tiempo_ms'] = np.arange(inicio, inicio + n, dtype=np.float64) * DT_NOMINAL_MS
+        # En los archivos cortos el Robotat viene en metros
+        for eje in ('robotat_x', 'robotat_y', 'robotat_z'):
+            datos[eje] = datos[eje] * 1000
+    return datos
+
+def llave_cache(ruta):
+    """Llave del cache a partir de la ruta absoluta, el tamaño y la fecha de modificación."""
+    info = os.stat(ruta)
+    texto = f'{os.path.abspath(ruta)}|{info.st_size}|{info.st_mtime_ns}|{VERSION_CACHE}'
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+def _escribir_cache(directorio, datos, meta):
+    """Escribe las columnas en un directorio temporal y lo mueve al destino en un solo paso."""
+    os.makedirs(os.path.dirname(directorio), exist_ok=True)
+    temporal = tempfile.mkdtemp(dir=os.path.dirname(directorio))
+    try:
+        for nombre, columna in datos.items():
+            np.save(os.path.join(temporal, nombre + '.npy'), columna)
+        with open(os.path.join(temporal, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        os.rename(temporal, directorio)
+    except OSError:
+        # Otro proceso escribió el mismo cache primero
+        shutil.rmtree(temporal, ignore_errors=True)
+
+def _leer_cache(directorio, mmap):
+    modo = 'r' if mmap else None
+    return {nombre: np.load(os.path.join(directorio, nombre + '.npy'), mmap_mode=modo)
+            for nombre in COLUMNAS_CANONICAS}
+
+def cargar_dataset(ruta, usar_cache=True, dir_cache=DIR_CACHE, mmap=True):
+    """Carga un dataset como diccionario {columna canónica: arreglo}.
+
+    Con usar_cache=True la segunda lectura del mismo archivo (sin cambios) no vuelve a leer el
+    .csv, las columnas se abren desde el cache con memory-map (solo lectura).
+    """
+    directorio = os.path.join(dir_cache, llave_cache(ruta)) if usar_cache else None
+    if directorio is not None and os.path.isdir(directorio):
+        return _leer_cache(directorio, mmap)
+
+    columnas, separador = leer_cabecera(ruta)
+    esquema = detectar_esquema(columnas)
+    data = pd.read_csv(ruta, sep=separador, encoding='utf-8-sig')
+    datos = normalizar(data, esquema)
+
+    if directorio is not None:
+        meta = {'ruta': os.path.abspath(ruta), 'esquema': esquema, 'muestras': len(data)}
+        _escribir_cache(directorio, datos, meta)
+    return datos
+
+def leer_por_bloques(ruta, bloque=100_000, columnas=None, usar_cache=True, dir_cache=DIR_CACHE):
+    """Recorre un dataset por bloques de filas, cada bloque es un diccionario de columnas canónicas.
+
+    Si el cache del archivo ya existe los bloques son rebanadas de los memory-maps, si no se lee
+    el .csv con pandas por pedazos (nunca se carga completo). columnas limita las columnas que se
+    devuelven.
+    """
+    columnas = list(columnas or COLUMNAS_CANONICAS)
+    directorio = os.path.join(dir_cache, llave_cache(ruta)) if usar_cache else None
+    if directorio is not None and os.path.isdir(directorio):
+        datos = {c: np.load(os.path.join(directorio, c + '.npy'), mmap_mode='r') for c in columnas}
+        n = len(datos[columnas[0]])
+        for desde in range(0, n, bloque):
+            yield {c: datos[c][desde:desde + bloque] for c in columnas}
+        return
+
+    nombres, separador = leer_cabecera(ruta)
+    esquema = detectar_esquema(nombres)
+    inicio = 0
+    for pedazo in pd.read_csv(ruta, sep=separador, encoding='utf-8-sig', chunksize=bloque):
+        datos = normalizar(pedazo, esquema, inicio)
+        inicio += len(pedazo)
+        yield {c: datos[c] for c in columnas}
+
+def separar_por_tag(datos):
+    """Divide un dataset combinado en {número de placa: columnas de esa placa}."""
+    tags = np.asarray(datos['tag'])
+    return {int(tag): {nombre: np.asarray(columna)[tags == tag] for nombre, columna in datos.items()}
+            for tag in np.unique(tags[~np.isnan(tags)])}
+
+def esquema_dataset(ruta):
+    """Esquema de un archivo leyendo solo su cabecera."""
+    return detectar_esquema(leer_cabecera(ruta)[0])
+
+def cargar_dataframe(ruta, **kwargs):
+    """Igual que cargar_dataset pero devuelve un DataFrame de pandas."""
+    return pd.DataFrame(cargar_dataset(ruta, **kwargs))
@@ -0,0 +1,107 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de comunicación (Robotat)
+#
+# Descripcion: Cliente del Robotat para varios marcadores a la vez. robotat_get_pose de la V0.3
+# recibe una lista de agentes pero regresa dentro del loop, así que solo se usaba la pose del
+# primero. Este cliente mantiene una sola conexión abierta, devuelve las poses de todos los
+# marcadores pedidos como arreglo (N, 7) [x, y, z, q0, q1, q2, q3] y convierte todos los
+# cuaterniones a Euler en una sola llamada. También permite mandar varias solicitudes seguidas
+# (pipeline) y leer las respuestas después, sin esperar un viaje de ida y vuelta por solicitud.
+#
+# * Protocolo: se manda {"dst": 1, "cmd": 1, "pld": [ids]} y el Robotat responde una lista JSON
+#   con 7 valores por marcador en el mismo orden de los ids.
+# * La V0.3 (3_UWB_OPTI_DATAFETCH.py) usa este cliente. Si una lectura se pasa del timeout la
+#   solicitud queda pendiente y su respuesta se descarta en la siguiente consulta.
+# -------------------------------------------------------------------------------------------------
+
+import json
+import socket
+
+import numpy as np
+
+from cuaterniones import q2eul
+
+DST_ROBOTAT = 1
+CMD_GET_POSE = 1
+
+def decodificar_poses(mocap_data, num_agentes=None):
+    """Convierte la lista plana del Robotat en un arreglo (N, 7)."""
+    poses = np.asarray(mocap_data, dtype=float)
+    if poses.size % 7 != 0 or (num_agentes is not None and poses.size != 7 * num_agentes):
+        raise ValueError(f'Respuesta del Robotat con {poses.size} valores, se esperaban 7 por marcador.')
+    return poses.reshape(-1, 7)
+
+def poses_a_euler(poses, rotrep='xyz'):
+    """Arreglo (N, 7) a arreglo (N, 6) [x, y, z (mm), roll, pitch, yaw (grados)]."""
+    poses = np.atleast_2d(poses)
+    return np.hstack((poses[:, :3] * 1000, q2eul(poses[:, 3:7], seq=rotrep)))
+
+class ClienteRobotat:
+    """Conexión persistente al Robotat con solicitudes de varios marcadores."""
+
+    def __init__(self, ip='192.168.50.200', port=1883, timeout=1.0):
+        self.tcp_obj = socket.create_connection((ip, port), timeout=timeout)
+        self.tcp_obj.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = ''
+        self.decoder = json.JSONDecoder()
+        self.pendientes = 0  # Solicitudes enviadas cuya respuesta no se ha leído
+        self.descartadas = 0  # Respuestas tardías de solicitudes que se pasaron del timeout
+
+    def enviar(self, agents_ids):
+        """Manda una solicitud de pose sin esperar la respuesta."""
+        s = {"dst": DST_ROBOTAT, "cmd": CMD_GET_POSE, "pld": list(agents_ids)}
+        self.tcp_obj.sendall(json.dumps(s).encode('utf-8'))
+        self.pendientes += 1
+
+    def _descartar_atrasadas(self, atrasadas):
+        """Lee y descarta las respuestas de solicitudes anteriores que se dieron por perdidas."""
+        for _ in range(atrasadas):
+            self.recibir()
+            self.descartadas += 1
+
+    def recibir(self):
+        """Lee la siguiente respuesta JSON completa (puede llegar partida o junto a otra)."""
+        while True:
+            texto = self.buffer.lstrip()
+            if texto:
+                try:
+                    mocap_data, fin = self.decoder.raw_decode(texto)
+                    self.buffer = texto[fin:]
+                    self.pendientes -= 1
+                    return mocap_data
+                except json.JSONDecodeError:
+                    pass
+            data = self.tcp_obj.recv(4096)
+            if not data:
+                raise ConnectionError('El Robotat cerró la conexión.')
+            self.buffer += data.decode('utf-8')
+
+    def get_pose(self, agents_ids):
+        """Poses de todos los marcadores pedidos como arreglo (N, 7)."""
+        atrasadas = self.pendientes
+        self.enviar(agents_ids)
+        self._descartar_atrasadas(atrasadas)
+        return decodificar_poses(self.recibir(), len(agents_ids))
+
+    def get_pose_euler(self, agents_ids, rotrep='xyz'):
+        """Poses como arreglo (N, 6) con posición en mm y ángulos de Euler en grados."""
+        return poses_a_euler(self.get_pose(agents_ids), rotrep)
+
+    def get_pose_pipeline(self, solicitudes):
+        """Manda todas las solicitudes (listas de ids) seguidas y luego lee las respuestas."""
+        atrasadas = self.pendientes
+        for agents_ids in solicitudes:
+            self.enviar(agents_ids)
+        self._descartar_atrasadas(atrasadas)
+        return [decodificar_poses(self.recibir(), len(ids)) for ids in solicitudes]
+
+    def cerrar(self):
+        """Manda EXIT y cierra el socket, no falla si la conexión ya estaba cerrada."""
+        try:
+            self.tcp_obj.sendall(b'EXIT')
+        except OSError:
+            pass
+        finally:
+            self.tcp_obj.close()
@@ -0,0 +1,132 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de rotaciones
+#
+# Descripcion: Cuaterniones y matrices de rotación con NumPy, portado de las funciones de
+# Codigos-MATLAB (q2rot.m, rot2q.m, multq.m, invq.m) y del q2eul de la V0.3. Todas las funciones
+# aceptan un solo elemento o arreglos (N, 4) de cuaterniones y (N, 3, 3) de matrices, con
+# broadcasting y sin loops de Python, así convertir una grabación completa es una sola llamada.
+#
+# * Cuaterniones en el orden del Robotat / MATLAB: [q0, q1, q2, q3] = [qr, qx, qy, qz]
+# * eul2rot construye la misma matriz que armaban a mano las animaciones de las V0.0 - V0.2
+# -------------------------------------------------------------------------------------------------
+
+import numpy as np
+
+def q2eul(q, seq='xyz'):
+    """Convierte cuaterniones [q0, q1, q2, q3] en ángulos de Euler (roll, pitch, yaw) en grados.
+
+    Con q de forma (4,) devuelve una tupla (roll, pitch, yaw), con q de forma (N, 4) devuelve un
+    arreglo (N, 3).
+    """
+    if seq != 'xyz':
+        raise ValueError('Invalid Euler angle sequence.')
+
+    q = np.asarray(q, dtype=float)
+    q0, q1, q2, q3 = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+
+    sinr_cosp = 2 * (q0 * q1 + q2 * q3)
+    cosr_cosp = 1 - 2 * (q1 * q1 + q2 * q2)
+    roll = np.degrees(np.arctan2(sinr_cosp, cosr_cosp))
+
+    # Gimbal lock: se satura el seno en +/- 1
+    sinp = 2 * (q0 * q2 - q3 * q1)
+    pitch = np.degrees(np.arcsin(np.clip(sinp, -1, 1)))
+
+    siny_cosp = 2 * (q0 * q3 + q1 * q2)
+    cosy_cosp = 1 - 2 * (q2 * q2 + q3 * q3)
+    yaw = np.degrees(np.arctan2(siny_cosp, cosy_cosp))
+
+    if q.ndim == 1:
+        return float(roll), float(pitch), float(yaw)
+    return np.stack((roll, pitch, yaw), axis=-1)
+
+def eul2q(angulos, seq='xyz'):
+    """Inverso de q2eul: ángulos (..., 3) [roll, pitch, yaw] en grados a cuaterniones (..., 4)."""
+    if seq != 'xyz':
+        raise ValueError('Invalid Euler angle sequence.')
+
+    mitad = np.deg2rad(np.asarray(angulos, dtype=float)) / 2
+    cr, cp, cy = np.cos(mitad[..., 0]), np.cos(mitad[..., 1]), np.cos(mitad[..., 2])
+    sr, sp, sy = np.sin(mitad[..., 0]), np.sin(mitad[..., 1]), np.sin(mitad[..., 2])
+    return np.stack((cr * cp * cy + sr * sp * sy,
+                     sr * cp * cy - cr * sp * sy,
+                     cr * sp * cy + sr * cp * sy,
+                     cr * cp * sy - sr * sp * cy), axis=-1)
+
+def q2rot(q):
+    """Matriz de rotación (..., 3, 3) a partir de cuaterniones unitarios (..., 4)."""
+    q = np.asarray(q, dtype=float)
+    qr, qx, qy, qz = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+
+    R = np.empty(q.shape[:-1] + (3, 3))
+    R[..., 0, 0] = qr**2 + qx**2 - qy**2 - qz**2
+    R[..., 0, 1] = -2*qr*qz + 2*qx*qy
+    R[..., 0, 2] = 2*qr*qy + 2*qx*qz
+    R[..., 1, 0] = 2*qr*qz + 2*qx*qy
+    R[..., 1, 1] = qr**2 - qx**2 + qy**2 - qz**2
+    R[..., 1, 2] = -2*qr*qx + 2*qy*qz
+    R[..., 2, 0] = -2*qr*qy + 2*qx*qz
+    R[..., 2, 1] = 2*qr*qx + 2*qy*qz
+    R[..., 2, 2] = qr**2 - qx**2 - qy**2 + qz**2
+    return R
+
+def rot2q(R):
+    """Cuaterniones (..., 4) con q0 >= 0 a partir de matrices de rotación (..., 3, 3).
+
+    Fórmula de las notas de Robot Dynamics (ETHZ) que está comentada en rot2q.m.
+    """
+    R = np.asarray(R, dtype=float)
+    r11, r22, r33 = R[..., 0, 0], R[..., 1, 1], R[..., 2, 2]
+
+    # Se satura en 0 para que el redondeo no deje raíces de números negativos
+    q = np.empty(R.shape[:-2] + (4,))
+    q[..., 0] = 0.5 * np.sqrt(np.maximum(r11 + r22 + r33 + 1, 0))
+    q[..., 1] = 0.5 * np.copysign(np.sqrt(np.maximum(r11 - r22 - r33 + 1, 0)), R[..., 2, 1] - R[..., 1, 2])
+    q[..., 2] = 0.5 * np.copysign(np.sqrt(np.maximum(r22 - r33 - r11 + 1, 0)), R[..., 0, 2] - R[..., 2, 0])
+    q[..., 3] = 0.5 * np.copysign(np.sqrt(np.maximum(r33 - r11 - r22 + 1, 0)), R[..., 1, 0] - R[..., 0, 1])
+    return q
+
+def multq(q1, q2):
+    """Producto de cuaterniones q1 * q2 con broadcasting sobre las dimensiones iniciales."""
+    q1 = np.asarray(q1, dtype=float)
+    q2 = np.asarray(q2, dtype=float)
+    eta1, eps1 = q1[..., :1], q1[..., 1:]
+    eta2, eps2 = q2[..., :1], q2[..., 1:]
+
+    eta = eta1 * eta2 - np.sum(eps1 * eps2, axis=-1, keepdims=True)
+    eps = eta1 * eps2 + eta2 * eps1 + np.cross(eps1, eps2)
+    return np.concatenate((eta, eps), axis=-1)
+
+def invq(q):
+    """Inverso (conjugado) de cuaterniones unitarios."""
+    qi = -np.asarray(q, dtype=float)
+    qi[..., 0] = -qi[..., 0]
+    return qi
+
+def eul2rot(angulos, grados=True):
+    """Matrices (..., 3, 3) Rx(x) Ry(y) Rz(z) a partir de ángulos (..., 3) [x, y, z]."""
+    angulos = np.asarray(angulos, dtype=float)
+    if grados:
+        angulos = np.deg2rad(angulos)
+    cx, cy, cz = np.cos(angulos[..., 0]), np.cos(angulos[..., 1]), np.cos(angulos[..., 2])
+    sx, sy, sz = np.sin(angulos[..., 0]), np.sin(angulos[..., 1]), np.sin(angulos[..., 2])
+
+    R = np.empty(angulos.shape[:-1] + (3, 3))
+    R[..., 0, 0] = cy * cz
+    R[..., 0, 1] = -cy * sz
+    R[..., 0, 2] = sy
+    R[..., 1, 0] = cx * sz + sx * sy * cz
+    R[..., 1, 1] = cx * cz - sx * sy * sz
+    R[..., 1, 2] = -sx * cy
+    R[..., 2, 0] = sx * sz - cx * sy * cz
+    R[..., 2, 1] = sx * cz + cx * sy * sz
+    R[..., 2, 2] = cx * cy
+    return R
+
+def rotz(yaw, grados=True):
+    """Matrices (..., 3, 3) de rotación solo en z (yaw)."""
+    yaw = np.asarray(yaw, dtype=float)
+    ceros = np.zeros_like(yaw)
+    return eul2rot(np.stack((ceros, ceros, yaw), axis=-1), grados)
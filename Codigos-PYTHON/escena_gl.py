@@ -0,0 +1,194 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de visualización (OpenGL)
+#
+# Descripcion: Escena en modo retenido para la visualización en tiempo real de la V0.4. Antes la
+# grilla y los ejes se mandaban vértice por vértice con glBegin / glVertex3fv en cada cuadro y la
+# grilla se volvía a armar con np.arange cada vez. Aquí la geometría fija (grilla, límites de la
+# arena y ejes del tag) se sube una sola vez a display lists, la pose del tag se aplica con una
+# sola matriz de modelo y la estela de cada tag vive en un buffer circular dentro de un VBO, así
+# cada cuadro solo son unas cuantas llamadas de OpenGL aunque haya varios tags y estelas largas.
+#
+# * Se usa el pipeline fijo (sin shaders) igual que la V0.4, funciona con OpenGL por software
+#   (Mesa llvmpipe) sin tarjeta de video.
+# * Todas las funciones que crean listas o buffers se llaman después de crear el contexto
+#   (pygame.display.set_mode con OPENGL).
+# -------------------------------------------------------------------------------------------------
+
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+
+from cuaterniones import eul2rot
+
+# Límites de la arena del Robotat en metros
+ARENA_X = 2.0
+ARENA_Y = 2.5
+
+def crear_lista_grilla(x_lim=ARENA_X, y_lim=ARENA_Y, paso=0.5):
+    """Display list con la grilla del plano XY y el borde de la arena."""
+    lista = glGenLists(1)
+    glNewList(lista, GL_COMPILE)
+
+    glLineWidth(1)
+    glColor3f(0.75, 0.75, 0.75)  # Color gris claro para la grilla
+    glBegin(GL_LINES)
+    # Líneas paralelas al eje X (a lo largo de Y) y paralelas al eje Y (a lo largo de X)
+    for y in np.arange(-y_lim, y_lim + paso / 100, paso):
+        glVertex3f(-x_lim, y, 0)
+        glVertex3f(x_lim, y, 0)
+    for x in np.arange(-x_lim, x_lim + paso / 100, paso):
+        glVertex3f(x, -y_lim, 0)
+        glVertex3f(x, y_lim, 0)
+    glEnd()
+
+    # Borde de la arena
+    glLineWidth(2)
+    glColor3f(0.4, 0.4, 0.4)
+    glBegin(GL_LINE_LOOP)
+    for x, y in ((-x_lim, -y_lim), (x_lim, -y_lim), (x_lim, y_lim), (-x_lim, y_lim)):
+        glVertex3f(x, y, 0)
+    glEnd()
+
+    glEndList()
+    return lista
+
+def crear_lista_ejes(largo=0.5):
+    """Display list con los ejes X (rojo), Y (verde) y Z (azul) del tag."""
+    lista = glGenLists(1)
+    glNewList(lista, GL_COMPILE)
+    glLineWidth(3)  # Establecer el grosor de las líneas
+    glBegin(GL_LINES)
+    for k, color in enumerate(((1, 0, 0), (0, 1, 0), (0, 0, 1))):
+        punta = [0, 0, 0]
+        punta[k] = largo
+        glColor3f(*color)
+        glVertex3f(0, 0, 0)
+        glVertex3f(*punta)
+    glEnd()
+    glEndList()
+    return lista
+
+def matriz_modelo(pos_x, pos_y, angle_x, angle_y, angle_z):
+    """Matriz de modelo del tag en el orden de columnas de OpenGL (para glMultMatrixf).
+
+    Es la misma transformación que glTranslatef(pos_x, pos_y, 0), glRotatef(angle_x, -1, 0, 0),
+    glRotatef(angle_y, 0, 1, 0), glRotatef(angle_z, 0, 0, -1).
+    """
+    M = np.eye(4, dtype=np.float32)
+    M[:3, :3] = eul2rot([-angle_x, angle_y, -angle_z])
+    M[0, 3], M[1, 3] = pos_x, pos_y
+    return np.ascontiguousarray(M.T)
+
+class EstelaGPU:
+    """Historial de posiciones de un tag en un buffer circular dentro de un VBO.
+
+    Cada punto se escribe dos veces (en k y en k + capacidad), así las últimas n posiciones siempre
+    están contiguas en el buffer y se dibujan con un solo glDrawArrays sin copiar nada.
+    """
+
+    def __init__(self, capacidad=10000, color=(1.0, 0.5, 0.0), ancho=2):
+        self.capacidad = capacidad
+        self.color = color
+        self.ancho = ancho
+        self.cabeza = 0  # Siguiente posición a escribir dentro de [0, capacidad)
+        self.n = 0
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, 2 * capacidad * 3 * 4, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def _subir(self, inicio, puntos):
+        glBufferSubData(GL_ARRAY_BUFFER, inicio * 12, puntos.nbytes, puntos)
+
+    def agregar(self, puntos):
+        """Agrega posiciones (k, 2) o (k, 3) al final de la estela con pocas copias al VBO."""
+        puntos = np.atleast_2d(np.asarray(puntos, dtype=np.float32))
+        if puntos.shape[1] == 2:
+            puntos = np.hstack((puntos, np.zeros((len(puntos), 1), dtype=np.float32)))
+        puntos = np.ascontiguousarray(puntos[-self.capacidad:])
+        k = len(puntos)
+        if k == 0:
+            return
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        # Primer tramo hasta el final del anillo y el resto desde el inicio
+        primero = min(k, self.capacidad - self.cabeza)
+        for inicio, tramo in ((self.cabeza, puntos[:primero]), (0, puntos[primero:])):
+            if len(tramo):
+                self._subir(inicio, tramo)
+                self._subir(inicio + self.capacidad, tramo)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self.cabeza = (self.cabeza + k) % self.capacidad
+        self.n = min(self.n + k, self.capacidad)
+
+    def dibujar(self):
+        if self.n < 2:
+            return
+        primero = (self.cabeza - self.n) % self.capacidad
+        glColor3f(*self.color)
+        glLineWidth(self.ancho)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, ctypes.c_void_p(0))
+        glDrawArrays(GL_LINE_STRIP, primero, self.n)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def limpiar(self):
+        self.cabeza = 0
+        self.n = 0
+
+    def liberar(self):
+        glDeleteBuffers(1, [self.vbo])
+
+class EscenaGL:
+    """Grilla, ejes y estelas de varios tags, se crea una vez con el contexto ya abierto."""
+
+    def __init__(self, capacidad_estela=10000):
+        self.lista_grilla = crear_lista_grilla()
+        self.lista_ejes = crear_lista_ejes()
+        self.capacidad_estela = capacidad_estela
+        self.estelas = {}
+
+    def estela(self, tag, color=(1.0, 0.5, 0.0)):
+        """Estela del tag (se crea la primera vez que se pide)."""
+        if tag not in self.estelas:
+            self.estelas[tag] = EstelaGPU(self.capacidad_estela, color)
+        return self.estelas[tag]
+
+    def dibujar(self, poses, camara):
+        """Dibuja la escena completa.
+
+        poses es un diccionario {tag: matriz de modelo} y camara (rot_x, rot_y, pan_x, pan_y).
+        """
+        rot_x, rot_y, pan_x, pan_y = camara
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+        glPushMatrix()
+        # Rotaciones y paneo de la cámara antes de dibujar la escena
+        glRotatef(rot_x, 1, 0, 0)
+        glRotatef(rot_y, 0, 1, 0)
+        glTranslatef(pan_x, pan_y, 0)
+
+        glCallList(self.lista_grilla)
+        for estela in self.estelas.values():
+            estela.dibujar()
+
+        # Cada tag es una matriz de modelo y la lista de sus ejes
+        for M in poses.values():
+            glPushMatrix()
+            glMultMatrixf(M)
+            glCallList(self.lista_ejes)
+            glPopMatrix()
+
+        glPopMatrix()
+
+    def liberar(self):
+        glDeleteLists(self.lista_grilla, 1)
+        glDeleteLists(self.lista_ejes, 1)
+        for estela in self.estelas.values():
+            estela.liberar()
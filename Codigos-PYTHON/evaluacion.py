@@ -0,0 +1,353 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: evaluación de exactitud contra Optitrack
+#
+# Descripcion: Equivalente en Python de las estadísticas de DYNAMIC_Plotting_CompFilt_POS.m y
+# DYNAMIC_Plotting_ButterWorth_POS.m y de las tablas tabla_X_*.tex / tabla_Y_*.tex. Cada dataset
+# se fusiona (UWB crudo, filtro complementario de posición, Butterworth LPF + HPF o Kalman) y se
+# compara contra Robotat_X_mm, Robotat_Y_mm y Robotat_Yaw. Las métricas se calculan sobre arreglos
+# (N, ejes) completos: RMSE, MAE, error porcentual de la media, R² por eje, R² en xy como en
+# MATLAB y error de yaw con el ángulo envuelto a [-180, 180).
+#
+# * Los archivos se evalúan en un pool de procesos, un archivo que falle no detiene el lote.
+# * Con --alinear cada dataset pasa antes por alineacion.py (reloj uniforme y retardo UWB -
+#   Optitrack corregido), el retardo estimado queda en la columna retardo_ms.
+# * Con --dt-real no se remuestrea: la integración del giroscopio y el Kalman usan el periodo real
+#   de cada muestra (alineacion.dt_por_muestra de Time (ms)), los filtros IIR de periodo fijo
+#   usan la mediana del periodo (robusta a los huecos de la captura).
+# * Salidas: tabla por archivo, tabla agregada por fusión y tablas LaTeX por eje y fusión.
+# * Uso: python evaluacion.py --carpetas Dinamico --fusiones crudo complementario --homografia
+# -------------------------------------------------------------------------------------------------
+
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy.integrate import cumulative_trapezoid
+from scipy.signal import butter, filtfilt, lfilter
+
+from alineacion import alinear_dataset, dt_por_muestra
+from cargador_datos import cargar_dataset
+from filtro_kalman import kalman_posicion
+from homografia import aplicar_homografia
+from orientacion import calcular_orientacion
+from procesamiento_lote import RAIZ_DATASETS, buscar_datasets
+
+FUSIONES = ('crudo', 'complementario', 'butterworth', 'kalman')
+EJES = ('x', 'y')
+
+# Métricas ---------------------------------------------------------------------------------------
+
+def envolver_angulo(angulo):
+    """Ángulo en grados llevado a [-180, 180)."""
+    return (np.asarray(angulo, dtype=float) + 180) % 360 - 180
+
+def metricas(estimado, referencia):
+    """RMSE, MAE, error porcentual de la media y R² de cada columna de arreglos (N, k).
+
+    Las filas con NaN en el estimado o en la referencia no cuentan (por columna). El error
+    porcentual es |media estimada - media de referencia| / |media de referencia| * 100, la misma
+    definición de la columna e(%) de las tablas de MATLAB.
+    """
+    estimado = np.asarray(estimado, dtype=float)
+    referencia = np.asarray(referencia, dtype=float)
+    validos = np.isfinite(estimado) & np.isfinite(referencia)
+    estimado = np.where(validos, estimado, np.nan)
+    referencia = np.where(validos, referencia, np.nan)
+
+    error = estimado - referencia
+    media_ref = np.nanmean(referencia, axis=0)
+    media_est = np.nanmean(estimado, axis=0)
+    ss_res = np.nansum(error**2, axis=0)
+    ss_tot = np.nansum((referencia - media_ref)**2, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Una referencia constante (Optitrack sin rastreo queda en 0) no define e(%) ni R²
+        return {
+            'muestras': validos.sum(axis=0),
+            'rmse': np.sqrt(np.nanmean(error**2, axis=0)),
+            'mae': np.nanmean(np.abs(error), axis=0),
+            'error_pct': np.where(media_ref != 0, np.abs(media_est - media_ref) / np.abs(media_ref) * 100,
+                                  np.nan),
+            'r2': np.where(ss_tot > 0, 1 - ss_res / ss_tot, np.nan),
+            'media_est': media_est,
+            'media_ref': media_ref,
+            'std_est': np.nanstd(estimado, axis=0, ddof=1),
+            'std_ref': np.nanstd(referencia, axis=0, ddof=1),
+        }
+
+def r2_plano(estimado, referencia):
+    """R² de la trayectoria en xy como en MATLAB (SSres y SStot sumados en los dos ejes)."""
+    estimado = np.asarray(estimado, dtype=float)
+    referencia = np.asarray(referencia, dtype=float)
+    validos = np.isfinite(estimado).all(axis=1) & np.isfinite(referencia).all(axis=1)
+    estimado, referencia = estimado[validos], referencia[validos]
+    ss_tot = np.sum((referencia - referencia.mean(axis=0))**2)
+    ss_res = np.sum((estimado - referencia)**2)
+    return 1 - ss_res / ss_tot if ss_tot > 0 else np.nan
+
+def error_yaw(estimado, referencia):
+    """RMSE, MAE y máximo del error de yaw (grados) con el ángulo envuelto."""
+    error = envolver_angulo(np.asarray(estimado, dtype=float) - np.asarray(referencia, dtype=float))
+    error = np.abs(error[np.isfinite(error)])
+    if not len(error):
+        return {'yaw_rmse': np.nan, 'yaw_mae': np.nan, 'yaw_max': np.nan}
+    return {'yaw_rmse': np.sqrt(np.mean(error**2)), 'yaw_mae': error.mean(), 'yaw_max': error.max()}
+
+# Fusiones de posición ---------------------------------------------------------------------------
+
+def complementario_posicion(x, y, ax, ay, dt=0.1, tau=1.0):
+    """Filtro complementario de posición de DYNAMIC_Plotting_CompFilt_POS.m (arreglo (N, 2), mm).
+
+    La recursión del loop de MATLAB es lineal, así que se escribe como dos filtros IIR de primer
+    orden (lfilter) sobre los dos ejes a la vez:
+        v[k] = alpha * (v[k-1] + a[k] dt),  v[0] = 0
+        p[k] = alpha * (p[k-1] + v[k] dt) + (1 - alpha) * uwb[k],  p[0] = uwb[0]
+    """
+    uwb = np.column_stack((x, y)).astype(float)
+    # Aceleración de g a mm/s² sin el sesgo estático
+    acc = np.column_stack((ax, ay)).astype(float)
+    acc = (acc - acc.mean(axis=0)) * 9800
+    return recursion_complementaria(uwb, acc, tau / (tau + dt), dt)
+
+def recursion_complementaria(uwb, acc, alpha, dt=0.1):
+    """Recursión de complementario_posicion con uwb (N, 2) en mm y acc (N, 2) ya en mm/s²."""
+    posiciones = np.empty_like(uwb)
+    posiciones[0] = uwb[0]
+    if len(uwb) > 1:
+        vel = lfilter([alpha * dt], [1, -alpha], acc[1:], axis=0)
+        entrada = alpha * dt * vel + (1 - alpha) * uwb[1:]
+        zi = (alpha * uwb[0])[np.newaxis, :]  # Estado inicial: alpha * p[0]
+        posiciones[1:], _ = lfilter([1], [1, -alpha], entrada, axis=0, zi=zi)
+    return posiciones
+
+def butterworth_posicion(x, y, ax, ay, dt=0.1, fc_lpf=0.6, fc_hpf=0.5):
+    """LPF al UWB + doble integración HPF del acelerómetro de DYNAMIC_Plotting_ButterWorth_POS.m."""
+    Fs = 1 / dt
+    b_lpf, a_lpf = butter(2, fc_lpf / (Fs / 2), 'low')
+    d_hpf, c_hpf = butter(2, fc_hpf / (Fs / 2), 'high')
+
+    uwb_lpf = filtfilt(b_lpf, a_lpf, np.column_stack((x, y)).astype(float), axis=0)
+    acc = np.column_stack((ax, ay)).astype(float) * 1000 * 9.8
+    vel = filtfilt(d_hpf, c_hpf, cumulative_trapezoid(acc, axis=0, initial=0) * dt, axis=0)
+    pos = filtfilt(d_hpf, c_hpf, cumulative_trapezoid(vel, axis=0, initial=0) * dt, axis=0)
+    return uwb_lpf + pos
+
+def fusionar(data, fusion, dt=0.1, H=None):
+    """Trayectoria fusionada (N, 2) en mm, en el marco de Optitrack si se pasa la homografía.
+
+    dt puede ser un arreglo (N,) con el periodo real de cada muestra: el Kalman lo usa paso a
+    paso, el complementario y el Butterworth (filtros de periodo fijo) usan la mediana, así un
+    hueco de la captura no mueve sus frecuencias de corte.
+    """
+    x, y, ax, ay = data['uwb_x'], data['uwb_y'], data['ax'], data['ay']
+    dt_fijo = float(np.median(dt))
+    if fusion == 'crudo':
+        posiciones = np.column_stack((x, y)).astype(float)
+    elif fusion == 'complementario':
+        posiciones = complementario_posicion(x, y, ax, ay, dt_fijo)
+    elif fusion == 'butterworth':
+        # En MATLAB el LPF se aplica a los puntos ya transformados
+        if H is not None:
+            x, y = aplicar_homografia(np.column_stack((x, y)), H).T
+        return butterworth_posicion(x, y, ax, ay, dt_fijo)
+    elif fusion == 'kalman':
+        posiciones = kalman_posicion(x, y, ax * 9.81, ay * 9.81, dt=dt)
+    else:
+        raise ValueError(f"Fusión desconocida '{fusion}', opciones: {', '.join(FUSIONES)}")
+    return aplicar_homografia(posiciones, H) if H is not None else posiciones
+
+# Evaluación por archivo y por lote --------------------------------------------------------------
+
+def evaluar_archivo(ruta, fusiones=FUSIONES, dt=0.1, fc=0.1, H=None, raiz=RAIZ_DATASETS,
+                    usar_cache=True, alinear=False, dt_real=False):
+    """Devuelve una fila de métricas por fusión para un dataset.
+
+    Con dt_real (y sin alinear) se usa el periodo real de cada muestra en lugar de dt.
+    """
+    archivo = os.path.relpath(ruta, raiz)
+    inicio = time.perf_counter()
+    retardo = np.nan
+    try:
+        data = cargar_dataset(ruta, usar_cache=usar_cache)
+        if alinear:
+            data, info = alinear_dataset(data, dt)
+            retardo = info['retardo_ms']
+        elif dt_real:
+            dt = dt_por_muestra(data['tiempo_ms'], dt * 1000)
+        n = len(data['uwb_x'])
+        if n < 10:
+            raise ValueError(f'Muy pocas muestras ({n}) para filtfilt')
+        referencia = np.column_stack((data['robotat_x'], data['robotat_y']))
+        if np.isnan(referencia).all():
+            raise ValueError('El dataset no tiene columnas de Optitrack (Robotat)')
+
+        # El yaw estimado es el mismo para todas las fusiones de posición
+        yaw_inicial = None if np.isnan(data['robotat_yaw'][0]) else data['robotat_yaw'][0]
+        filt_ang, _, _, _ = calcular_orientacion(data['ax'], data['ay'], data['az'], data['gx'],
+                                                 data['gy'], data['gz'], data['mx'], data['my'],
+                                                 dt=dt, fc=fc, yaw_inicial=yaw_inicial)
+        yaw = error_yaw(filt_ang[:, 2], data['robotat_yaw'])
+    except Exception as e:
+        # Aislar el error del archivo para que el resto del lote continúe
+        return [{'archivo': archivo, 'fusion': f, 'estado': 'error', 'error': f'{type(e).__name__}: {e}',
+                 'tiempo_s': time.perf_counter() - inicio} for f in fusiones]
+
+    filas = []
+    for fusion in fusiones:
+        fila = {'archivo': archivo, 'fusion': fusion, 'estado': 'ok', 'error': '', 'retardo_ms': retardo}
+        try:
+            estimado = fusionar(data, fusion, dt, H)
+            m = metricas(estimado, referencia)
+            fila['muestras'] = int(m['muestras'].min())
+            for k, eje in enumerate(EJES):
+                for nombre, valores in m.items():
+                    if nombre != 'muestras':
+                        fila[f'{nombre}_{eje}'] = valores[k]
+            fila['r2_xy'] = r2_plano(estimado, referencia)
+            fila.update(yaw)
+        except Exception as e:
+            fila['estado'] = 'error'
+            fila['error'] = f'{type(e).__name__}: {e}'
+        fila['tiempo_s'] = time.perf_counter() - inicio
+        filas.append(fila)
+    return filas
+
+COLUMNAS = (['archivo', 'fusion', 'estado', 'muestras']
+            + [f'{m}_{eje}' for eje in EJES for m in ('rmse', 'mae', 'error_pct', 'r2', 'media_est',
+                                                     'media_ref', 'std_est', 'std_ref')]
+            + ['r2_xy', 'yaw_rmse', 'yaw_mae', 'yaw_max', 'retardo_ms', 'tiempo_s', 'error'])
+
+def _orden_natural(texto):
+    """Llave para ordenar PCB2 antes que PCB10."""
+    return [int(t) if t.isdigit() else t.lower() for t in re.split(r'(\d+)', texto)]
+
+def evaluar_lote(archivos, fusiones=FUSIONES, workers=None, dt=0.1, fc=0.1, H=None,
+                 raiz=RAIZ_DATASETS, usar_cache=True, alinear=False, dt_real=False):
+    """Evalúa los archivos en un pool de procesos y devuelve la tabla por archivo y fusión."""
+    workers = workers or min(4, os.cpu_count() or 1)
+    total = len(archivos)
+    filas = []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = {pool.submit(evaluar_archivo, ruta, fusiones, dt, fc, H, raiz, usar_cache, alinear,
+                               dt_real): ruta for ruta in archivos}
+        for k, futuro in enumerate(as_completed(futuros), start=1):
+            ruta = futuros[futuro]
+            try:
+                nuevas = futuro.result()
+            except Exception as e:
+                # Falla del proceso trabajador (por ejemplo, memoria), no del archivo
+                nuevas = [{'archivo': os.path.relpath(ruta, raiz), 'fusion': f, 'estado': 'error',
+                           'error': f'{type(e).__name__}: {e}'} for f in fusiones]
+            filas += nuevas
+            estado = 'ok' if all(f['estado'] == 'ok' for f in nuevas) else 'error'
+            print(f"[{k}/{total}] {nuevas[0]['archivo']} -> {estado}")
+
+    tabla = pd.DataFrame(filas, columns=COLUMNAS)
+    orden = tabla['archivo'].map(_orden_natural)
+    indices = sorted(range(len(tabla)), key=lambda i: (orden[i], fusiones.index(tabla['fusion'][i])))
+    return tabla.iloc[indices].reset_index(drop=True)
+
+def agregar(tabla):
+    """Media y mediana de las métricas de los archivos sin error, una fila por fusión.
+
+    Las columnas quedan como <métrica>_media y <métrica>_mediana. La mediana no se deja llevar
+    por las sesiones viejas donde el marco UWB no coincide con Optitrack.
+    """
+    ok = tabla[tabla['estado'] == 'ok']
+    metricas_num = [c for c in COLUMNAS if c not in ('archivo', 'fusion', 'estado', 'muestras', 'error')]
+    grupos = ok.groupby('fusion', sort=False)
+    resumen = grupos[metricas_num].agg(['mean', 'median'])
+    resumen.columns = [f"{c}_{'media' if e == 'mean' else 'mediana'}" for c, e in resumen.columns]
+    resumen.insert(0, 'archivos', grupos.size())
+    resumen.insert(1, 'muestras', grupos['muestras'].sum())
+    return resumen.reset_index()
+
+# Tablas LaTeX -----------------------------------------------------------------------------------
+
+def _numero(valor, decimales):
+    """Formato de las tablas de MATLAB: redondeado y sin ceros sobrantes."""
+    return 'NaN' if not np.isfinite(valor) else f'{round(float(valor), decimales):g}'
+
+def tabla_latex(tabla, eje, fusion):
+    """Tabla por punto (un archivo por fila) con el formato de tabla_X_con_simbolos.tex."""
+    filas = tabla[(tabla['fusion'] == fusion) & (tabla['estado'] == 'ok')]
+    lineas = [r'\begin{table}[H]', r'\centering', r'\begin{tabular}{c c c c c c c c c }', r'\hline',
+              rf'Pt. & $\bar{{{eje}}}$ UWB & $\bar{{{eje}}}$ Optitrack & Diff $\bar{{{eje}}}$ & e(\%) & '
+              rf'$\sigma$ UWB & $\sigma$ Optitrack & RMSE & $R^2$\\ \hline']
+    for k, (_, f) in enumerate(filas.iterrows(), start=1):
+        valores = [_numero(f[f'media_est_{eje}'], 2), _numero(f[f'media_ref_{eje}'], 2),
+                   _numero(abs(f[f'media_est_{eje}'] - f[f'media_ref_{eje}']), 2),
+                   _numero(f[f'error_pct_{eje}'], 3), _numero(f[f'std_est_{eje}'], 3),
+                   _numero(f[f'std_ref_{eje}'], 3), _numero(f[f'rmse_{eje}'], 2),
+                   _numero(f[f'r2_{eje}'], 4)]
+        lineas.append(f'{k} & ' + ' & '.join(valores) + r'\\ ')
+    lineas += [r'\hline', r'\end{tabular}',
+               rf'\caption{{Comparación de medias y desviación estándar de sistema UWB ({fusion}) '
+               rf'contra Optitrack para el eje \textit{{{eje.upper()}}}}}', r'\end{table}']
+    return '\n'.join(lineas) + '\n'
+
+def guardar_tablas_latex(tabla, destino, fusiones=None):
+    """Escribe tabla_X_<fusion>.tex y tabla_Y_<fusion>.tex, devuelve las rutas."""
+    os.makedirs(destino, exist_ok=True)
+    rutas = []
+    for fusion in fusiones or tabla['fusion'].unique():
+        for eje in EJES:
+            ruta = os.path.join(destino, f'tabla_{eje.upper()}_{fusion}.tex')
+            with open(ruta, 'w', encoding='utf-8') as f:
+                f.write(tabla_latex(tabla, eje, fusion))
+            rutas.append(ruta)
+    return rutas
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Exactitud de las trayectorias UWB contra Optitrack.')
+    parser.add_argument('--raiz', default=RAIZ_DATASETS, help='Carpeta Datasets')
+    parser.add_argument('--carpetas', nargs='+', default=['Dinamico'],
+                        help='Subcarpetas de Datasets a evaluar')
+    parser.add_argument('--fusiones', nargs='+', default=list(FUSIONES), choices=FUSIONES,
+                        help='Trayectorias a comparar')
+    parser.add_argument('--workers', type=int, default=None, help='Número de procesos (máximo)')
+    parser.add_argument('--salida', default='evaluacion', help='Carpeta de las tablas')
+    parser.add_argument('--dt', type=float, default=0.1, help='Periodo de muestreo (s)')
+    parser.add_argument('--fc', type=float, default=0.1, help='Frecuencia de corte del yaw (Hz)')
+    parser.add_argument('--homografia', action='store_true',
+                        help='Pasar las coordenadas UWB por la homografía de calibración')
+    parser.add_argument('--sin-cache', action='store_true', help='No usar el cache binario')
+    tiempo = parser.add_mutually_exclusive_group()
+    tiempo.add_argument('--alinear', action='store_true',
+                        help='Remuestrear a dt uniforme y corregir el retardo UWB - Optitrack')
+    tiempo.add_argument('--dt-real', action='store_true',
+                        help='Sin remuestrear, integrar con el periodo real de cada muestra')
+    args = parser.parse_args()
+
+    H = None
+    if args.homografia:
+        from homografia import cargar_homografia
+        H = cargar_homografia()
+
+    archivos = buscar_datasets(args.raiz, args.carpetas)
+    print(f'Se encontraron {len(archivos)} archivos .csv')
+
+    inicio = time.perf_counter()
+    fusiones = tuple(args.fusiones)
+    tabla = evaluar_lote(archivos, fusiones, args.workers, args.dt, args.fc, H, args.raiz,
+                         not args.sin_cache, args.alinear, args.dt_real)
+    resumen = agregar(tabla)
+
+    os.makedirs(args.salida, exist_ok=True)
+    tabla.to_csv(os.path.join(args.salida, 'evaluacion_archivos.csv'), index=False)
+    resumen.to_csv(os.path.join(args.salida, 'evaluacion_resumen.csv'), index=False)
+    guardar_tablas_latex(tabla, args.salida, fusiones)
+
+    columnas = ['fusion', 'archivos'] + [f'{c}_mediana' for c in ('rmse_x', 'rmse_y', 'error_pct_x',
+                                                                   'error_pct_y', 'r2_x', 'r2_y',
+                                                                   'r2_xy', 'yaw_rmse')]
+    print(resumen[columnas].to_string(index=False, float_format=lambda v: f'{v:.3f}'))
+    errores = (tabla['estado'] == 'error').groupby(tabla['archivo']).any().sum()
+    print(f'{len(archivos) - errores} archivos evaluados, {errores} con error, '
+          f'{time.perf_counter() - inicio:.1f} s. Tablas en {args.salida}')
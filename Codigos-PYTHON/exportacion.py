@@ -0,0 +1,340 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: exportación de videos y figuras (sin ventana)
+#
+# Descripcion: Modo de exportación para revisar muchas sesiones sin abrir un plt.show() por cada
+# una. Todo se dibuja con el backend Agg. El video usa la misma escena de las V0.0 - V0.2 (marco
+# UWB, marco Robotat si existe y trayectorias en xy) armada con AnimacionPose, los cuadros se
+# reparten por rangos entre procesos y se codifican con un solo proceso de ffmpeg que recibe los
+# cuadros en orden por un pipe (MP4 o GIF según la extensión). Si ffmpeg no está instalado cada
+# proceso guarda sus cuadros como una secuencia de PNG. La sesión (orientación, Kalman y
+# trayectorias) se calcula una sola vez en el proceso principal y los procesos la abren desde
+# .npy con memory-map. Solo hay workers bloques en vuelta a la vez (cada bloque crudo son cientos
+# de MB), si ffmpeg se atrasa los procesos esperan en lugar de llenar el disco temporal.
+# También genera las figuras estáticas de comparación de trayectorias (UWB, Kalman y Robotat) de
+# todos los datasets de una carpeta en un lote.
+#
+# * El UWB se pasa al marco de Optitrack con la homografía de calibración (cargar_homografia),
+#   así las trayectorias UWB y Robotat se pueden comparar. Con --sin-homografia el UWB queda en
+#   el marco de las anclas (solo en metros) y no se alinea con el Robotat.
+# * Uso: python exportacion.py video ruta.csv --salida sesion.mp4 --workers 4 --kalman
+#        python exportacion.py figuras --carpetas Dinamico --salida figuras
+# -------------------------------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+from animacion import AnimacionPose
+from cargador_datos import cargar_dataset
+from cuaterniones import eul2rot, rotz
+from filtro_kalman import kalman_posicion
+from homografia import aplicar_homografia
+from orientacion import calcular_orientacion
+from procesamiento_lote import CARPETAS_DATASETS, RAIZ_DATASETS, buscar_datasets
+
+FIGSIZE = (12, 8)
+DPI = 80
+CUADROS_POR_BLOQUE = 200
+
+def preparar_sesion(ruta, dt=0.1, fc=0.1, kalman=False, H=None):
+    """Orientación, matrices de rotación y trayectorias en metros de un dataset."""
+    data = cargar_dataset(ruta)
+    if len(data['uwb_x']) < 10:
+        raise ValueError(f"Muy pocas muestras ({len(data['uwb_x'])}) para filtfilt")
+    ax, ay, az = data['ax'], data['ay'], data['az']
+
+    # Coordenadas UWB a metros, con la homografía si se pasa una
+    def a_metros(puntos):
+        return (aplicar_homografia(puntos, H) if H is not None else puntos) / 1000
+
+    robotat = not np.isnan(data['robotat_x']).all()
+    yaw_inicial = data['robotat_yaw'][0] if robotat and not np.isnan(data['robotat_yaw'][0]) else None
+    filt_ang, _, _, _ = calcular_orientacion(ax, ay, az, data['gx'], data['gy'], data['gz'],
+                                             data['mx'], data['my'], dt=dt, fc=fc,
+                                             yaw_inicial=yaw_inicial)
+    sesion = {
+        'nombre': os.path.basename(ruta),
+        'dt': dt,
+        'filt_ang': filt_ang,
+        'R_UWB': eul2rot(filt_ang),
+        'uwb': a_metros(np.column_stack((data['uwb_x'], data['uwb_y']))),
+        'kf': None,
+        'robotat': None,
+    }
+    if kalman:
+        posiciones = kalman_posicion(data['uwb_x'], data['uwb_y'], ax * 9.81, ay * 9.81, dt=dt)
+        sesion['kf'] = a_metros(posiciones)
+    if robotat:
+        sesion['robotat'] = np.column_stack((data['robotat_x'], data['robotat_y'])) / 1000
+        sesion['robotat_yaw'] = np.asarray(data['robotat_yaw'])
+        sesion['R_Robotat'] = rotz(np.nan_to_num(data['robotat_yaw']))
+    return sesion
+
+def guardar_sesion(sesion, directorio):
+    """Guarda los arreglos de la sesión como .npy y el resto en sesion.json."""
+    os.makedirs(directorio, exist_ok=True)
+    meta = {}
+    for nombre, valor in sesion.items():
+        if isinstance(valor, np.ndarray):
+            np.save(os.path.join(directorio, nombre + '.npy'), valor)
+        else:
+            meta[nombre] = valor
+    with open(os.path.join(directorio, 'sesion.json'), 'w') as f:
+        json.dump(meta, f)
+    return directorio
+
+def cargar_sesion(directorio):
+    """Sesión guardada con guardar_sesion, los arreglos se abren con memory-map (solo lectura)."""
+    with open(os.path.join(directorio, 'sesion.json')) as f:
+        sesion = json.load(f)
+    for archivo in os.listdir(directorio):
+        if archivo.endswith('.npy'):
+            sesion[archivo[:-4]] = np.load(os.path.join(directorio, archivo), mmap_mode='r')
+    return sesion
+
+def _limites(ax_xy, *trayectorias):
+    puntos = np.concatenate([t for t in trayectorias if t is not None])
+    minimo, maximo = np.nanmin(puntos, axis=0), np.nanmax(puntos, axis=0)
+    margen = 0.05 * np.maximum(maximo - minimo, 0.1)
+    ax_xy.set_xlim([minimo[0] - margen[0], maximo[0] + margen[0]])
+    ax_xy.set_ylim([minimo[1] - margen[1], maximo[1] + margen[1]])
+
+def construir_escena(sesion, fig):
+    """Escena de las V0.0 - V0.2 sobre fig, devuelve el AnimacionPose."""
+    animacion = AnimacionPose(fig, dt=sesion['dt'])
+    con_robotat = sesion['robotat'] is not None
+    ax3d_UWB = fig.add_subplot(221 if con_robotat else 121, projection='3d')
+    animacion.configurar_3d(ax3d_UWB, limite=1, titulo='UWB')
+    animacion.agregar_marco(ax3d_UWB, sesion['R_UWB'], etiquetas=('X (UWB)', 'Y (UWB)', 'Z (UWB)'))
+    animacion.agregar_texto(ax3d_UWB)
+
+    if con_robotat:
+        ax3d_Robotat = fig.add_subplot(222, projection='3d')
+        animacion.configurar_3d(ax3d_Robotat, limite=1, titulo='Robotat')
+        animacion.agregar_marco(ax3d_Robotat, sesion['R_Robotat'], colores=('orange', 'purple', 'cyan'),
+                                etiquetas=('Xr (Robotat)', 'Yr (Robotat)', 'Zr (Robotat)'))
+
+    ax_xy = fig.add_subplot(212 if con_robotat else 122)
+    animacion.agregar_trayectoria(ax_xy, sesion['uwb'][:, 0], sesion['uwb'][:, 1], color='r',
+                                  etiqueta='UWB', marcador='o')
+    if sesion['kf'] is not None:
+        animacion.agregar_trayectoria(ax_xy, sesion['kf'][:, 0], sesion['kf'][:, 1], color='g',
+                                      etiqueta='Kalman', marcador='.')
+    if con_robotat:
+        animacion.agregar_trayectoria(ax_xy, sesion['robotat'][:, 0], sesion['robotat'][:, 1],
+                                      color='b', etiqueta='Robotat', marcador='x')
+    _limites(ax_xy, sesion['uwb'], sesion['kf'], sesion['robotat'])
+    ax_xy.set_xlabel('x (metros)')
+    ax_xy.set_ylabel('y (metros)')
+    ax_xy.legend(loc='upper right')
+    fig.suptitle(sesion['nombre'])
+    return animacion
+
+def _renderizar_bloque(dir_sesion, inicio, fin, destino, png):
+    """Dibuja los cuadros [inicio, fin) con blitting sobre Agg.
+
+    La sesión se lee de dir_sesion (guardar_sesion). Con png=True guarda cada cuadro como PNG en
+    destino, si no escribe los cuadros RGB crudos en un archivo temporal dentro de destino.
+    Devuelve (archivo, (alto, ancho)).
+    """
+    sesion = cargar_sesion(dir_sesion)
+    fig = plt.figure(figsize=FIGSIZE, dpi=DPI)
+    animacion = construir_escena(sesion, fig)
+
+    # El fondo (ejes, marcos de referencia, trayectoria completa) se dibuja una sola vez
+    fig.canvas.draw()
+    fondo = fig.canvas.copy_from_bbox(fig.bbox)
+    alto, ancho = fig.canvas.get_width_height()[::-1]
+
+    archivo = os.path.join(destino, f'bloque_{inicio:08d}.rgb')
+    crudo = None if png else open(archivo, 'wb')
+    try:
+        for i in range(inicio, fin):
+            fig.canvas.restore_region(fondo)
+            for artista in animacion.update(i):
+                artista.axes.draw_artist(artista)
+            cuadro = np.asarray(fig.canvas.buffer_rgba())[..., :3]
+            if png:
+                plt.imsave(os.path.join(destino, f'frame_{i:06d}.png'), cuadro)
+            else:
+                crudo.write(np.ascontiguousarray(cuadro).tobytes())
+    finally:
+        if crudo is not None:
+            crudo.close()
+        plt.close(fig)
+    return (None if png else archivo), (alto, ancho)
+
+def _comando_ffmpeg(ffmpeg, salida, alto, ancho, fps):
+    comando = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+               '-s', f'{ancho}x{alto}', '-r', f'{fps:g}', '-i', '-']
+    if salida.lower().endswith('.gif'):
+        comando += ['-vf', 'split[a][b];[a]palettegen[p];[b][p]paletteuse']
+    else:
+        # H.264 con yuv420p necesita ancho y alto pares
+        comando += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p']
+    return comando + [salida]
+
+def exportar_video(ruta, salida, workers=None, dt=0.1, fc=0.1, kalman=False, H=None,
+                   cuadros_por_bloque=CUADROS_POR_BLOQUE, ffmpeg=None):
+    """Exporta la animación de un dataset a MP4 / GIF o a una secuencia de PNG.
+
+    Devuelve la ruta del video o de la carpeta con los cuadros.
+    """
+    workers = workers or min(4, os.cpu_count() or 1)
+    ffmpeg = shutil.which('ffmpeg') if ffmpeg is None else ffmpeg
+    sesion = preparar_sesion(ruta, dt, fc, kalman, H)
+    n = len(sesion['uwb'])
+    rangos = [(i, min(i + cuadros_por_bloque, n)) for i in range(0, n, cuadros_por_bloque)]
+
+    if not ffmpeg:
+        destino = os.path.splitext(salida)[0] + '_frames'
+        os.makedirs(destino, exist_ok=True)
+        print(f'ffmpeg no está instalado, se guardan {n} cuadros PNG en {destino}')
+        with tempfile.TemporaryDirectory() as temporal, ProcessPoolExecutor(max_workers=workers) as pool:
+            dir_sesion = guardar_sesion(sesion, os.path.join(temporal, 'sesion'))
+            list(pool.map(_renderizar_bloque, *zip(*[(dir_sesion, i, f, destino, True) for i, f in rangos])))
+        return destino
+
+    proceso = None
+    with tempfile.TemporaryDirectory() as temporal, ProcessPoolExecutor(max_workers=workers) as pool:
+        dir_sesion = guardar_sesion(sesion, os.path.join(temporal, 'sesion'))
+        # Ventana de bloques en vuelta: a lo más workers + 1 archivos crudos en el disco temporal
+        siguientes = iter(rangos)
+        en_vuelta = deque()
+
+        def enviar():
+            rango = next(siguientes, None)
+            if rango is not None:
+                en_vuelta.append(pool.submit(_renderizar_bloque, dir_sesion, *rango, temporal, False))
+
+        for _ in range(workers):
+            enviar()
+        try:
+            # Los bloques se mandan a ffmpeg en orden conforme van terminando
+            for k, (i, f) in enumerate(rangos, start=1):
+                archivo, (alto, ancho) = en_vuelta.popleft().result()
+                enviar()
+                if proceso is None:
+                    proceso = subprocess.Popen(_comando_ffmpeg(ffmpeg, salida, alto, ancho, 1 / dt),
+                                               stdin=subprocess.PIPE)
+                with open(archivo, 'rb') as crudo:
+                    shutil.copyfileobj(crudo, proceso.stdin, 1 << 20)
+                os.remove(archivo)
+                print(f'[{k}/{len(rangos)}] cuadros {i} - {f - 1}')
+        finally:
+            for futuro in en_vuelta:
+                futuro.cancel()
+            if proceso is not None:
+                proceso.stdin.close()
+                proceso.wait()
+    if proceso is None or proceso.returncode != 0:
+        raise RuntimeError(f'ffmpeg no pudo generar {salida}')
+    return salida
+
+def figura_estatica(ruta, salida, dt=0.1, fc=0.1, H=None):
+    """PNG con la comparación de trayectorias (UWB, Kalman, Robotat) y del yaw de un dataset."""
+    sesion = preparar_sesion(ruta, dt, fc, kalman=True, H=H)
+    con_robotat = sesion['robotat'] is not None
+    fig, ejes = plt.subplots(1, 2 if con_robotat else 1, figsize=(14 if con_robotat else 7, 6),
+                             squeeze=False)
+    ax_xy = ejes[0, 0]
+    ax_xy.plot(sesion['uwb'][:, 0], sesion['uwb'][:, 1], 'r.', markersize=2, alpha=0.5, label='UWB')
+    ax_xy.plot(sesion['kf'][:, 0], sesion['kf'][:, 1], 'g-', linewidth=1, label='Kalman')
+    if con_robotat:
+        ax_xy.plot(sesion['robotat'][:, 0], sesion['robotat'][:, 1], 'b-', linewidth=1, label='Robotat')
+    _limites(ax_xy, sesion['uwb'], sesion['kf'], sesion['robotat'])
+    ax_xy.set_xlabel('x (metros)')
+    ax_xy.set_ylabel('y (metros)')
+    ax_xy.set_title('Trayectorias' if H is not None else 'Trayectorias (UWB sin homografía)')
+    ax_xy.legend()
+
+    if con_robotat:
+        t = np.arange(len(sesion['filt_ang'])) * dt
+        ax_yaw = ejes[0, 1]
+        ax_yaw.plot(t, sesion['filt_ang'][:, 2], 'r-', label='UWB (filtro complementario)')
+        ax_yaw.plot(t, sesion['robotat_yaw'], 'b-', label='Robotat')
+        ax_yaw.set_xlabel('Tiempo (s)')
+        ax_yaw.set_ylabel('Yaw (grados)')
+        ax_yaw.set_title('Yaw')
+        ax_yaw.legend()
+
+    fig.suptitle(sesion['nombre'])
+    fig.tight_layout()
+    fig.savefig(salida, dpi=100)
+    plt.close(fig)
+    return salida
+
+def _figura_archivo(ruta, destino, raiz, dt, fc, H):
+    nombre = os.path.splitext(os.path.relpath(ruta, raiz))[0].replace(os.sep, '__') + '.png'
+    try:
+        return figura_estatica(ruta, os.path.join(destino, nombre), dt, fc, H), ''
+    except Exception as e:
+        # Aislar el error del archivo para que el resto del lote continúe
+        return None, f'{type(e).__name__}: {e}'
+
+def exportar_figuras(archivos, destino, workers=None, dt=0.1, fc=0.1, H=None, raiz=RAIZ_DATASETS):
+    """Figuras estáticas de todos los archivos en un pool de procesos, devuelve {ruta: error}."""
+    workers = workers or min(4, os.cpu_count() or 1)
+    os.makedirs(destino, exist_ok=True)
+    errores = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = {pool.submit(_figura_archivo, ruta, destino, raiz, dt, fc, H): ruta for ruta in archivos}
+        for k, futuro in enumerate(as_completed(futuros), start=1):
+            ruta = futuros[futuro]
+            _, error = futuro.result()
+            if error:
+                errores[ruta] = error
+            print(f"[{k}/{len(archivos)}] {os.path.relpath(ruta, raiz)} -> {'error' if error else 'ok'}")
+    return errores
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Exportación de videos y figuras sin ventana.')
+    subparsers = parser.add_subparsers(dest='modo', required=True)
+
+    video = subparsers.add_parser('video', help='Animación de un dataset a MP4 / GIF')
+    video.add_argument('archivo', help='Dataset .csv')
+    video.add_argument('--salida', default=None, help='Video de salida (.mp4 o .gif)')
+    video.add_argument('--kalman', action='store_true', help='Agregar la trayectoria del filtro de Kalman')
+
+    figuras = subparsers.add_parser('figuras', help='Figuras estáticas de todos los datasets')
+    figuras.add_argument('--raiz', default=RAIZ_DATASETS, help='Carpeta Datasets')
+    figuras.add_argument('--carpetas', nargs='+', default=CARPETAS_DATASETS,
+                         help='Subcarpetas de Datasets a procesar')
+    figuras.add_argument('--salida', default='figuras', help='Carpeta de las figuras')
+
+    for sub in (video, figuras):
+        sub.add_argument('--workers', type=int, default=None, help='Número de procesos (máximo)')
+        sub.add_argument('--dt', type=float, default=0.1, help='Periodo de muestreo (s)')
+        sub.add_argument('--fc', type=float, default=0.1, help='Frecuencia de corte (Hz)')
+        sub.add_argument('--sin-homografia', action='store_true',
+                         help='No pasar el UWB por la homografía (no se alinea con el Robotat)')
+    args = parser.parse_args()
+
+    H = None
+    if not args.sin_homografia:
+        from homografia import cargar_homografia
+        H = cargar_homografia()
+
+    inicio = time.perf_counter()
+    if args.modo == 'video':
+        salida = args.salida or os.path.splitext(os.path.basename(args.archivo))[0] + '.mp4'
+        resultado = exportar_video(args.archivo, salida, args.workers, args.dt, args.fc, args.kalman, H)
+        print(f'Exportado {resultado} en {time.perf_counter() - inicio:.1f} s')
+    else:
+        archivos = buscar_datasets(args.raiz, args.carpetas)
+        errores = exportar_figuras(archivos, args.salida, args.workers, args.dt, args.fc, H, args.raiz)
+        print(f'{len(archivos) - len(errores)} figuras en {args.salida}, {len(errores)} con error, '
+              f'{time.perf_counter() - inicio:.1f} s')
@@ -0,0 +1,230 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: post-procesamiento fuera de memoria (filtfilt por bloques)
+#
+# Descripcion: filtfilt de fase cero para grabaciones de horas que no caben en memoria. filtfilt
+# hace una pasada hacia adelante sobre la señal extendida en los bordes (extensión impar de padlen
+# muestras), otra hacia atrás sobre el resultado y recorta la extensión. Aquí las dos pasadas
+# corren por bloques con el estado zi de lfilter guardado entre bloques, así que el resultado es
+# el mismo que filtfilt sobre el arreglo completo (a precisión de punto flotante):
+#   - adelante: los bloques se leen del .csv o del cache en memory-map (leer_por_bloques), los
+#     primeros padlen + 1 valores arman la extensión inicial y los últimos se guardan para la
+#     final, la salida se escribe en un archivo temporal binario a medida que se produce,
+#   - atrás: el temporal se recorre del final al inicio en bloques y el resultado se escribe en
+#     su lugar de un .npy abierto con memory-map.
+# La memoria pico es un múltiplo fijo del tamaño de bloque, el resto va a disco.
+#
+# * orientacion_fuera_de_memoria arma el filtro complementario de orientacion.py (tilt, giroscopio
+#   integrado y magnetómetro) con este filtro y escribe filt_ang.npy.
+# * Uso: python filtrado_bloques.py ruta.csv --salida orientacion --bloque 100000 --verificar
+# -------------------------------------------------------------------------------------------------
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from scipy.signal import lfilter, lfilter_zi
+
+from cargador_datos import leer_por_bloques
+from orientacion import angulos_acelerometro, disenar_filtros
+
+BLOQUE = 100_000
+
+class FiltfiltBloques:
+    """filtfilt(b, a, x, axis=0) de un arreglo (N, k) que llega por bloques de filas.
+
+    alimentar() recibe los bloques en orden (hace la pasada hacia adelante) y terminar() hace la
+    pasada hacia atrás y devuelve el .npy (N, k) de salida abierto en memory-map.
+    """
+
+    def __init__(self, b, a, columnas, salida, dir_temporal=None, bloque=BLOQUE, padlen=None):
+        self.b = np.asarray(b, dtype=float)
+        self.a = np.asarray(a, dtype=float)
+        self.columnas = columnas
+        self.salida = salida
+        self.bloque = bloque
+        # Mismo padlen por defecto que scipy.signal.filtfilt
+        self.padlen = 3 * max(len(self.a), len(self.b)) if padlen is None else padlen
+        self.zi = lfilter_zi(self.b, self.a)[:, np.newaxis]
+        self.estado = None
+        self.inicio = np.empty((0, columnas))  # Filas guardadas hasta tener padlen + 1
+        self.cola = np.empty((0, columnas))  # Últimas padlen + 1 filas vistas
+        self.n = 0
+        self.dir_temporal = tempfile.mkdtemp(dir=dir_temporal)
+        self.temporal = open(os.path.join(self.dir_temporal, 'adelante.bin'), 'wb')
+        self.escritas = 0  # Filas de la pasada hacia adelante en el temporal
+
+    def _adelante(self, x):
+        y, self.estado = lfilter(self.b, self.a, x, axis=0, zi=self.estado)
+        self.temporal.write(np.ascontiguousarray(y).tobytes())
+        self.escritas += len(y)
+
+    def alimentar(self, x):
+        """Pasada hacia adelante de un bloque (k, columnas) o (k,) si hay una sola columna."""
+        x = np.asarray(x, dtype=float).reshape(-1, self.columnas)
+        if not len(x):
+            return
+        self.n += len(x)
+        self.cola = np.concatenate((self.cola, x[-(self.padlen + 1):]))[-(self.padlen + 1):]
+
+        if self.estado is None:
+            # La extensión inicial necesita las primeras padlen + 1 muestras
+            self.inicio = np.concatenate((self.inicio, x))
+            if len(self.inicio) <= self.padlen:
+                return
+            x, self.inicio = self.inicio, None
+            x0 = x[0]
+            extension = 2 * x0 - x[self.padlen:0:-1]
+            self.estado = self.zi * (extension[0] if self.padlen else x0)
+            self._adelante(extension)
+        self._adelante(x)
+
+    def terminar(self):
+        """Extensión final, pasada hacia atrás y salida (N, columnas) en memory-map."""
+        if self.estado is None:
+            raise ValueError(f'La señal debe tener más de padlen = {self.padlen} muestras')
+        ultima = self.cola[-1]
+        self._adelante(2 * ultima - self.cola[-2::-1][:self.padlen])
+        self.temporal.close()
+
+        try:
+            y = np.memmap(self.temporal.name, dtype=np.float64, mode='r',
+                          shape=(self.escritas, self.columnas))
+            salida = np.lib.format.open_memmap(self.salida, mode='w+', dtype=np.float64,
+                                               shape=(self.n, self.columnas))
+            estado = self.zi * y[-1]
+            p = self.padlen
+            for hasta in range(self.escritas, 0, -self.bloque):
+                desde = max(hasta - self.bloque, 0)
+                atras, estado = lfilter(self.b, self.a, y[desde:hasta][::-1], axis=0, zi=estado)
+                # Fila j del temporal corresponde a la fila j - padlen de la salida
+                i0, i1 = max(desde, p), min(hasta, self.n + p)
+                if i0 < i1:
+                    salida[i0 - p:i1 - p] = atras[::-1][i0 - desde:i1 - desde]
+            salida.flush()
+            del y
+        finally:
+            shutil.rmtree(self.dir_temporal, ignore_errors=True)
+        return salida
+
+class ColumnasEnDisco:
+    """Arreglo (N, k) que se escribe por bloques a un .npy sin conocer N al inicio."""
+
+    def __init__(self, salida, columnas, dir_temporal=None):
+        self.salida = salida
+        self.columnas = columnas
+        self.dir_temporal = tempfile.mkdtemp(dir=dir_temporal)
+        self.temporal = open(os.path.join(self.dir_temporal, 'columnas.bin'), 'wb')
+        self.n = 0
+
+    def agregar(self, x):
+        x = np.asarray(x, dtype=np.float64).reshape(-1, self.columnas)
+        self.temporal.write(np.ascontiguousarray(x).tobytes())
+        self.n += len(x)
+
+    def terminar(self, bloque=BLOQUE):
+        self.temporal.close()
+        try:
+            datos = np.memmap(self.temporal.name, dtype=np.float64, mode='r', shape=(self.n, self.columnas))
+            salida = np.lib.format.open_memmap(self.salida, mode='w+', dtype=np.float64,
+                                               shape=(self.n, self.columnas))
+            for desde in range(0, self.n, bloque):
+                salida[desde:desde + bloque] = datos[desde:desde + bloque]
+            salida.flush()
+            del datos
+        finally:
+            shutil.rmtree(self.dir_temporal, ignore_errors=True)
+        return salida
+
+def orientacion_fuera_de_memoria(ruta, destino, dt=0.1, fc=0.1, peso_yaw=0.98, yaw_inicial='robotat',
+                                 bloque=BLOQUE, usar_cache=True):
+    """calcular_orientacion(...)[0] de un dataset leyendo por bloques, escribe destino/filt_ang.npy.
+
+    yaw_inicial='robotat' usa el primer yaw del Robotat si existe (como procesamiento_lote.py),
+    None no siembra el yaw. Devuelve el arreglo (N, 3) en memory-map.
+    """
+    os.makedirs(destino, exist_ok=True)
+    b, a, d, c = disenar_filtros(dt, fc)
+    pasa_bajas = FiltfiltBloques(b, a, 3, os.path.join(destino, 'pasa_bajas.npy'), destino, bloque)
+    pasa_altas = FiltfiltBloques(d, c, 2, os.path.join(destino, 'pasa_altas.npy'), destino, bloque)
+    gyro_z = ColumnasEnDisco(os.path.join(destino, 'gyro_z.npy'), 1, destino)
+
+    columnas = ('ax', 'ay', 'az', 'gx', 'gy', 'gz', 'mx', 'my', 'robotat_yaw')
+    acumulado = np.zeros(3)
+    primero = True
+    for datos in leer_por_bloques(ruta, bloque, columnas, usar_cache):
+        pasos = np.column_stack((datos['gx'], datos['gy'], datos['gz'])).astype(float) * dt
+        if primero and len(pasos):
+            # Yaw inicial igual que angulos_giroscopio: la primera muestra es solo su paso
+            semilla = datos['robotat_yaw'][0] if yaw_inicial == 'robotat' else yaw_inicial
+            if semilla is not None and not np.isnan(semilla):
+                primer_paso = pasos[0, 2]
+                pasos[0, 2] = semilla
+                gyro = np.cumsum(pasos, axis=0)
+                acumulado = gyro[-1].copy()
+                gyro[0, 2] = primer_paso
+            else:
+                gyro = np.cumsum(pasos, axis=0)
+                acumulado = gyro[-1].copy()
+            primero = False
+        else:
+            gyro = np.cumsum(pasos, axis=0) + acumulado
+            acumulado = gyro[-1].copy()
+
+        accel = angulos_acelerometro(datos['ax'], datos['ay'], datos['az'])[:, :2]
+        mag_z = np.rad2deg(np.arctan2(np.asarray(datos['my'], dtype=float),
+                                      np.asarray(datos['mx'], dtype=float)))
+        pasa_bajas.alimentar(np.column_stack((accel, mag_z)))
+        pasa_altas.alimentar(gyro[:, :2])
+        gyro_z.agregar(gyro[:, 2])
+
+    bajas = pasa_bajas.terminar()
+    altas = pasa_altas.terminar()
+    yaw_giro = gyro_z.terminar()
+
+    # Combinación final por bloques, igual que filtro_complementario
+    n = len(bajas)
+    filt_ang = np.lib.format.open_memmap(os.path.join(destino, 'filt_ang.npy'), mode='w+',
+                                         dtype=np.float64, shape=(n, 3))
+    for desde in range(0, n, bloque):
+        tramo = slice(desde, desde + bloque)
+        filt_ang[tramo, :2] = altas[tramo] + bajas[tramo, :2]
+        filt_ang[tramo, 2] = yaw_giro[tramo, 0] * peso_yaw + bajas[tramo, 2] * (1 - peso_yaw)
+    filt_ang.flush()
+
+    del bajas, altas, yaw_giro
+    for nombre in ('pasa_bajas.npy', 'pasa_altas.npy', 'gyro_z.npy'):
+        os.remove(os.path.join(destino, nombre))
+    return filt_ang
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Orientación con filtfilt por bloques (fuera de memoria).')
+    parser.add_argument('archivo', help='Dataset .csv')
+    parser.add_argument('--salida', default='orientacion', help='Carpeta de salida (filt_ang.npy)')
+    parser.add_argument('--bloque', type=int, default=BLOQUE, help='Filas por bloque')
+    parser.add_argument('--dt', type=float, default=0.1, help='Periodo de muestreo (s)')
+    parser.add_argument('--fc', type=float, default=0.1, help='Frecuencia de corte (Hz)')
+    parser.add_argument('--sin-cache', action='store_true', help='Leer siempre el .csv')
+    parser.add_argument('--verificar', action='store_true',
+                        help='Comparar contra calcular_orientacion en memoria (archivos pequeños)')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    filt_ang = orientacion_fuera_de_memoria(args.archivo, args.salida, args.dt, args.fc,
+                                            bloque=args.bloque, usar_cache=not args.sin_cache)
+    print(f'{len(filt_ang)} muestras en {time.perf_counter() - inicio:.1f} s -> '
+          f"{os.path.join(args.salida, 'filt_ang.npy')}")
+
+    if args.verificar:
+        from cargador_datos import cargar_dataset
+        from orientacion import calcular_orientacion
+
+        data = cargar_dataset(args.archivo, usar_cache=not args.sin_cache)
+        yaw_inicial = None if np.isnan(data['robotat_yaw'][0]) else data['robotat_yaw'][0]
+        referencia = calcular_orientacion(*(data[c] for c in ('ax', 'ay', 'az', 'gx', 'gy', 'gz', 'mx', 'my')),
+                                          dt=args.dt, fc=args.fc, yaw_inicial=yaw_inicial)[0]
+        print(f'Error máximo contra filtfilt en memoria: {np.abs(filt_ang - referencia).max():.3e} grados')
@@ -0,0 +1,152 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de procesamiento (orientación en flujo)
+#
+# Descripcion: Filtro complementario de orientación con estado, para usar la misma lógica en vivo
+# y fuera de línea. Las V0.0 - V0.2 filtran con filtfilt sobre el recorrido completo (necesita
+# toda la grabación en memoria) y la V0.4 usaba otro filtro escrito a mano (alpha = 0.96,
+# alpha_yaw = 0.85), así que los ángulos en vivo y los del post-procesamiento no coincidían.
+# FiltroComplementarioContinuo usa el mismo diseño Butterworth de orientacion.py en secciones de
+# segundo orden con el estado zi guardado entre llamadas: recibe una muestra o un bloque a la vez
+# y su memoria no depende de la duración de la sesión.
+#
+# * Equivalencia: la salida por bloques es igual (a precisión de punto flotante) a
+#   calcular_orientacion(..., causal=True) sobre el recorrido completo, sin importar cómo se
+#   partan los bloques. Contra el filtfilt de las V0.0 - V0.2 la diferencia es el retardo de
+#   fase del filtro causal (filtfilt es de fase cero), python filtro_continuo.py la mide.
+# -------------------------------------------------------------------------------------------------
+
+import numpy as np
+from scipy.signal import sosfilt
+
+from orientacion import angulos_acelerometro, disenar_filtros_sos, estado_inicial
+
+class FiltroComplementarioContinuo:
+    """Filtro complementario de orientación (roll, pitch, yaw en grados) muestra a muestra."""
+
+    def __init__(self, dt=0.1, fc=0.1, peso_yaw=0.98, yaw_inicial=None):
+        self.dt = dt
+        self.peso_yaw = peso_yaw
+        self.yaw_inicial = yaw_inicial
+        self.sos_lp, self.sos_hp = disenar_filtros_sos(dt, fc)
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Vuelve al estado inicial (antes de la primera muestra)."""
+        self.muestras = 0
+        self.gyro_acumulado = np.zeros(3)  # Giroscopio integrado hasta la última muestra
+        self.zi_acc = None  # Pasa bajas del tilt del acelerómetro (x, y)
+        self.zi_gyro = None  # Pasa altas del giroscopio integrado (x, y)
+        self.zi_mag = None  # Pasa bajas del yaw del magnetómetro
+
+    def actualizar(self, ax, ay, az, gx, gy, gz, mx=None, my=None, dt=None):
+        """Filtra una muestra (escalares, devuelve (3,)) o un bloque (arreglos (k,), devuelve (k, 3)).
+
+        dt permite pasar el periodo real de cada muestra para la integración del giroscopio
+        (alineacion.dt_por_muestra), si no se usa el dt del diseño.
+        """
+        escalar = np.ndim(ax) == 0
+        ax, ay, az, gx, gy, gz = (np.atleast_1d(np.asarray(v, dtype=float)) for v in (ax, ay, az, gx, gy, gz))
+        k = len(ax)
+        if k == 0:
+            return np.empty((0, 3))
+        dt = self.dt if dt is None else np.atleast_1d(np.asarray(dt, dtype=float))
+
+        accel_ang = angulos_acelerometro(ax, ay, az)[:, :2]
+        gyro_ang = self._integrar(np.column_stack((gx, gy, gz)) * np.reshape(dt, (-1, 1)))
+
+        if self.muestras == 0:
+            # El estado arranca en régimen estacionario de la primera muestra (igual que filtrar_causal)
+            self.zi_acc = estado_inicial(self.sos_lp, accel_ang[0])
+            self.zi_gyro = estado_inicial(self.sos_hp, gyro_ang[0, :2])
+
+        filt_ang = np.empty((k, 3))
+        acc_lp, self.zi_acc = sosfilt(self.sos_lp, accel_ang, axis=0, zi=self.zi_acc)
+        gyro_hp, self.zi_gyro = sosfilt(self.sos_hp, gyro_ang[:, :2], axis=0, zi=self.zi_gyro)
+        filt_ang[:, :2] = gyro_hp + acc_lp
+
+        if mx is None or my is None:
+            filt_ang[:, 2] = gyro_ang[:, 2]  # Usar solo giroscopio para yaw
+        else:
+            mag_yaw = np.rad2deg(np.arctan2(np.atleast_1d(np.asarray(my, dtype=float)),
+                                            np.atleast_1d(np.asarray(mx, dtype=float))))
+            if self.muestras == 0:
+                self.zi_mag = estado_inicial(self.sos_lp, mag_yaw[0])
+            mag_lp, self.zi_mag = sosfilt(self.sos_lp, mag_yaw, zi=self.zi_mag)
+            filt_ang[:, 2] = gyro_ang[:, 2] * self.peso_yaw + mag_lp * (1 - self.peso_yaw)
+
+        self.muestras += k
+        return filt_ang[0] if escalar else filt_ang
+
+    def _integrar(self, pasos):
+        """Integración acumulada del giroscopio que continúa desde el bloque anterior.
+
+        Con yaw_inicial, el yaw de la primera muestra es solo su paso y desde la segunda se
+        acumula a partir de yaw_inicial, igual que angulos_giroscopio.
+        """
+        if self.muestras == 0 and self.yaw_inicial is not None:
+            pasos = pasos.copy()
+            primer_paso_z = pasos[0, 2]
+            pasos[0, 2] = self.yaw_inicial
+            gyro_ang = np.cumsum(pasos, axis=0) + self.gyro_acumulado
+            self.gyro_acumulado = gyro_ang[-1].copy()
+            gyro_ang[0, 2] = primer_paso_z
+            return gyro_ang
+        gyro_ang = np.cumsum(pasos, axis=0) + self.gyro_acumulado
+        self.gyro_acumulado = gyro_ang[-1].copy()
+        return gyro_ang
+
+def orientacion_por_bloques(ax, ay, az, gx, gy, gz, mx=None, my=None, dt=0.1, fc=0.1,
+                            peso_yaw=0.98, yaw_inicial=None, bloque=4096, salida=None):
+    """Orientación filtrada (N, 3) de un recorrido recorriéndolo por bloques.
+
+    Las columnas pueden ser memory-maps del cache (cargar_dataset), solo se lee un bloque a la vez.
+    salida permite pasar un arreglo (N, 3) ya asignado (por ejemplo np.lib.format.open_memmap).
+    """
+    n = len(ax)
+    salida = np.empty((n, 3)) if salida is None else salida
+    filtro = FiltroComplementarioContinuo(dt, fc, peso_yaw, yaw_inicial)
+    magnetometro = mx is not None and my is not None
+    for desde in range(0, n, bloque):
+        hasta = min(desde + bloque, n)
+        tramo = slice(desde, hasta)
+        salida[tramo] = filtro.actualizar(ax[tramo], ay[tramo], az[tramo], gx[tramo], gy[tramo],
+                                          gz[tramo], mx[tramo] if magnetometro else None,
+                                          my[tramo] if magnetometro else None)
+    return salida
+
+def verificar_equivalencia(ruta, bloques=(1, 7, 4096), dt=0.1, fc=0.1):
+    """Compara el filtro por bloques contra calcular_orientacion en un dataset.
+
+    Devuelve {'bloque_<k>': error máximo contra la referencia causal} y la diferencia (RMS y
+    máxima, en grados) del filtro causal contra el filtfilt de las V0.0 - V0.2.
+    """
+    from cargador_datos import cargar_dataset
+    from orientacion import calcular_orientacion
+
+    data = cargar_dataset(ruta)
+    columnas = [data[c] for c in ('ax', 'ay', 'az', 'gx', 'gy', 'gz', 'mx', 'my')]
+    yaw_inicial = None if np.isnan(data['robotat_yaw'][0]) else data['robotat_yaw'][0]
+    causal = calcular_orientacion(*columnas, dt=dt, fc=fc, yaw_inicial=yaw_inicial, causal=True)[0]
+    fase_cero = calcular_orientacion(*columnas, dt=dt, fc=fc, yaw_inicial=yaw_inicial)[0]
+
+    resultado = {}
+    for bloque in bloques:
+        continuo = orientacion_por_bloques(*columnas, dt=dt, fc=fc, yaw_inicial=yaw_inicial,
+                                           bloque=bloque)
+        resultado[f'bloque_{bloque}'] = float(np.abs(continuo - causal).max())
+    diferencia = causal - fase_cero
+    resultado['vs_filtfilt_rms'] = np.sqrt(np.mean(diferencia**2, axis=0)).round(3).tolist()
+    resultado['vs_filtfilt_max'] = np.abs(diferencia).max(axis=0).round(3).tolist()
+    return resultado
+
+if __name__ == "__main__":
+    import sys
+
+    from procesamiento_lote import buscar_datasets
+
+    archivos = sys.argv[1:] or buscar_datasets(carpetas=['Dinamico'])[:3]
+    for ruta in archivos:
+        print(ruta)
+        print(verificar_equivalencia(ruta))
@@ -0,0 +1,272 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de procesamiento (filtro de Kalman)
+#
+# Descripcion: Filtro de Kalman de posición 2D de la V0.1 (1_UWB_ACC_POSE_KalmanFilter.py) como
+# función reutilizable. El estado es [pos_x, pos_y, vel_x, vel_y], la predicción integra el
+# acelerómetro y la medición es la posición del UWB.
+#
+# * Las matrices del modelo son constantes, se arman una sola vez y la salida se guarda en un
+#   arreglo preasignado.
+# * Con estacionario=True se usa la ganancia de estado estacionario (solución de la DARE), cada
+#   paso queda en unas cuantas multiplicaciones y sumas.
+# * kalman_lote corre el filtro sobre varias grabaciones a la vez con estados apilados (einsum),
+#   kalman_directorio lo aplica a todos los archivos de una carpeta (p. ej. Datasets/Dinamico).
+# * suavizado_rts es el suavizador de Rauch-Tung-Striebel para post-procesamiento: el paso hacia
+#   adelante guarda las covarianzas de predicción y filtrado en arreglos preasignados (en disco
+#   con memory-map si la grabación es larga) y el paso hacia atrás se hace por bloques de tiempo.
+# -------------------------------------------------------------------------------------------------
+
+import glob
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from scipy.linalg import block_diag, solve_discrete_are
+
+def matrices_modelo(dt=0.1, q=0.1, r=1.0):
+    """Devuelve (F, B, H, Q, R) del modelo de posición con entrada de aceleración."""
+    F = np.eye(4)
+    F[0, 2] = dt
+    F[1, 3] = dt
+    B = np.zeros((4, 2))  # La aceleración solo entra a la velocidad (como en la V0.1)
+    B[2, 0] = dt
+    B[3, 1] = dt
+    H = np.eye(2, 4)  # Matriz de observación
+    Q = block_diag(np.eye(2) * q, np.eye(2) * q)  # Matriz de ruido del proceso
+    R = np.eye(2) * r  # Matriz de ruido de la medida
+    return F, B, H, Q, R
+
+def matrices_paso(dt):
+    """F y B de cada paso como arreglos (N, 4, 4) y (N, 4, 2) para un dt por muestra."""
+    dt = np.asarray(dt, dtype=float)
+    F = np.broadcast_to(np.eye(4), (len(dt), 4, 4)).copy()
+    F[:, 0, 2] = dt
+    F[:, 1, 3] = dt
+    B = np.zeros((len(dt), 4, 2))
+    B[:, 2, 0] = dt
+    B[:, 3, 1] = dt
+    return F, B
+
+def ganancia_estacionaria(dt=0.1, q=0.1, r=1.0):
+    """Ganancia K (4, 2) de estado estacionario a partir de la ecuación de Riccati discreta."""
+    F, _, H, Q, R = matrices_modelo(dt, q, r)
+    P_pred = solve_discrete_are(F.T, H.T, Q, R)  # Covarianza de predicción estacionaria
+    S = H @ P_pred @ H.T + R
+    return np.linalg.solve(S, H @ P_pred).T
+
+def kalman_posicion(uwb_x, uwb_y, ax, ay, dt=0.1, q=0.1, r=1.0, estacionario=False, salida=None):
+    """Filtro de Kalman de posición como en la V0.1, devuelve un arreglo (N, 2) de posiciones.
+
+    salida permite pasar un arreglo (N, 2) ya asignado para no crear uno nuevo. dt puede ser un
+    arreglo (N,) con el periodo real de cada muestra (alineacion.py), solo sin estacionario.
+    """
+    n = len(ax)
+    positions = np.empty((n, 2)) if salida is None else salida
+    por_muestra = np.ndim(dt) > 0
+    if por_muestra and estacionario:
+        raise ValueError('El filtro estacionario necesita un dt fijo, remuestrear primero')
+    F, B, H, Q, R = matrices_modelo(float(np.mean(dt)) if por_muestra else dt, q, r)
+    if por_muestra:
+        F_pasos, B_pasos = matrices_paso(dt)
+    z = np.column_stack((uwb_x, uwb_y)).astype(float)
+    u = np.column_stack((ax, ay)).astype(float)
+
+    x_pos = np.zeros(4)  # Estado [pos_x, pos_y, vel_x, vel_y]
+
+    if estacionario:
+        # Con K fija el paso es x = A x + B' u + K z, con A = (I - K H) F y B' = (I - K H) B
+        K = ganancia_estacionaria(dt, q, r)
+        IKH = np.eye(4) - K @ H
+        A = IKH @ F
+        entrada = u @ (IKH @ B).T + z @ K.T
+        for i in range(n):
+            x_pos = A @ x_pos + entrada[i]
+            positions[i] = x_pos[:2]
+        return positions
+
+    P_pos = np.eye(4)  # Covarianza del estado
+    I4 = np.eye(4)
+    for i in range(n):
+        if por_muestra:
+            F, B = F_pasos[i], B_pasos[i]
+
+        # Predicción del estado (doble integración del acelerómetro)
+        x_pos = F @ x_pos + B @ u[i]
+        P_pos = F @ P_pos @ F.T + Q
+
+        # Actualización con la medida del UWB
+        y_pos = z[i] - H @ x_pos
+        S_pos = H @ P_pos @ H.T + R
+        K_pos = np.linalg.solve(S_pos, H @ P_pos).T  # P H^T S^-1 sin invertir S (S y P simétricas)
+        x_pos = x_pos + K_pos @ y_pos
+        P_pos = (I4 - K_pos @ H) @ P_pos
+
+        # Almacenar posición
+        positions[i] = x_pos[:2]
+
+    return positions
+
+def kalman_lote(Z, U, dt=0.1, q=0.1, r=1.0, estacionario=False):
+    """Filtro de Kalman sobre M grabaciones a la vez.
+
+    Z y U son arreglos (M, N, 2) con la medida UWB y la aceleración. Las grabaciones más cortas se
+    rellenan con NaN: en esos pasos no hay actualización y la salida queda en NaN. Devuelve un
+    arreglo (M, N, 2) con las posiciones filtradas.
+    """
+    Z = np.asarray(Z, dtype=float)
+    U = np.nan_to_num(np.asarray(U, dtype=float))
+    M, N, _ = Z.shape
+    F, B, H, Q, R = matrices_modelo(dt, q, r)
+    valido = ~np.isnan(Z).any(axis=2)  # (M, N)
+    Z = np.nan_to_num(Z)
+
+    positions = np.full((M, N, 2), np.nan)
+    X = np.zeros((M, 4))
+
+    if estacionario:
+        K = ganancia_estacionaria(dt, q, r)
+        for i in range(N):
+            X_pred = X @ F.T + U[:, i] @ B.T
+            X_upd = X_pred + (Z[:, i] - X_pred[:, :2]) @ K.T
+            X = np.where(valido[:, i, None], X_upd, X_pred)
+            positions[valido[:, i], i] = X[valido[:, i], :2]
+        return positions
+
+    P = np.broadcast_to(np.eye(4), (M, 4, 4)).copy()
+    I4 = np.eye(4)
+    for i in range(N):
+        # Predicción de todas las grabaciones
+        X = X @ F.T + U[:, i] @ B.T
+        P = np.einsum('ij,mjk,lk->mil', F, P, F) + Q
+
+        # Actualización (H = [I 0], así H P H^T es el bloque 2x2 de posición)
+        S = P[:, :2, :2] + R
+        K = np.linalg.solve(S, P[:, :2, :]).transpose(0, 2, 1)  # (M, 4, 2)
+        K[~valido[:, i]] = 0
+        X = X + np.einsum('mij,mj->mi', K, Z[:, i] - X[:, :2])
+        P = np.einsum('mij,mjk->mik', I4 - np.einsum('mij,jk->mik', K, H), P)
+
+        positions[valido[:, i], i] = X[valido[:, i], :2]
+    return positions
+
+def apilar(series, n=None):
+    """Apila una lista de arreglos (N_k, d) en un arreglo (M, N, d) rellenado con NaN."""
+    n = n or max(len(s) for s in series)
+    pila = np.full((len(series), n, series[0].shape[1]), np.nan)
+    for k, s in enumerate(series):
+        pila[k, :len(s)] = s[:n]
+    return pila
+
+def kalman_directorio(directorio, dt=0.1, q=0.1, r=1.0, estacionario=False, patron='*.csv'):
+    """Corre el filtro sobre todos los archivos de una carpeta en una sola llamada.
+
+    Devuelve un diccionario {nombre de archivo: posiciones (N_k, 2)}.
+    """
+    from cargador_datos import cargar_dataset
+
+    rutas = sorted(glob.glob(os.path.join(directorio, patron)))
+    datos = [cargar_dataset(ruta) for ruta in rutas]
+    Z = apilar([np.column_stack((d['uwb_x'], d['uwb_y'])) for d in datos])
+    U = apilar([np.column_stack((d['ax'], d['ay'])) * 9.81 for d in datos])  # m/s^2
+
+    positions = kalman_lote(Z, U, dt, q, r, estacionario)
+    return {os.path.basename(ruta): positions[k, :len(d['uwb_x'])]
+            for k, (ruta, d) in enumerate(zip(rutas, datos))}
+
+# Arriba de este número de muestras los arreglos del suavizador van a disco
+MUESTRAS_EN_MEMORIA = 200_000
+
+def _arreglo(nombre, forma, directorio):
+    if directorio is None:
+        return np.empty(forma)
+    return np.lib.format.open_memmap(os.path.join(directorio, nombre + '.npy'), mode='w+',
+                                     dtype=np.float64, shape=forma)
+
+def suavizado_rts(uwb_x, uwb_y, ax, ay, dt=0.1, q=0.1, r=1.0, bloque=4096, dir_checkpoint='auto'):
+    """Suavizador RTS del filtro de Kalman de posición, devuelve (filtrado, suavizado) (N, 2).
+
+    dir_checkpoint='auto' guarda los estados y covarianzas del paso hacia adelante en una carpeta
+    temporal si hay más de MUESTRAS_EN_MEMORIA muestras, None los deja en memoria y una ruta los
+    guarda ahí (se conservan al terminar). El paso hacia atrás lee y escribe un bloque a la vez.
+    """
+    n = len(ax)
+    F, B, H, Q, R = matrices_modelo(dt, q, r)
+    z = np.column_stack((uwb_x, uwb_y)).astype(float)
+    u = np.column_stack((ax, ay)).astype(float)
+
+    temporal = None
+    if dir_checkpoint == 'auto':
+        dir_checkpoint = temporal = tempfile.mkdtemp() if n > MUESTRAS_EN_MEMORIA else None
+    elif dir_checkpoint is not None:
+        os.makedirs(dir_checkpoint, exist_ok=True)
+
+    x_pred = P_pred = x_filt = P_filt = None
+    try:
+        x_pred = _arreglo('x_pred', (n, 4), dir_checkpoint)
+        P_pred = _arreglo('P_pred', (n, 4, 4), dir_checkpoint)
+        x_filt = _arreglo('x_filt', (n, 4), dir_checkpoint)
+        P_filt = _arreglo('P_filt', (n, 4, 4), dir_checkpoint)
+
+        # Paso hacia adelante (igual que kalman_posicion) guardando predicción y filtrado
+        x_pos = np.zeros(4)
+        P_pos = np.eye(4)
+        I4 = np.eye(4)
+        for i in range(n):
+            x_pos = F @ x_pos + B @ u[i]
+            P_pos = F @ P_pos @ F.T + Q
+            x_pred[i] = x_pos
+            P_pred[i] = P_pos
+
+            S_pos = H @ P_pos @ H.T + R
+            K_pos = np.linalg.solve(S_pos, H @ P_pos).T
+            x_pos = x_pos + K_pos @ (z[i] - H @ x_pos)
+            P_pos = (I4 - K_pos @ H) @ P_pos
+            x_filt[i] = x_pos
+            P_filt[i] = P_pos
+
+        filtrado = np.array(x_filt[:, :2])
+        suavizado = np.empty((n, 2))
+
+        # Paso hacia atrás por bloques, empezando por el final
+        xs = x_filt[n - 1].copy() if n else None
+        if n:
+            suavizado[n - 1] = xs[:2]
+        fin = n - 1
+        while fin > 0:
+            inicio = max(0, fin - bloque)
+            # Ganancias C_k = P_filt[k] F^T P_pred[k+1]^-1 de todo el bloque con un solo solve
+            Pf = np.asarray(P_filt[inicio:fin])
+            Pp = np.asarray(P_pred[inicio + 1:fin + 1])
+            C = np.linalg.solve(Pp, np.einsum('ij,kjl->kil', F, Pf)).transpose(0, 2, 1)
+            xf = np.asarray(x_filt[inicio:fin])
+            xp = np.asarray(x_pred[inicio + 1:fin + 1])
+
+            for k in range(fin - inicio - 1, -1, -1):
+                xs = xf[k] + C[k] @ (xs - xp[k])
+                suavizado[inicio + k] = xs[:2]
+            fin = inicio
+        return filtrado, suavizado
+    finally:
+        # Soltar los memmap antes de borrar la carpeta temporal (aunque alguno no se haya creado)
+        x_pred = P_pred = x_filt = P_filt = None
+        if temporal is not None:
+            shutil.rmtree(temporal, ignore_errors=True)
+
+def suavizar_dataset(ruta, dt=0.1, q=0.1, r=1.0, **kwargs):
+    """Filtra y suaviza un dataset y lo junta con la verdad del Robotat en un DataFrame."""
+    import pandas as pd
+    from cargador_datos import cargar_dataset
+
+    d = cargar_dataset(ruta)
+    filtrado, suavizado = suavizado_rts(d['uwb_x'], d['uwb_y'], d['ax'] * 9.81, d['ay'] * 9.81,
+                                        dt, q, r, **kwargs)
+    return pd.DataFrame({
+        'tiempo_ms': d['tiempo_ms'],
+        'uwb_x': d['uwb_x'], 'uwb_y': d['uwb_y'],
+        'kf_x': filtrado[:, 0], 'kf_y': filtrado[:, 1],
+        'rts_x': suavizado[:, 0], 'rts_y': suavizado[:, 1],
+        'robotat_x': d['robotat_x'], 'robotat_y': d['robotat_y'], 'robotat_yaw': d['robotat_yaw'],
+    })
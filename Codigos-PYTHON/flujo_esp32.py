@@ -0,0 +1,86 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de comunicación (ESP32)
+#
+# Descripcion: Decodificador de líneas para el flujo TCP del ESP32. El firmware manda una línea
+# de texto por muestra con los valores separados por coma, pero recv() puede cortar una línea a
+# la mitad o juntar varias en el mismo paquete. El decodificador guarda los bytes sobrantes entre
+# llamadas a recv(), devuelve todas las líneas completas de un bloque y las convierte a números
+# en un solo paso vectorizado. Lleva la cuenta de las muestras válidas, malformadas y descartadas.
+#
+# * Formato del firmware (Codigos-ARDUINO): x, y, QF, ax, ay, az, gx, gy, gz, mx, my, mz
+# -------------------------------------------------------------------------------------------------
+
+import time
+
+import numpy as np
+
+CAMPOS_ESP32 = 12  # x, y, factor de calidad UWB y los 9 DOF del MPU9250
+
+class DecodificadorLineas:
+    """Convierte bloques de bytes del socket en arreglos (k, campos) de muestras completas."""
+
+    def __init__(self, campos=CAMPOS_ESP32, max_linea=1024):
+        self.campos = campos
+        self.max_linea = max_linea  # Una línea sin '\n' más larga que esto se descarta
+        self.pendiente = b''
+        self.validas = 0
+        self.malformadas = 0
+        self.descartadas = 0
+        self.cerrado = False
+        self.instante = 0.0  # perf_counter al salir del último recv (marca de latencia)
+
+    def alimentar(self, data):
+        """Agrega bytes recibidos y devuelve las muestras completas como arreglo (k, campos)."""
+        bloque = self.pendiente + data
+        corte = bloque.rfind(b'\n')
+        if corte < 0:
+            # Todavía no hay una línea completa
+            self.pendiente = bloque
+            if len(self.pendiente) > self.max_linea:
+                self.descartadas += 1
+                self.pendiente = b''
+            return np.empty((0, self.campos))
+
+        self.pendiente = bloque[corte + 1:]
+        lineas = [l for l in bloque[:corte].split(b'\n') if l.strip()]
+
+        # Solo las líneas con el número correcto de campos pasan a la conversión
+        candidatas = [l for l in lineas if l.count(b',') == self.campos - 1]
+        self.malformadas += len(lineas) - len(candidatas)
+        if not candidatas:
+            return np.empty((0, self.campos))
+
+        try:
+            valores = np.array(b','.join(candidatas).split(b',')).astype(np.float64)
+            valores = valores.reshape(-1, self.campos)
+        except ValueError:
+            # Algún campo no es numérico, se separan las líneas buenas de las malas
+            valores = self._convertir_por_linea(candidatas)
+
+        self.validas += len(valores)
+        return valores
+
+    def _convertir_por_linea(self, lineas):
+        filas = []
+        for linea in lineas:
+            try:
+                filas.append(np.array(linea.split(b',')).astype(np.float64))
+            except ValueError:
+                self.malformadas += 1
+        return np.array(filas).reshape(-1, self.campos)
+
+    def leer(self, tcp_obj, tam=4096):
+        """Hace un recv() del socket y devuelve las muestras completas recibidas."""
+        data = tcp_obj.recv(tam)
+        self.instante = time.perf_counter()
+        if not data:
+            self.cerrado = True
+            return np.empty((0, self.campos))
+        return self.alimentar(data)
+
+    def resumen(self):
+        """Contadores de muestras válidas, malformadas y descartadas."""
+        return {'validas': self.validas, 'malformadas': self.malformadas,
+                'descartadas': self.descartadas}
@@ -0,0 +1,202 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de escritura de datasets
+#
+# Descripcion: Grabador en segundo plano para la V0.3. Antes cada muestra se escribía con
+# csv_writer.writerow dentro del loop de 10 Hz y además se imprimían tres líneas anchas por
+# muestra, las dos cosas agregan jitter al periodo de muestreo. GrabadorDatos tiene la misma
+# interfaz writerow() pero solo pone la fila en una cola, un hilo escritor saca todas las filas
+# pendientes, las escribe en lote y hace fsync periódico. Los archivos rotan por tamaño o por
+# tiempo (nombre_000.csv, nombre_001.csv, ...) y cada uno repite la cabecera. Opcionalmente cada
+# lote también se escribe en binario (float64 por fila) junto al CSV, con un .json que guarda las
+# columnas para leerlo con leer_binario.
+#
+# * cerrar() lanza la excepción si el hilo escritor falló o si no terminó dentro del timeout, así
+#   el código de captura no reporta como guardado un archivo incompleto.
+# * ConsolaLimitada llama a la función de impresión a lo más una cantidad fija de veces por
+#   segundo, guarda la última llamada omitida y vaciar() la imprime al terminar la captura.
+# -------------------------------------------------------------------------------------------------
+
+import csv
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+class GrabadorDatos:
+    """Escritor de filas en un hilo aparte con lotes, fsync periódico y rotación de archivos."""
+
+    def __init__(self, directorio, nombre, cabeceras, binario=False, max_bytes=None,
+                 max_segundos=None, periodo_fsync=1.0, espera_lote=0.2):
+        os.makedirs(directorio, exist_ok=True)
+        self.directorio = directorio
+        self.nombre = nombre
+        self.cabeceras = list(cabeceras)
+        self.binario = binario
+        self.max_bytes = max_bytes
+        self.max_segundos = max_segundos
+        self.periodo_fsync = periodo_fsync
+        self.espera_lote = espera_lote
+
+        self.cola = queue.SimpleQueue()
+        self.filas = 0
+        self.lotes = 0
+        self.archivos = []
+        self.max_pendientes = 0
+        self.error = None
+
+        self.segmento = -1
+        self._abrir_segmento()
+        self.hilo = threading.Thread(target=self._escribir, daemon=True)
+        self.hilo.start()
+
+    # Lado del loop de captura (no bloquea) -------------------------------------------------------
+
+    def writerow(self, fila):
+        """Pone la fila en la cola (misma interfaz que csv.writer)."""
+        if self.error is not None:
+            raise RuntimeError(f'El hilo escritor falló: {self.error}') from self.error
+        self.cola.put(list(fila))
+
+    def writerows(self, filas):
+        for fila in filas:
+            self.writerow(fila)
+
+    def cerrar(self, timeout=10.0):
+        """Escribe lo pendiente, hace fsync y cierra los archivos.
+
+        Lanza RuntimeError si el hilo escritor falló y TimeoutError si no terminó en timeout s
+        (el hilo sigue escribiendo en segundo plano).
+        """
+        self.cola.put(None)
+        self.hilo.join(timeout)
+        if self.hilo.is_alive():
+            raise TimeoutError(f'El hilo escritor no terminó en {timeout} s, '
+                               f'{max(self.cola.qsize() - 1, 0)} filas pendientes')
+        if self.error is not None:
+            raise RuntimeError(f'El hilo escritor falló: {self.error}') from self.error
+
+    def resumen(self):
+        return {'filas': self.filas, 'lotes': self.lotes, 'archivos': list(self.archivos),
+                'max_pendientes': self.max_pendientes}
+
+    # Lado del hilo escritor ----------------------------------------------------------------------
+
+    def _ruta(self, extension):
+        sufijo = '' if self.max_bytes is None and self.max_segundos is None else f'_{self.segmento:03d}'
+        return os.path.join(self.directorio, f'{self.nombre}{sufijo}.{extension}')
+
+    def _abrir_segmento(self):
+        self.segmento += 1
+        self.inicio_segmento = time.monotonic()
+        self.ultimo_fsync = self.inicio_segmento
+
+        ruta_csv = self._ruta('csv')
+        self.archivo_csv = open(ruta_csv, mode='w', newline='')
+        self.csv_writer = csv.writer(self.archivo_csv)
+        self.csv_writer.writerow(self.cabeceras)
+        self.archivos.append(ruta_csv)
+
+        self.archivo_bin = None
+        if self.binario:
+            with open(self._ruta('json'), 'w') as f:
+                json.dump({'columnas': self.cabeceras, 'dtype': 'float64'}, f)
+            self.archivo_bin = open(self._ruta('bin'), 'wb')
+
+    def _cerrar_segmento(self):
+        for archivo in (self.archivo_csv, self.archivo_bin):
+            if archivo is not None:
+                archivo.flush()
+                os.fsync(archivo.fileno())
+                archivo.close()
+
+    def _sincronizar(self):
+        for archivo in (self.archivo_csv, self.archivo_bin):
+            if archivo is not None:
+                archivo.flush()
+                os.fsync(archivo.fileno())
+        self.ultimo_fsync = time.monotonic()
+
+    def _rotar_si_toca(self):
+        tam = self.archivo_csv.tell()
+        if self.archivo_bin is not None:
+            tam += self.archivo_bin.tell()
+        por_tamano = self.max_bytes is not None and tam >= self.max_bytes
+        por_tiempo = self.max_segundos is not None and time.monotonic() - self.inicio_segmento >= self.max_segundos
+        if por_tamano or por_tiempo:
+            self._cerrar_segmento()
+            self._abrir_segmento()
+
+    def _escribir(self):
+        terminar = False
+        try:
+            while not terminar:
+                # Esperar la primera fila del lote y sacar todas las que ya estén en la cola
+                try:
+                    lote = [self.cola.get(timeout=self.espera_lote)]
+                except queue.Empty:
+                    lote = []
+                while True:
+                    try:
+                        lote.append(self.cola.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in lote:
+                    terminar = True
+                    lote = [fila for fila in lote if fila is not None]
+                self.max_pendientes = max(self.max_pendientes, len(lote))
+
+                if lote:
+                    self.csv_writer.writerows(lote)
+                    if self.archivo_bin is not None:
+                        self.archivo_bin.write(np.asarray(lote, dtype=np.float64).tobytes())
+                    self.filas += len(lote)
+                    self.lotes += 1
+
+                if time.monotonic() - self.ultimo_fsync >= self.periodo_fsync:
+                    self._sincronizar()
+                self._rotar_si_toca()
+        except Exception as e:
+            # Se reporta en el siguiente writerow del loop de captura
+            self.error = e
+        finally:
+            self._cerrar_segmento()
+
+def leer_binario(ruta_bin):
+    """Lee un .bin del grabador como (arreglo (N, columnas), nombres de columnas)."""
+    with open(os.path.splitext(ruta_bin)[0] + '.json') as f:
+        meta = json.load(f)
+    datos = np.fromfile(ruta_bin, dtype=meta['dtype'])
+    return datos.reshape(-1, len(meta['columnas'])), meta['columnas']
+
+class ConsolaLimitada:
+    """Llama a la función de impresión a lo más frecuencia veces por segundo."""
+
+    def __init__(self, frecuencia=2.0):
+        self.periodo = 1 / frecuencia
+        self.ultimo = -float('inf')
+        self.omitidas = 0
+        self.pendiente = None  # Última llamada omitida (funcion, args, kwargs)
+
+    def mostrar(self, funcion, *args, **kwargs):
+        ahora = time.monotonic()
+        if ahora - self.ultimo < self.periodo:
+            self.omitidas += 1
+            self.pendiente = (funcion, args, kwargs)
+            return False
+        self.ultimo = ahora
+        self.pendiente = None
+        funcion(*args, **kwargs)
+        return True
+
+    def vaciar(self):
+        """Imprime la última llamada omitida, si la hay (al terminar la captura)."""
+        if self.pendiente is not None:
+            funcion, args, kwargs = self.pendiente
+            self.pendiente = None
+            self.ultimo = time.monotonic()
+            funcion(*args, **kwargs)
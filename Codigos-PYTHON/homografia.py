@@ -0,0 +1,166 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de calibración (homografía)
+#
+# Descripcion: Calibración UWB -> Optitrack en Python, equivalente a Homografia.m. La matriz H se
+# ajusta con DLT normalizado (Hartley) dentro de RANSAC usando los puntos estáticos de
+# Datasets/Calibracion/Calibracion2-con-QF (ESP32_X, ESP32_Y contra Robotat_X_mm, Robotat_Y_mm).
+# La matriz ajustada se guarda en disco por conjunto de calibración, la llave depende de los
+# archivos (ruta, tamaño y fecha de modificación), así que solo se vuelve a ajustar si cambian.
+#
+# * aplicar_homografia recibe un arreglo (N, 2) y proyecta todos los puntos en una sola llamada,
+#   sirve tanto para los códigos de post-procesamiento como para la visualización en tiempo real.
+# * H_MATLAB es la matriz que estaba copiada a mano en la V0.4.
+# -------------------------------------------------------------------------------------------------
+
+import glob
+import hashlib
+import os
+
+import numpy as np
+
+from cargador_datos import DIR_CACHE, cargar_dataset
+
+# Matriz de homografía obtenida en MATLAB (Homografia.m)
+H_MATLAB = np.array([[0.9806, 0.0487, -2036.3],
+                     [-0.0347, 1.0527, -2511.9],
+                     [-1.8418e-06, 1.0074e-05, 1]])
+
+DIR_CALIBRACION = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Datasets',
+                               'Calibracion', 'Calibracion2-con-QF')
+
+def aplicar_homografia(puntos, H):
+    """Proyecta puntos (N, 2) (o un solo punto (2,)) con la homografía H, mismas unidades."""
+    puntos = np.asarray(puntos, dtype=float)
+    p = puntos @ H[:, :2].T + H[:, 2]  # [x, y, 1] @ H^T sin armar la columna de unos
+    return p[..., :2] / p[..., 2:3]
+
+def _normalizacion(puntos):
+    """Matriz T que centra los puntos y deja la distancia media al origen en sqrt(2)."""
+    centro = puntos.mean(axis=0)
+    escala = np.sqrt(2) / np.mean(np.linalg.norm(puntos - centro, axis=1))
+    return np.array([[escala, 0, -escala * centro[0]],
+                     [0, escala, -escala * centro[1]],
+                     [0, 0, 1]])
+
+def _sistema_dlt(src, dst):
+    """Matrices A (..., 2n, 9) del DLT para uno o varios conjuntos de correspondencias."""
+    x, y = src[..., 0], src[..., 1]
+    u, v = dst[..., 0], dst[..., 1]
+    uno, cero = np.ones_like(x), np.zeros_like(x)
+    fila_u = np.stack((x, y, uno, cero, cero, cero, -u * x, -u * y, -u), axis=-1)
+    fila_v = np.stack((cero, cero, cero, x, y, uno, -v * x, -v * y, -v), axis=-1)
+    return np.concatenate((fila_u, fila_v), axis=-2)
+
+def _resolver_dlt(A):
+    """Vector singular de menor valor de A (..., m, 9) como matrices (..., 3, 3)."""
+    _, _, Vt = np.linalg.svd(A)
+    return Vt[..., -1, :].reshape(A.shape[:-2] + (3, 3))
+
+def dlt(src, dst):
+    """Homografía src -> dst con DLT normalizado, con al menos 4 correspondencias (N, 2)."""
+    src = np.asarray(src, dtype=float)
+    dst = np.asarray(dst, dtype=float)
+    T_src, T_dst = _normalizacion(src), _normalizacion(dst)
+    Hn = _resolver_dlt(_sistema_dlt(aplicar_homografia(src, T_src), aplicar_homografia(dst, T_dst)))
+    H = np.linalg.solve(T_dst, Hn @ T_src)
+    return H / H[2, 2]
+
+def error_reproyeccion(H, src, dst):
+    """Distancia euclidiana entre H(src) y dst para cada punto."""
+    return np.linalg.norm(aplicar_homografia(src, H) - dst, axis=-1)
+
+def _indices_distintos(rng, n, k, m=4):
+    """k filas de m índices distintos en [0, n), sin reemplazo dentro de cada fila."""
+    if n < 64:
+        return np.argsort(rng.random((k, n)), axis=1)[:, :m]
+    # Con n grande repetir un índice es raro, se vuelven a sortear solo las filas con repetidos
+    idx = rng.integers(0, n, (k, m))
+    while True:
+        orden = np.sort(idx, axis=1)
+        repetidas = (orden[:, 1:] == orden[:, :-1]).any(axis=1)
+        if not repetidas.any():
+            return idx
+        idx[repetidas] = rng.integers(0, n, (int(repetidas.sum()), m))
+
+def ransac(src, dst, umbral=50.0, iteraciones=2000, semilla=0, bloque=250):
+    """Ajuste robusto con RANSAC, devuelve (H, máscara de inliers).
+
+    Las hipótesis de 4 puntos se resuelven por bloques con un SVD por lotes y se evalúan contra
+    todos los puntos a la vez. umbral está en las unidades de dst (mm).
+    """
+    src = np.asarray(src, dtype=float)
+    dst = np.asarray(dst, dtype=float)
+    n = len(src)
+    if n < 4:
+        raise ValueError('Se necesitan al menos 4 correspondencias para la homografía.')
+
+    T_src, T_dst = _normalizacion(src), _normalizacion(dst)
+    src_n, dst_n = aplicar_homografia(src, T_src), aplicar_homografia(dst, T_dst)
+    rng = np.random.default_rng(semilla)
+
+    mejor_inliers = np.zeros(n, dtype=bool)
+    mejor_cuenta = -1
+    for inicio in range(0, iteraciones, bloque):
+        k = min(bloque, iteraciones - inicio)
+        # k muestras de 4 índices distintos
+        idx = _indices_distintos(rng, n, k)
+        Hn = _resolver_dlt(_sistema_dlt(src_n[idx], dst_n[idx]))  # (k, 3, 3)
+        H = np.linalg.solve(T_dst, Hn @ T_src)
+
+        # Error de todas las hipótesis contra todos los puntos: (k, n)
+        p = np.einsum('kij,nj->kni', H[:, :, :2], src) + H[:, None, :, 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            error = np.linalg.norm(p[..., :2] / p[..., 2:3] - dst, axis=-1)
+        inliers = error < umbral
+        cuentas = inliers.sum(axis=1)
+        mejor = np.argmax(cuentas)
+        if cuentas[mejor] > mejor_cuenta:
+            mejor_cuenta = cuentas[mejor]
+            mejor_inliers = inliers[mejor]
+
+    if mejor_cuenta < 4:
+        raise ValueError('RANSAC no encontró un modelo con suficientes inliers.')
+    return dlt(src[mejor_inliers], dst[mejor_inliers]), mejor_inliers
+
+def puntos_calibracion(directorio=DIR_CALIBRACION, patron='*.csv'):
+    """Junta los puntos UWB (N, 2) y Optitrack (N, 2) en mm de todos los archivos estáticos."""
+    rutas = sorted(glob.glob(os.path.join(directorio, patron)))
+    if not rutas:
+        raise FileNotFoundError(f'No hay archivos de calibración en {directorio}')
+    datos = [cargar_dataset(ruta) for ruta in rutas]
+    src = np.concatenate([np.column_stack((d['uwb_x'], d['uwb_y'])) for d in datos])
+    dst = np.concatenate([np.column_stack((d['robotat_x'], d['robotat_y'])) for d in datos])
+    validos = np.isfinite(src).all(axis=1) & np.isfinite(dst).all(axis=1)
+    return src[validos], dst[validos], rutas
+
+def _llave_calibracion(rutas, umbral, iteraciones):
+    texto = '|'.join(f'{os.path.abspath(r)}:{os.path.getsize(r)}:{os.stat(r).st_mtime_ns}' for r in rutas)
+    texto += f'|{umbral}|{iteraciones}'
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+def cargar_homografia(directorio=DIR_CALIBRACION, umbral=50.0, iteraciones=2000,
+                      dir_cache=DIR_CACHE, patron='*.csv'):
+    """Homografía del conjunto de calibración, se ajusta solo si no está en el cache."""
+    rutas = sorted(glob.glob(os.path.join(directorio, patron)))
+    if not rutas:
+        raise FileNotFoundError(f'No hay archivos de calibración en {directorio}')
+    archivo = os.path.join(dir_cache, f'homografia_{_llave_calibracion(rutas, umbral, iteraciones)}.npy')
+    if os.path.exists(archivo):
+        return np.load(archivo)
+
+    src, dst, _ = puntos_calibracion(directorio, patron)
+    H, _ = ransac(src, dst, umbral, iteraciones)
+    os.makedirs(dir_cache, exist_ok=True)
+    np.save(archivo, H)
+    return H
+
+if __name__ == "__main__":
+    src, dst, rutas = puntos_calibracion()
+    H, inliers = ransac(src, dst)
+    print(f'{len(rutas)} archivos, {len(src)} puntos, {inliers.sum()} inliers')
+    print('Homografía calculada:')
+    print(H)
+    print(f'Error medio (RANSAC): {error_reproyeccion(H, src, dst).mean():.1f} mm, '
+          f'(MATLAB): {error_reproyeccion(H_MATLAB, src, dst).mean():.1f} mm')
@@ -0,0 +1,125 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de adquisición (hilo de ingesta)
+#
+# Descripcion: Separa la recepción de datos del loop de dibujo de la V0.4. Antes el loop de 60 FPS
+# llamaba a recv bloqueante y en un error de socket dormía 1 s, las dos cosas congelaban la
+# ventana. Aquí un hilo en segundo plano recibe y filtra las muestras y publica la última pose en
+# un snapshot doble (dos arreglos que se alternan) sin candados: el hilo escribe siempre en el
+# arreglo que no se está publicando y luego cambia el índice, el loop de dibujo solo copia el
+# arreglo publicado y nunca espera a la red.
+#
+# * Las posiciones nuevas para la estela se pasan por una deque (append / popleft son atómicos).
+# * El hilo mide la tasa de muestras recibidas, el retraso (staleness) se calcula al leer.
+# -------------------------------------------------------------------------------------------------
+
+import collections
+import socket
+import threading
+import time
+
+import numpy as np
+
+class SnapshotDoble:
+    """Último valor publicado por un solo escritor, leído sin candados por otros hilos."""
+
+    def __init__(self, campos):
+        self.buffers = (np.zeros(campos), np.zeros(campos))
+        self.version = 0  # El buffer publicado es version % 2
+        self.instante = 0.0  # perf_counter de la última publicación
+
+    def publicar(self, valores, instante=None):
+        """Escribe en el buffer libre y lo publica (solo lo llama el hilo escritor)."""
+        siguiente = self.version + 1
+        self.buffers[siguiente % 2][:] = valores
+        self.instante = time.perf_counter() if instante is None else instante
+        self.version = siguiente  # Publicación: una sola asignación
+
+    def leer(self):
+        """Copia del último valor publicado y su versión.
+
+        Si el escritor publicó mientras se copiaba, el buffer pudo empezar a reescribirse, en ese
+        caso se vuelve a copiar (pasa muy pocas veces porque copiar es mucho más rápido que
+        recibir una muestra).
+        """
+        while True:
+            version = self.version
+            valores = self.buffers[version % 2].copy()
+            if self.version == version:
+                return valores, version
+
+    def retraso(self):
+        """Segundos desde la última publicación (infinito si no se ha publicado nada)."""
+        return time.perf_counter() - self.instante if self.version else float('inf')
+
+class HiloIngesta(threading.Thread):
+    """Hilo que llama a leer() continuamente y publica el estado que devuelve.
+
+    leer() debe devolver (estado, posiciones): estado es la secuencia de valores a publicar y
+    posiciones la lista de posiciones nuevas (una por muestra), vacía si no llegó nada. Si la
+    fuente se cerró leer() debe lanzar OSError (por ejemplo ConnectionError) en lugar de
+    devolver vacío, así el hilo espera espera_error en lugar de girar sin pausa. Con
+    latencia (latencia.py) el último valor del estado debe ser el perf_counter del recv y se
+    registra la etapa de publicación.
+    """
+
+    def __init__(self, leer, campos, espera_error=1.0, ventana_tasa=1.0, latencia=None):
+        super().__init__(daemon=True)
+        self.leer = leer
+        self.latencia = latencia
+        self.snapshot = SnapshotDoble(campos)
+        self.posiciones = collections.deque(maxlen=100000)
+        self.espera_error = espera_error
+        self.ventana_tasa = ventana_tasa
+        self.detener = threading.Event()
+        self.muestras = 0
+        self.errores = 0
+        self.tasa = 0.0  # Muestras por segundo en la última ventana
+
+    def run(self):
+        inicio_ventana, muestras_ventana = time.perf_counter(), 0
+        while not self.detener.is_set():
+            try:
+                estado, posiciones = self.leer()
+            except socket.timeout:
+                posiciones = []
+            except OSError as e:
+                # El error se espera aquí, la ventana sigue dibujando
+                self.errores += 1
+                print(f"Error de socket: {e}")
+                self.detener.wait(self.espera_error)
+                continue
+            else:
+                if posiciones:
+                    self.snapshot.publicar(estado)
+                    self.posiciones.extend(posiciones)
+                    if self.latencia is not None:
+                        self.latencia.registrar('publicacion', estado[-1], len(posiciones))
+
+            self.muestras += len(posiciones)
+            muestras_ventana += len(posiciones)
+            ahora = time.perf_counter()
+            if ahora - inicio_ventana >= self.ventana_tasa:
+                self.tasa = muestras_ventana / (ahora - inicio_ventana)
+                inicio_ventana, muestras_ventana = ahora, 0
+
+    def pose(self):
+        """Última pose publicada."""
+        return self.snapshot.leer()[0]
+
+    def posiciones_nuevas(self):
+        """Saca todas las posiciones que llegaron desde la última llamada."""
+        nuevas = []
+        while True:
+            try:
+                nuevas.append(self.posiciones.popleft())
+            except IndexError:
+                return nuevas
+
+    def retraso(self):
+        return self.snapshot.retraso()
+
+    def parar(self, timeout=2.0):
+        self.detener.set()
+        self.join(timeout)
@@ -0,0 +1,168 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de instrumentación (latencia)
+#
+# Descripcion: Latencia de punta a punta de la adquisición en vivo (V0.3 - V0.5). Cada lote de
+# muestras se marca al salir del recv del socket (el primer instante que se puede medir en la
+# computadora) y cada etapa registra cuánto tiempo pasó desde esa marca: parseo, homografía,
+# filtro, publicación, escritura y dibujo. Las latencias se guardan en histogramas de tamaño fijo
+# con bins logarítmicos (1 us - 100 s), así la memoria no crece con la duración de la sesión, y
+# se reportan p50 / p95 / p99 y el máximo.
+#
+# * Se activa con la variable de entorno UWB_LATENCIA: 'consola' imprime el resumen cada
+#   periodo, cualquier otro valor es la ruta de un archivo donde se agregan los resúmenes en
+#   formato JSON (una línea por volcado). Sin la variable se usa LatenciaNula, cuyos métodos no
+#   hacen nada, el costo es una llamada vacía por lote.
+# * Con la variable 'recepcion' se registra el intervalo entre recv consecutivos (jitter).
+# -------------------------------------------------------------------------------------------------
+
+import atexit
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+ETAPAS = ('recepcion', 'parseo', 'homografia', 'filtro', 'robotat', 'publicacion', 'escritura', 'dibujo')
+
+class HistogramaLatencia:
+    """Histograma logarítmico de latencias (s) con memoria fija."""
+
+    def __init__(self, minimo=1e-6, maximo=100.0, bins_por_decada=20):
+        self.log_minimo = math.log10(minimo)
+        self.bins_por_decada = bins_por_decada
+        self.num_bins = int(round((math.log10(maximo) - self.log_minimo) * bins_por_decada))
+        # Bin 0: menores que el mínimo, último bin: mayores que el máximo
+        self.conteos = np.zeros(self.num_bins + 2, dtype=np.int64)
+        self.bordes = 10 ** (self.log_minimo + np.arange(self.num_bins + 1) / bins_por_decada)
+        self.total = 0
+        self.suma = 0.0
+        self.max = 0.0
+
+    def registrar(self, latencia, n=1):
+        if latencia <= 0:
+            k = 0
+        else:
+            k = int((math.log10(latencia) - self.log_minimo) * self.bins_por_decada) + 1
+            k = min(max(k, 0), self.num_bins + 1)
+        self.conteos[k] += n
+        self.total += n
+        self.suma += latencia * n
+        if latencia > self.max:
+            self.max = latencia
+
+    def percentiles(self, ps=(50, 95, 99)):
+        """Percentiles como el borde superior del bin donde caen (error < 12 % con 20 bins)."""
+        if self.total == 0:
+            return [float('nan')] * len(ps)
+        acumulado = np.cumsum(self.conteos)
+        resultado = []
+        for p in ps:
+            k = int(np.searchsorted(acumulado, p / 100 * self.total))
+            resultado.append(min(self.bordes[min(k, self.num_bins)], self.max))
+        return resultado
+
+    def limpiar(self):
+        self.conteos[:] = 0
+        self.total = 0
+        self.suma = 0.0
+        self.max = 0.0
+
+class Latencia:
+    """Histogramas por etapa con volcado periódico en un hilo aparte."""
+
+    activa = True
+
+    def __init__(self, destino='consola', periodo=5.0, etapas=ETAPAS):
+        self.destino = destino
+        self.periodo = periodo
+        self.histogramas = {etapa: HistogramaLatencia() for etapa in etapas}
+        self.ultima_recepcion = None
+        self.detener = threading.Event()
+        self.hilo = threading.Thread(target=self._volcar_periodico, daemon=True)
+        self.hilo.start()
+        atexit.register(self.volcar)
+
+    def ahora(self):
+        return time.perf_counter()
+
+    def registrar(self, etapa, t_recepcion, n=1):
+        """Registra para n muestras el tiempo desde t_recepcion hasta ahora en la etapa."""
+        if n:
+            self.histogramas[etapa].registrar(time.perf_counter() - t_recepcion, n)
+
+    def recepcion(self, t_recepcion):
+        """Intervalo entre recepciones consecutivas."""
+        if self.ultima_recepcion is not None:
+            self.histogramas['recepcion'].registrar(t_recepcion - self.ultima_recepcion)
+        self.ultima_recepcion = t_recepcion
+
+    def resumen(self):
+        """{etapa: {muestras, p50_ms, p95_ms, p99_ms, max_ms, media_ms}} de las etapas con datos."""
+        resumen = {}
+        for etapa, h in self.histogramas.items():
+            if h.total:
+                p50, p95, p99 = h.percentiles()
+                resumen[etapa] = {'muestras': int(h.total), 'p50_ms': p50 * 1000, 'p95_ms': p95 * 1000,
+                                  'p99_ms': p99 * 1000, 'max_ms': h.max * 1000,
+                                  'media_ms': h.suma / h.total * 1000}
+        return resumen
+
+    def texto(self):
+        lineas = [f"{'etapa':>12} | {'muestras':>9} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | {'max ms':>8}"]
+        for etapa, r in self.resumen().items():
+            lineas.append(f"{etapa:>12} | {r['muestras']:>9} | {r['p50_ms']:8.2f} | {r['p95_ms']:8.2f} | "
+                          f"{r['p99_ms']:8.2f} | {r['max_ms']:8.2f}")
+        return '\n'.join(lineas)
+
+    def volcar(self):
+        resumen = self.resumen()
+        if not resumen:
+            return
+        if self.destino == 'consola':
+            print(self.texto())
+        else:
+            with open(self.destino, 'a') as archivo:
+                archivo.write(json.dumps({'tiempo': time.time(), 'etapas': resumen}) + '\n')
+
+    def _volcar_periodico(self):
+        while not self.detener.wait(self.periodo):
+            self.volcar()
+
+    def cerrar(self):
+        self.detener.set()
+        atexit.unregister(self.volcar)
+        self.volcar()
+
+class LatenciaNula:
+    """Misma interfaz que Latencia sin hacer nada (instrumentación desactivada)."""
+
+    activa = False
+
+    def ahora(self):
+        return 0.0
+
+    def registrar(self, etapa, t_recepcion, n=1):
+        pass
+
+    def recepcion(self, t_recepcion):
+        pass
+
+    def resumen(self):
+        return {}
+
+    def volcar(self):
+        pass
+
+    def cerrar(self):
+        pass
+
+def crear_latencia(variable='UWB_LATENCIA', periodo=5.0):
+    """Latencia según la variable de entorno, LatenciaNula si no está definida."""
+    destino = os.environ.get(variable)
+    if not destino:
+        return LatenciaNula()
+    return Latencia(destino, periodo)
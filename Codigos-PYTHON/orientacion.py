@@ -0,0 +1,121 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: módulo de procesamiento (orientación)
+#
+# Descripcion: Cálculo de orientación del MPU9250 para recorridos completos. Reemplaza los loops
+# muestra por muestra de las versiones 0.0, 0.1 y 0.2: el tilt del acelerómetro, la integración
+# del giroscopio (incluyendo el yaw inicial del Robotat de la V0.2) y el yaw del magnetómetro se
+# calculan con operaciones sobre arreglos completos de NumPy, y luego se aplica el filtro
+# complementario con Butterworth + filtfilt.
+#
+# * Los resultados coinciden con los loops originales a tolerancia de punto flotante.
+# -------------------------------------------------------------------------------------------------
+
+import numpy as np
+from scipy.signal import butter, filtfilt, sosfilt, sosfilt_zi
+
+def disenar_filtros(dt=0.1, fc=0.1):
+    """Devuelve (b, a, d, c): Butterworth de orden 2 pasa bajas (b, a) y pasa altas (d, c)."""
+    Fs = 1 / dt  # Frecuencia de muestreo
+    b, a = butter(2, fc / (Fs / 2), 'low')  # Filtro pasa bajas
+    d, c = butter(2, fc / (Fs / 2), 'high')  # Filtro pasa altas
+    return b, a, d, c
+
+def disenar_filtros_sos(dt=0.1, fc=0.1):
+    """Los mismos Butterworth de orden 2 en secciones de segundo orden: (sos_lp, sos_hp)."""
+    Fs = 1 / dt
+    return butter(2, fc / (Fs / 2), 'low', output='sos'), butter(2, fc / (Fs / 2), 'high', output='sos')
+
+def estado_inicial(sos, x0):
+    """Estado zi de sosfilt en régimen estacionario para una entrada constante x0 (escalar o (k,)).
+
+    El pasa bajas arranca con la salida en x0 y el pasa altas en 0, sin el transitorio de arrancar
+    desde cero. Con x0 de k columnas el estado tiene forma (secciones, 2, k) para filtrar en axis=0.
+    """
+    zi = sosfilt_zi(sos)
+    x0 = np.asarray(x0, dtype=float)
+    return zi * x0 if x0.ndim == 0 else zi[:, :, np.newaxis] * x0
+
+def filtrar_causal(sos, x):
+    """sosfilt en axis=0 arrancando en el estado estacionario de la primera muestra."""
+    return sosfilt(sos, x, axis=0, zi=estado_inicial(sos, x[0]))[0]
+
+def angulos_acelerometro(ax, ay, az):
+    """Tilt del acelerómetro en grados como arreglo (N, 3), la columna z queda en 0."""
+    ax = np.asarray(ax, dtype=float)
+    ay = np.asarray(ay, dtype=float)
+    az = np.asarray(az, dtype=float)
+
+    accel_ang = np.zeros((len(ax), 3))
+    accel_ang[:, 0] = np.rad2deg(np.arctan2(ay, np.sqrt(ax**2 + az**2)))
+    accel_ang[:, 1] = np.rad2deg(np.arctan2(-ax, np.sqrt(ay**2 + az**2)))
+    return accel_ang
+
+def angulos_giroscopio(gx, gy, gz, dt=0.1, yaw_inicial=None):
+    """Integración acumulada del giroscopio como arreglo (N, 3).
+
+    dt puede ser un escalar o un arreglo (N,) con el periodo real de cada muestra (alineacion.py).
+    Si se da yaw_inicial (ry del Robotat en la V0.2), el acumulador de z se reemplaza por ese
+    valor después de la primera muestra, igual que en el loop original.
+    """
+    gyro_ang = np.zeros((len(gx), 3))
+    gyro_ang[:, 0] = np.cumsum(np.asarray(gx, dtype=float) * dt)
+    gyro_ang[:, 1] = np.cumsum(np.asarray(gy, dtype=float) * dt)
+
+    paso_z = np.asarray(gz, dtype=float) * dt
+    if yaw_inicial is None or len(paso_z) == 0:
+        gyro_ang[:, 2] = np.cumsum(paso_z)
+    else:
+        # La primera muestra se guarda antes de sembrar el yaw, el resto acumula desde yaw_inicial
+        gyro_ang[0, 2] = paso_z[0]
+        semilla = np.concatenate(([yaw_inicial], paso_z[1:]))
+        gyro_ang[1:, 2] = np.cumsum(semilla)[1:]
+    return gyro_ang
+
+def angulos_magnetometro(mx, my):
+    """Yaw del magnetómetro en grados como arreglo (N, 3), solo la columna z es distinta de 0."""
+    mag_ang = np.zeros((len(mx), 3))
+    mag_ang[:, 2] = np.rad2deg(np.arctan2(np.asarray(my, dtype=float), np.asarray(mx, dtype=float)))
+    return mag_ang
+
+def filtro_complementario(accel_ang, gyro_ang, mag_ang=None, dt=0.1, fc=0.1, peso_yaw=0.98,
+                          causal=False):
+    """Filtro complementario con filtfilt. Sin magnetómetro el yaw es solo el giroscopio.
+
+    Con causal=True se usa el mismo diseño en secciones de segundo orden filtrado solo hacia
+    adelante (sosfilt), es la referencia fuera de línea de FiltroComplementarioContinuo.
+    """
+    filt_ang = np.zeros_like(gyro_ang)
+    if causal:
+        sos_lp, sos_hp = disenar_filtros_sos(dt, fc)
+        pasa_bajas = lambda x: filtrar_causal(sos_lp, x)
+        pasa_altas = lambda x: filtrar_causal(sos_hp, x)
+    else:
+        b, a, d, c = disenar_filtros(dt, fc)
+        pasa_bajas = lambda x: filtfilt(b, a, x, axis=0)
+        pasa_altas = lambda x: filtfilt(d, c, x, axis=0)
+
+    # Pasa bajas al acelerómetro y pasa altas al giroscopio integrado (x, y a la vez)
+    filt_ang[:, :2] = pasa_altas(gyro_ang[:, :2]) + pasa_bajas(accel_ang[:, :2])
+
+    if mag_ang is None:
+        filt_ang[:, 2] = gyro_ang[:, 2]  # Usar solo giroscopio para yaw
+    else:
+        mag_angle_z_lpf = pasa_bajas(mag_ang[:, 2])
+        filt_ang[:, 2] = gyro_ang[:, 2] * peso_yaw + mag_angle_z_lpf * (1 - peso_yaw)
+    return filt_ang
+
+def calcular_orientacion(ax, ay, az, gx, gy, gz, mx=None, my=None, dt=0.1, fc=0.1,
+                         peso_yaw=0.98, yaw_inicial=None, causal=False):
+    """Calcula (filt_ang, accel_ang, gyro_ang, mag_ang) para un recorrido completo.
+
+    Si no se pasan mx, my el yaw filtrado es el del giroscopio y mag_ang es None. Con dt por
+    muestra la integración usa el periodo real y los Butterworth se diseñan con la mediana.
+    """
+    accel_ang = angulos_acelerometro(ax, ay, az)
+    gyro_ang = angulos_giroscopio(gx, gy, gz, dt, yaw_inicial)
+    mag_ang = None if mx is None or my is None else angulos_magnetometro(mx, my)
+    filt_ang = filtro_complementario(accel_ang, gyro_ang, mag_ang, float(np.median(dt)), fc, peso_yaw,
+                                     causal)
+    return filt_ang, accel_ang, gyro_ang, mag_ang
@@ -0,0 +1,123 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: post-procesamiento por lotes
+#
+# Descripcion: Modo por lotes para correr los filtros de las versiones 0.0 - 0.2 sobre todos los
+# datasets sin animación. Busca todos los .csv dentro de Datasets/Calibracion, Datasets/Dinamico y
+# Datasets/Old-Datasets, aplica el filtro complementario (V0.0 / V0.2) y el filtro de Kalman de
+# posición (V0.1) a cada archivo en un pool de procesos y guarda una tabla consolidada.
+#
+# * Un archivo que falle no detiene el lote, el error queda registrado en su fila de la tabla.
+# * Uso: python procesamiento_lote.py --workers 4 --salida resultados_lote.csv
+# -------------------------------------------------------------------------------------------------
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from orientacion import calcular_orientacion
+from filtro_kalman import kalman_posicion
+from cargador_datos import cargar_dataset
+
+# Carpetas de datasets que se procesan por defecto
+CARPETAS_DATASETS = ['Calibracion', 'Dinamico', 'Old-Datasets']
+RAIZ_DATASETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Datasets')
+
+def buscar_datasets(raiz=RAIZ_DATASETS, carpetas=CARPETAS_DATASETS):
+    """Lista ordenada de todos los .csv dentro de las carpetas de datasets."""
+    archivos = []
+    for carpeta in carpetas:
+        for directorio, _, nombres in os.walk(os.path.join(raiz, carpeta)):
+            archivos += [os.path.join(directorio, n) for n in nombres if n.lower().endswith('.csv')]
+    return sorted(archivos)
+
+def procesar_archivo(ruta, dt=0.1, fc=0.1, raiz=RAIZ_DATASETS, usar_cache=True):
+    """Corre el filtro complementario y el de Kalman sobre un archivo y devuelve su fila de resultados."""
+    fila = {'archivo': os.path.relpath(ruta, raiz), 'estado': 'ok', 'error': ''}
+    inicio = time.perf_counter()
+    try:
+        data = cargar_dataset(ruta, usar_cache=usar_cache)
+        n = len(data['uwb_x'])
+        if n < 10:
+            raise ValueError(f'Muy pocas muestras ({n}) para filtfilt')
+
+        ax, ay, az = data['ax'], data['ay'], data['az']
+        gx, gy, gz = data['gx'], data['gy'], data['gz']
+
+        # Filtro complementario extendido (V0.0 y V0.2, yaw inicial del Robotat si existe)
+        yaw_inicial = None if np.isnan(data['robotat_yaw'][0]) else data['robotat_yaw'][0]
+        filt_ang, _, _, _ = calcular_orientacion(ax, ay, az, gx, gy, gz, data['mx'], data['my'],
+                                                 dt=dt, fc=fc, yaw_inicial=yaw_inicial)
+
+        # Filtro de Kalman de posición (V0.1), con aceleración en m/s^2
+        positions = kalman_posicion(data['uwb_x'], data['uwb_y'], ax * 9.81, ay * 9.81, dt=dt)
+        residuo = positions - np.column_stack((data['uwb_x'], data['uwb_y']))
+
+        fila.update({
+            'muestras': n,
+            'roll_medio': filt_ang[:, 0].mean(),
+            'pitch_medio': filt_ang[:, 1].mean(),
+            'yaw_final': filt_ang[-1, 2],
+            'kf_x_final': positions[-1, 0],
+            'kf_y_final': positions[-1, 1],
+            'kf_residuo_rms': np.sqrt(np.mean(residuo**2)),
+        })
+    except Exception as e:
+        # Aislar el error del archivo para que el resto del lote continúe
+        fila['estado'] = 'error'
+        fila['error'] = f'{type(e).__name__}: {e}'
+
+    fila['tiempo_s'] = time.perf_counter() - inicio
+    return fila
+
+def procesar_lote(archivos, workers=None, dt=0.1, fc=0.1, raiz=RAIZ_DATASETS, usar_cache=True):
+    """Procesa los archivos en un pool de procesos y devuelve la tabla consolidada."""
+    workers = workers or min(4, os.cpu_count() or 1)
+    total = len(archivos)
+    filas = []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futuros = {pool.submit(procesar_archivo, ruta, dt, fc, raiz, usar_cache): ruta for ruta in archivos}
+        for k, futuro in enumerate(as_completed(futuros), start=1):
+            ruta = futuros[futuro]
+            try:
+                fila = futuro.result()
+            except Exception as e:
+                # Falla del proceso trabajador (por ejemplo, memoria), no del archivo
+                fila = {'archivo': os.path.relpath(ruta, raiz), 'estado': 'error',
+                        'error': f'{type(e).__name__}: {e}'}
+            filas.append(fila)
+            print(f"[{k}/{total}] {fila['archivo']} -> {fila['estado']}")
+
+    columnas = ['archivo', 'estado', 'muestras', 'roll_medio', 'pitch_medio', 'yaw_final',
+                'kf_x_final', 'kf_y_final', 'kf_residuo_rms', 'tiempo_s', 'error']
+    return pd.DataFrame(filas, columns=columnas).sort_values('archivo', ignore_index=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Procesamiento por lotes de los datasets UWB + IMU.')
+    parser.add_argument('--raiz', default=RAIZ_DATASETS, help='Carpeta Datasets')
+    parser.add_argument('--carpetas', nargs='+', default=CARPETAS_DATASETS,
+                        help='Subcarpetas de Datasets a procesar')
+    parser.add_argument('--workers', type=int, default=None, help='Número de procesos (máximo)')
+    parser.add_argument('--salida', default='resultados_lote.csv', help='Tabla de resultados')
+    parser.add_argument('--dt', type=float, default=0.1, help='Periodo de muestreo (s)')
+    parser.add_argument('--fc', type=float, default=0.1, help='Frecuencia de corte (Hz)')
+    parser.add_argument('--sin-cache', action='store_true', help='No usar el cache binario')
+    args = parser.parse_args()
+
+    archivos = buscar_datasets(args.raiz, args.carpetas)
+    print(f'Se encontraron {len(archivos)} archivos .csv')
+
+    inicio = time.perf_counter()
+    resultados = procesar_lote(archivos, args.workers, args.dt, args.fc, args.raiz,
+                               not args.sin_cache)
+    resultados.to_csv(args.salida, index=False)
+
+    errores = (resultados['estado'] == 'error').sum()
+    print(f'{len(resultados) - errores} archivos procesados, {errores} con error, '
+          f'{time.perf_counter() - inicio:.1f} s. Resultados en {args.salida}')
@@ -0,0 +1,255 @@
+# -------------------------------------------------------------------------------------------------
+# Autor: Alfredo Melendez
+#
+# Tipo de código: servidores de prueba (asyncio)
+#
+# Descripcion: Servidores TCP locales que reemplazan al ESP32 (192.168.50.225:80) y al Robotat
+# (192.168.50.200:1883) para probar la adquisición y la visualización sin el laboratorio. El ESP32
+# simulado reproduce cualquier dataset .csv con el formato de líneas del firmware
+# (x,y,QF,ax,ay,az,gx,gy,gz,mx,my,mz) en tiempo real o N veces más rápido, el Robotat simulado
+# responde el protocolo JSON {"dst", "cmd", "pld"} con la pose de las columnas Robotat_* del mismo
+# dataset en el instante actual de la reproducción. Los dos comparten el mismo reloj, que arranca
+# con la primera conexión al ESP32.
+#
+# * Perturbaciones (deterministas con la semilla): jitter en los envíos, varias líneas o
+#   respuestas juntas en un solo paquete, paquetes partidos y desconexiones cada N envíos.
+# * Uso: python servidores_simulados.py ruta.csv --velocidad 2 --jitter 5 --coalescer 0.2
+#   y en los códigos cambiar la IP del ESP32 / Robotat por 127.0.0.1 y los puertos.
+# -------------------------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+
+import numpy as np
+
+from cargador_datos import DT_NOMINAL_MS, cargar_dataset
+from cuaterniones import eul2q
+
+# Columnas que manda cada firmware: V0.3 / V0.4 (12 valores) y el monitor de imufusion (V0.5)
+FORMATOS = {
+    'v03': ['uwb_x', 'uwb_y', 'uwb_qf', 'ax', 'ay', 'az', 'gx', 'gy', 'gz', 'mx', 'my', 'mz'],
+    'imu': ['gx', 'gy', 'gz', 'ax', 'ay', 'az'],
+}
+
+class Perturbaciones:
+    """Fallas de red que se inyectan en los envíos de un servidor simulado."""
+
+    def __init__(self, jitter_ms=0.0, coalescer=0.0, max_coalescer=5, partir=0.0,
+                 desconectar_cada=None, semilla=0):
+        self.jitter_ms = jitter_ms  # Desviación estándar del retraso extra de cada envío
+        self.coalescer = coalescer  # Probabilidad de juntar varios envíos en un paquete
+        self.max_coalescer = max_coalescer
+        self.partir = partir  # Probabilidad de partir un paquete en dos
+        self.desconectar_cada = desconectar_cada  # Cerrar la conexión después de N envíos
+        self.rng = np.random.default_rng(semilla)
+
+    def retraso(self):
+        return abs(self.rng.normal(0, self.jitter_ms)) / 1000 if self.jitter_ms else 0.0
+
+    def cuantos(self):
+        """Cuántos envíos se juntan en el siguiente paquete."""
+        if self.coalescer and self.rng.random() < self.coalescer:
+            return int(self.rng.integers(2, self.max_coalescer + 1))
+        return 1
+
+    async def escribir(self, writer, datos):
+        """Escribe datos, a veces en dos pedazos separados por un retraso corto."""
+        if self.partir and len(datos) > 1 and self.rng.random() < self.partir:
+            corte = int(self.rng.integers(1, len(datos)))
+            writer.write(datos[:corte])
+            await writer.drain()
+            await asyncio.sleep(0.002)
+            datos = datos[corte:]
+        writer.write(datos)
+        await writer.drain()
+
+class Reloj:
+    """Reloj de la reproducción compartido por los dos servidores."""
+
+    def __init__(self, tiempo_ms, velocidad=1.0, repetir=False):
+        # Tiempos relativos a la primera muestra y sin retrocesos
+        tiempo = np.maximum.accumulate(np.nan_to_num(np.asarray(tiempo_ms, dtype=float)))
+        self.tiempo = (tiempo - tiempo[0]) / 1000
+        self.duracion = self.tiempo[-1] + DT_NOMINAL_MS / 1000
+        self.velocidad = velocidad
+        self.repetir = repetir
+        self.inicio = None
+
+    def arrancar(self):
+        if self.inicio is None:
+            self.inicio = asyncio.get_running_loop().time()
+
+    def transcurrido(self):
+        """Segundos del dataset transcurridos (None si no ha arrancado)."""
+        if self.inicio is None:
+            return None
+        return (asyncio.get_running_loop().time() - self.inicio) * self.velocidad
+
+    def indice(self):
+        """Índice de la muestra actual, -1 si terminó el dataset."""
+        t = self.transcurrido() or 0.0
+        vuelta, t = divmod(t, self.duracion)
+        if vuelta and not self.repetir:
+            return -1
+        return int(np.searchsorted(self.tiempo, t, side='right')) - 1
+
+    def instante(self, vuelta, k):
+        """Tiempo del loop en que toca mandar la muestra k de la vuelta dada."""
+        return self.inicio + (vuelta * self.duracion + self.tiempo[k]) / self.velocidad
+
+class ServidorESP32:
+    """Reproduce las líneas del dataset como lo hace el firmware del ESP32."""
+
+    def __init__(self, datos, reloj, formato='v03', perturbaciones=None):
+        columnas = np.column_stack([np.nan_to_num(np.asarray(datos[c], dtype=float)) for c in FORMATOS[formato]])
+        self.lineas = [(','.join(f'{v:.6g}' for v in fila) + '\r\n').encode('utf-8') for fila in columnas]
+        self.reloj = reloj
+        self.perturbaciones = perturbaciones or Perturbaciones()
+        self.enviadas = 0
+        self.siguiente = 0  # Índice absoluto (vueltas * n + k) de la siguiente línea a mandar
+        self.conexiones = 0
+
+    async def atender(self, reader, writer):
+        self.conexiones += 1
+        self.reloj.arrancar()
+        p = self.perturbaciones
+        n = len(self.lineas)
+        loop = asyncio.get_running_loop()
+
+        # Un ESP32 real no guarda lo que pasó mientras no había conexión: se sigue desde la
+        # muestra actual del reloj, sin repetir las que ya se mandaron
+        vuelta = int((self.reloj.transcurrido() or 0.0) // self.reloj.duracion)
+        vuelta, k = divmod(max(vuelta * n + max(self.reloj.indice(), 0), self.siguiente), n)
+        enviadas_conexion = 0
+        try:
+            while self.reloj.repetir or vuelta == 0:
+                fin = min(k + p.cuantos(), n)
+                espera = self.reloj.instante(vuelta, fin - 1) + p.retraso() - loop.time()
+                if espera > 0:
+                    await asyncio.sleep(espera)
+                await p.escribir(writer, b''.join(self.lineas[k:fin]))
+                self.enviadas += fin - k
+                enviadas_conexion += fin - k
+
+                k = fin
+                self.siguiente = vuelta * n + k
+                if k == n:
+                    k, vuelta = 0, vuelta + 1
+                if p.desconectar_cada and enviadas_conexion >= p.desconectar_cada:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        writer.close()
+
+class ServidorRobotat:
+    """Responde las solicitudes de pose con las columnas Robotat_* del dataset."""
+
+    def __init__(self, datos, reloj, perturbaciones=None):
+        posicion = np.column_stack([datos[c] for c in ('robotat_x', 'robotat_y', 'robotat_z')]) / 1000
+        angulos = np.column_stack([datos[c] for c in ('robotat_roll', 'robotat_pitch', 'robotat_yaw')])
+        poses = np.hstack((posicion, eul2q(angulos)))
+        # Muestras sin Optitrack: marcador en el origen y sin rotación
+        sin_pose = ~np.isfinite(poses).all(axis=1)
+        poses[sin_pose] = [0, 0, 0, 1, 0, 0, 0]
+        self.poses = poses
+        self.reloj = reloj
+        self.perturbaciones = perturbaciones or Perturbaciones()
+        self.respuestas = 0
+        self.conexiones = 0
+
+    def pose(self, ids):
+        """Respuesta para la lista de ids: la pose actual repetida por cada marcador pedido."""
+        k = self.reloj.indice()
+        pose = self.poses[k if k >= 0 else -1]
+        return json.dumps(np.tile(pose, len(ids)).tolist())
+
+    async def atender(self, reader, writer):
+        self.conexiones += 1
+        p = self.perturbaciones
+        decoder = json.JSONDecoder()
+        buffer = ''
+        respondidas = 0
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data or data.strip() == b'EXIT':
+                    break
+                buffer += data.decode('utf-8')
+
+                # Todas las solicitudes completas que llegaron se responden en un solo paquete
+                respuestas = []
+                while True:
+                    texto = buffer.lstrip()
+                    try:
+                        solicitud, fin = decoder.raw_decode(texto)
+                    except json.JSONDecodeError:
+                        buffer = texto
+                        break
+                    buffer = texto[fin:]
+                    respuestas.append(self.pose(solicitud.get('pld', [])))
+                if not respuestas:
+                    continue
+
+                # Con coalescer se espera un poco para juntar más solicitudes en la misma respuesta
+                if p.cuantos() > 1:
+                    await asyncio.sleep(0.005)
+                await asyncio.sleep(p.retraso())
+                await p.escribir(writer, ''.join(respuestas).encode('utf-8'))
+                self.respuestas += len(respuestas)
+                respondidas += len(respuestas)
+                if p.desconectar_cada and respondidas >= p.desconectar_cada:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        writer.close()
+
+async def iniciar_servidores(ruta, host='127.0.0.1', puerto_esp32=0, puerto_robotat=0,
+                             velocidad=1.0, repetir=False, formato='v03', perturbaciones_esp32=None,
+                             perturbaciones_robotat=None):
+    """Levanta los dos servidores, devuelve (esp32, robotat, servidores asyncio, puertos)."""
+    datos = cargar_dataset(ruta)
+    reloj = Reloj(datos['tiempo_ms'], velocidad, repetir)
+    esp32 = ServidorESP32(datos, reloj, formato, perturbaciones_esp32)
+    robotat = ServidorRobotat(datos, reloj, perturbaciones_robotat)
+    srv_esp32 = await asyncio.start_server(esp32.atender, host, puerto_esp32)
+    srv_robotat = await asyncio.start_server(robotat.atender, host, puerto_robotat)
+    puertos = (srv_esp32.sockets[0].getsockname()[1], srv_robotat.sockets[0].getsockname()[1])
+    return esp32, robotat, (srv_esp32, srv_robotat), puertos
+
+async def _main(args):
+    perturbaciones = [Perturbaciones(args.jitter, args.coalescer, partir=args.partir,
+                                     desconectar_cada=args.desconectar_cada, semilla=args.semilla + k)
+                      for k in range(2)]
+    esp32, robotat, servidores, puertos = await iniciar_servidores(
+        args.archivo, args.host, args.puerto_esp32, args.puerto_robotat, args.velocidad,
+        args.repetir, args.formato, *perturbaciones)
+    print(f'ESP32 simulado en {args.host}:{puertos[0]}, Robotat simulado en {args.host}:{puertos[1]} '
+          f'({len(esp32.lineas)} muestras a {args.velocidad:g}x)')
+    try:
+        while True:
+            await asyncio.sleep(5)
+            print(f'ESP32: {esp32.enviadas} líneas, {esp32.conexiones} conexiones | '
+                  f'Robotat: {robotat.respuestas} respuestas, {robotat.conexiones} conexiones')
+    finally:
+        for servidor in servidores:
+            servidor.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Servidores locales del ESP32 y del Robotat.')
+    parser.add_argument('archivo', help='Dataset .csv a reproducir')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto-esp32', type=int, default=8080)
+    parser.add_argument('--puerto-robotat', type=int, default=1883)
+    parser.add_argument('--velocidad', type=float, default=1.0, help='1 = tiempo real, N = N veces más rápido')
+    parser.add_argument('--repetir', action='store_true', help='Volver a empezar al terminar el dataset')
+    parser.add_argument('--formato', choices=sorted(FORMATOS), default='v03', help='Líneas del firmware')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Jitter de los envíos (ms)')
+    parser.add_argument('--coalescer', type=float, default=0.0, help='Probabilidad de juntar envíos')
+    parser.add_argument('--partir', type=float, default=0.0, help='Probabilidad de partir un paquete')
+    parser.add_argument('--desconectar-cada', type=int, default=None, help='Cerrar la conexión cada N envíos')
+    parser.add_argument('--semilla', type=int, default=0)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass